@@ -6,7 +6,10 @@ import os
 from wiki import create_app
 
 directory = os.getcwd()
-app = create_app(directory)
+# spawned conversion worker processes import this module again as
+# __mp_main__, they only convert and must not start a wiki of their own
+if __name__ != '__mp_main__':
+    app = create_app(directory)
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', debug=True)
\ No newline at end of file
@@ -0,0 +1,37 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from wiki.web.user import UserManager  # run with python -m unittest Tests/account_test/user_manager_test.py
+
+
+class TestSharedUserManager(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'users.json'), 'w') as f:
+            json.dump({'name': {'active': True, 'roles': [], 'password': '1234',
+                                'authentication_method': 'cleartext'}}, f)
+        self.manager = UserManager(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_readers_get_copies(self):
+        self.manager.read()['name']['active'] = False
+        self.assertTrue(self.manager.get_user('name').is_active())
+
+    def test_changes_on_disk_are_seen(self):
+        self.assertIsNone(self.manager.get_user('other'))
+        UserManager(self.directory).add_user('other', 'pw', 'other@example.com', authentication_method='cleartext')
+        self.assertEqual(self.manager.get_user('other').get('email'), 'other@example.com')
+        self.assertTrue(self.manager.delete_user('other'))
+        self.assertIsNone(UserManager(self.directory).get_user('other'))
+
+    def test_writes_leave_no_other_files(self):
+        self.manager.get_user('name').set('authenticated', True)
+        self.assertEqual(os.listdir(self.directory), ['users.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
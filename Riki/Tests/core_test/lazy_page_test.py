@@ -0,0 +1,55 @@
+import os
+import shutil
+import tempfile
+import unittest
+from wiki.core import Page, Processor, Wiki, read_meta, render_cache  # run with python -m unittest Tests/core_test/lazy_page_test.py
+
+CONTENT = 'title: Lazy\ntags: one, two\nauthor:  Someone \n\nThe *body*\n\nmore body'
+
+
+class TestLazyPage(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'lazy.md')
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(CONTENT)
+        render_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        render_cache.clear()
+
+    def test_read_meta_matches_processor(self):
+        _, _, meta = Processor(CONTENT).process()
+        self.assertEqual(read_meta(self.path), meta)
+
+    def test_lazy_page_only_reads_header(self):
+        page = Page(self.path, 'lazy', lazy=True)
+        self.assertEqual(page.title, 'Lazy')
+        self.assertEqual(page.tags, 'one, two')
+        self.assertIsNone(page._content)
+        self.assertIsNone(page._html)
+
+    def test_lazy_body_does_not_render(self):
+        page = Page(self.path, 'lazy', lazy=True)
+        self.assertEqual(page.body, 'The *body*\n\nmore body')
+        self.assertIsNone(page._html)
+        self.assertEqual(render_cache.misses, 0)
+
+    def test_lazy_html_renders_on_access(self):
+        page = Page(self.path, 'lazy', lazy=True)
+        self.assertIn('<em>body</em>', page.html)
+        self.assertEqual(page.html, Page(self.path, 'lazy').html)
+
+    def test_listings_do_no_markdown_work(self):
+        wiki = Wiki(self.directory)
+        render_cache.clear()
+        self.assertEqual([page.title for page in wiki.index()], ['Lazy'])
+        self.assertEqual(sorted(wiki.get_tags()), ['one', 'two'])
+        self.assertEqual(len(wiki.index_by_tag('one')), 1)
+        self.assertEqual(render_cache.misses, 0)
+        wiki.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
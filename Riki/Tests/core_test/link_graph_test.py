@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+from wiki.core import Wiki, wikilinks  # run with python -m unittest Tests/core_test/link_graph_test.py
+
+
+class TestLinkGraph(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('home.md', 'title: Home\n\nSee [[Guide]] and [[sub/faq|the FAQ]] and [[Missing Page]].')
+        self.write('guide.md', 'title: Guide\n\nBack [[home]], not `[[code]]`.')
+        self.write('sub/faq.md', 'title: FAQ\n\nNo links.')
+        self.write('lonely.md', 'title: Lonely\n\n[[lonely]] links only to itself.')
+        self.wiki = Wiki(self.directory)
+
+    def tearDown(self):
+        self.wiki.close()
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def test_wikilinks(self):
+        self.assertEqual(wikilinks('[[A Page]] [[bb|B]] `[[c]]` [[A Page|again]]'), ['a_page', 'bb'])
+
+    def test_links_of_a_page(self):
+        self.assertEqual(self.wiki.links('home'), {
+            'url': 'home',
+            'outgoing': ['guide', 'missing_page', 'sub/faq'],
+            'backlinks': ['guide'],
+            'broken': ['missing_page'],
+        })
+        self.assertEqual([page.title for page in self.wiki.backlinks('sub/faq')], ['Home'])
+
+    def test_orphans_and_broken_links(self):
+        graph = self.wiki.link_graph
+        self.assertEqual(graph.orphans(), ['lonely'])
+        self.assertEqual(graph.broken(), [('home', 'missing_page')])
+
+    def test_graph_follows_changes(self):
+        page = self.wiki.get_bare('missing_page')
+        page.title = 'Not Missing'
+        page.tags = ''
+        page.body = 'Now [[lonely]] has a friend.'
+        page.save(update=False)
+        self.assertEqual(self.wiki.link_graph.broken(), [])
+        self.assertEqual(self.wiki.link_graph.orphans(), [])
+        self.wiki.move('guide', 'manual')
+        self.assertEqual(self.wiki.link_graph.broken(), [('home', 'guide')])
+        self.assertEqual(self.wiki.links('home')['backlinks'], ['manual'])
+        self.wiki.delete('manual')
+        self.assertEqual(self.wiki.links('home')['backlinks'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+from wiki.core import Wiki  # run with python -m unittest Tests/core_test/page_index_test.py
+
+
+class TestPageIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('b.md', 'title: Beta\ntags: one, two\n\nbeta body')
+        self.write('sub/a.md', 'title: alpha\ntags: one\n\nalpha body')
+        self.wiki = Wiki(self.directory)
+
+    def tearDown(self):
+        self.wiki.close()
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def urls(self):
+        return [page.url for page in self.wiki.index()]
+
+    def test_new_index_is_built_from_disk(self):
+        self.assertEqual(self.urls(), ['sub/a', 'b'])
+        self.assertEqual(self.wiki.index()[1].tags, 'one, two')
+
+    def test_index_is_persisted(self):
+        self.assertTrue(os.path.exists(os.path.join(self.directory, Wiki.INDEX_FILE)))
+        wiki = Wiki(self.directory)
+        self.assertFalse(wiki.page_index.created)
+        self.assertEqual([page.title for page in wiki.index()], ['alpha', 'Beta'])
+        wiki.close()
+
+    def test_saved_page_is_indexed(self):
+        page = self.wiki.get_bare('c')
+        page.title = 'Gamma'
+        page.tags = ''
+        page.body = 'gamma body'
+        page.save()
+        self.assertEqual(self.urls(), ['sub/a', 'b', 'c'])
+
+    def test_moved_and_deleted_pages_are_updated(self):
+        self.wiki.move('b', 'sub/b')
+        self.assertEqual(self.urls(), ['sub/a', 'sub/b'])
+        self.wiki.delete('sub/a')
+        self.assertEqual(self.urls(), ['sub/b'])
+
+    def test_reconcile_picks_up_external_changes(self):
+        self.write('b.md', 'title: Zeta\n\nchanged outside of the wiki')
+        os.remove(os.path.join(self.directory, 'sub', 'a.md'))
+        self.write('d.md', 'title: Delta\n\nnew')
+        self.wiki.reconcile()
+        self.assertEqual([page.title for page in self.wiki.index()], ['Delta', 'Zeta'])
+
+    def test_search_uses_index_and_pages(self):
+        self.assertEqual([page.url for page in self.wiki.search('two')], ['b'])
+        self.assertEqual([page.url for page in self.wiki.search('ALPHA BODY')], ['sub/a'])
+
+    def test_tag_index(self):
+        self.write('c.md', 'title: Gamma\ntags: ones\n\ngamma body')
+        self.wiki.reconcile()
+        self.assertEqual(self.wiki.tag_counts(), {'one': 2, 'two': 1, 'ones': 1})
+        self.assertEqual([page.url for page in self.wiki.index_by_tag('one')], ['sub/a', 'b'])
+        self.assertEqual(self.wiki.page_index.tag_urls('ones'), {'c'})
+        self.assertEqual(self.wiki.tags_by_url()['b'], ('one', 'two'))
+        self.assertEqual(set(self.wiki.tags_by_url()), {'sub/a', 'b', 'c'})
+
+    def test_tag_index_follows_changes(self):
+        page = self.wiki.get('b')
+        page.tags = 'two, three'
+        page.save()
+        self.wiki.delete('sub/a')
+        self.assertEqual(self.wiki.tag_counts(), {'two': 1, 'three': 1})
+
+    def test_tag_index_is_built_for_old_databases(self):
+        self.wiki.page_index.db.execute('DROP TABLE tags')
+        self.wiki.close()
+        self.wiki = Wiki(self.directory)
+        self.assertEqual(self.wiki.tag_counts(), {'one': 2, 'two': 1})
+
+    def test_digest_is_filled_for_old_databases(self):
+        self.wiki.page_index.db.execute('ALTER TABLE pages DROP COLUMN digest')
+        self.wiki.close()
+        self.wiki = Wiki(self.directory)
+        self.assertTrue(self.wiki.page_index.upgraded)
+        self.assertEqual(len(self.wiki.page_index.get('b').digest), 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
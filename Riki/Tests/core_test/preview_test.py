@@ -0,0 +1,71 @@
+import re
+import unittest
+from flask import Flask
+from wiki.core import Processor
+from wiki.preview import block_cache, join_blocks, render_blocks, split_blocks  # run with python -m unittest Tests/core_test/preview_test.py
+
+DOCUMENT = '''title: Preview
+
+> quoted
+
+> still quoted
+
+A [[Wiki Link]] and a [reference][1].
+
+* one
+
+* two
+
+    more of two
+
+```
+code
+
+with a blank line
+```
+
+| a | b |
+|---|---|
+| 1 | 2 |
+
+[1]: http://example.com
+'''
+
+
+class TestPreview(unittest.TestCase):
+    def setUp(self):
+        app = Flask(__name__)
+        app.add_url_rule('/<path:url>/', 'wiki.display')
+        self.context = app.test_request_context()
+        self.context.push()
+        block_cache.clear()
+
+    def tearDown(self):
+        self.context.pop()
+
+    def test_split_blocks(self):
+        blocks, references = split_blocks(DOCUMENT.split('\n\n', 1)[1])
+        self.assertEqual([block.split('\n')[0] for block in blocks],
+                         ['> quoted', 'A [[Wiki Link]] and a [reference][1].', '* one', '```', '| a | b |',
+                          '[1]: http://example.com'])
+        self.assertEqual(references, ['[1]: http://example.com'])
+
+    def test_raw_html_is_not_split(self):
+        self.assertIsNone(split_blocks('<div>\n\ntext\n\n</div>'))
+
+    def test_blocks_render_like_the_document(self):
+        def normalize(html):
+            return re.sub(r'\n+', '\n', html)
+        html = join_blocks(render_blocks(DOCUMENT))
+        self.assertEqual(normalize(html), normalize(Processor(DOCUMENT).process()[0]))
+        self.assertIn('<a href="http://example.com">reference</a>', html)
+
+    def test_only_changed_blocks_are_rendered(self):
+        before = render_blocks(DOCUMENT)
+        after = render_blocks(DOCUMENT.replace('more of two', 'more of the second'))
+        self.assertEqual(block_cache.misses, len(before) + 1)
+        self.assertEqual([key for key, _ in before if key not in dict(after)], [before[3][0]])
+
+
+if __name__ == '__main__':
+    unittest.main()
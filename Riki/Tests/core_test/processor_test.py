@@ -0,0 +1,53 @@
+import threading
+import unittest
+from wiki.core import Processor, markdown_engine, wikilink  # run with python -m unittest Tests/core_test/processor_test.py
+
+
+class TestProcessor(unittest.TestCase):
+    def test_engine_is_reused_within_a_thread(self):
+        self.assertIs(Processor('a: b\n\nc').md, Processor('d: e\n\nf').md)
+
+    def test_engine_is_not_shared_between_threads(self):
+        engines = []
+        thread = threading.Thread(target=lambda: engines.append(markdown_engine()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(engines[0], markdown_engine())
+
+    def test_state_does_not_leak_between_renders(self):
+        Processor('title: First\ntags: one\n\ntext').process()
+        html, body, meta = Processor('title: Second\n\nplain text').process()
+        self.assertEqual(list(meta.keys()), ['title'])
+        self.assertEqual(meta['title'], 'Second')
+        self.assertEqual(html, '<p>plain text</p>')
+        self.assertEqual(body, 'plain text')
+
+
+class TestWikilink(unittest.TestCase):
+    TEXT = '<p>[[Some Page]] and [[Some Page|again]] and [[other]]</p><code>[[not a link]]</code>'
+    EXPECTED = ("<p><a href='/some_page/'>Some Page</a> and <a href='/some_page/'>again</a> "
+                "and <a href='/other/'>other</a></p><code>[[not a link]]</code>")
+
+    def test_links_are_formatted_once_per_target(self):
+        calls = []
+
+        def url_formatter(endpoint, url):
+            calls.append(url)
+            return '/%s/' % url
+
+        self.assertEqual(wikilink(self.TEXT, url_formatter), self.EXPECTED)
+        self.assertEqual(calls, ['some_page', 'other'])
+
+    def test_batch_formatter(self):
+        calls = []
+
+        def batch_formatter(urls):
+            calls.append(urls)
+            return {url: '/%s/' % url for url in urls}
+
+        self.assertEqual(wikilink(self.TEXT, batch_formatter=batch_formatter), self.EXPECTED)
+        self.assertEqual(calls, [['other', 'some_page']])
+
+
+if __name__ == '__main__':
+    unittest.main()
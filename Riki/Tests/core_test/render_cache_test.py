@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+from wiki.core import Page, RenderCache, render_cache  # run with python -m unittest Tests/core_test/render_cache_test.py
+
+
+class TestRenderCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'cached.md')
+        self.write('title: Cached\ntags: test\n\nSome *markdown* text\n')
+        render_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        render_cache.clear()
+
+    def write(self, content):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def test_second_page_is_served_from_cache(self):
+        first = Page(self.path, 'cached')
+        second = Page(self.path, 'cached')
+        self.assertEqual(render_cache.misses, 1)
+        self.assertEqual(render_cache.hits, 1)
+        self.assertEqual(first.html, second.html)
+        self.assertEqual(second.title, 'Cached')
+
+    def test_changed_file_is_rendered_again(self):
+        Page(self.path, 'cached')
+        self.write('title: Changed\n\nOther text that is longer\n')
+        page = Page(self.path, 'cached')
+        self.assertEqual(render_cache.misses, 2)
+        self.assertEqual(page.title, 'Changed')
+
+    def test_touched_file_falls_back_to_content_hash(self):
+        Page(self.path, 'cached')
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        Page(self.path, 'cached')
+        self.assertEqual(render_cache.hits, 1)
+
+    def test_cached_meta_is_not_shared(self):
+        page = Page(self.path, 'cached')
+        page.title = 'Edited in memory'
+        self.assertEqual(Page(self.path, 'cached').title, 'Cached')
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = RenderCache(maxsize=2)
+        result = ('<p>x</p>', 'x', {})
+        cache.set('a', 'a', result)
+        cache.set('b', 'b', result)
+        cache.get('a', 'a')
+        cache.set('c', 'c', result)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b', 'b'))
+        self.assertIsNotNone(cache.get('a', 'a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
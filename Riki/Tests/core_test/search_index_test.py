@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+import unittest
+from wiki.core import Wiki
+from wiki.search import parse_query  # run with python -m unittest Tests/core_test/search_index_test.py
+
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('fox.md', 'title: The Fox\ntags: animals\n\nThe quick brown fox jumps over the lazy dog.')
+        self.write('cat.md', 'title: Cat\ntags: animals, pets\n\nA lazy Cat sleeps. Brown is not its colour.')
+        self.write('code.md', 'title: Code\ntags: python\n\nUse re.compile() to build regexes.')
+        self.wiki = Wiki(self.directory)
+
+    def tearDown(self):
+        self.wiki.close()
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def search(self, term, **kwargs):
+        return [page.url for page in self.wiki.search(term, **kwargs)]
+
+    def test_parse_query(self):
+        clauses = parse_query('"Quick Brown" fox re*')
+        self.assertEqual([c.words for c in clauses], [['Quick', 'Brown'], ['fox'], ['re']])
+        self.assertEqual([c.prefix for c in clauses], [False, False, True])
+
+    def test_terms_must_all_match(self):
+        self.assertEqual(self.search('lazy'), ['cat', 'fox'])
+        self.assertEqual(self.search('lazy brown fox'), ['fox'])
+
+    def test_phrase(self):
+        self.assertEqual(self.search('"lazy dog"'), ['fox'])
+        self.assertEqual(self.search('"brown fox"'), ['fox'])
+        self.assertEqual(self.search('"dog lazy"'), [])
+
+    def test_prefix(self):
+        self.assertEqual(self.search('rege*'), ['code'])
+
+    def test_title_and_tags_are_searched(self):
+        self.assertEqual(self.search('pets'), ['cat'])
+        self.assertEqual(self.search('lazy', attrs=['title']), [])
+
+    def test_case_sensitive(self):
+        self.assertEqual(self.search('Cat', ignore_case=False), ['cat'])
+        self.assertEqual(self.search('cat', ignore_case=False), [])
+
+    def test_regex_slow_path(self):
+        self.assertEqual(self.search(r're\.comp', regex=True), ['code'])
+
+    def test_index_follows_save_move_and_delete(self):
+        page = self.wiki.get('code')
+        page.body = 'Nothing about regular expressions anymore.'
+        page.save()
+        self.assertEqual(self.search('regexes'), [])
+        self.assertEqual(self.search('anymore'), ['code'])
+        self.wiki.move('code', 'snippets')
+        self.assertEqual(self.search('anymore'), ['snippets'])
+        self.wiki.delete('snippets')
+        self.assertEqual(self.search('anymore'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
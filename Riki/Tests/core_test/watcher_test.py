@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import unittest
+from wiki.core import Wiki
+from wiki.events import ChangeFeed, CREATED, DELETED, MODIFIED, MOVED
+from wiki.watcher import InotifyWatcher, PollingWatcher, _libc  # run with python -m unittest Tests/core_test/watcher_test.py
+
+
+class WatcherTests(object):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('a.md', 'title: A\n\na')
+        self.write('sub/b.md', 'title: B\n\nb')
+        self.watcher = self.create_watcher()
+        self.watcher.setup()
+
+    def tearDown(self):
+        self.watcher.teardown()
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def events(self):
+        return sorted((e.kind, e.url, e.dest_url) for e in self.watcher.check())
+
+    def test_created(self):
+        self.write('new/c.md', 'title: C\n\nc')
+        self.write('d.md', 'title: D\n\nd')
+        self.assertEqual(self.events(), [(CREATED, 'd', None), (CREATED, 'new/c', None)])
+
+    def test_deleted(self):
+        os.remove(os.path.join(self.directory, 'a.md'))
+        shutil.rmtree(os.path.join(self.directory, 'sub'))
+        self.assertEqual(self.events(), [(DELETED, 'a', None), (DELETED, 'sub/b', None)])
+
+    def test_moved(self):
+        os.rename(os.path.join(self.directory, 'a.md'),
+                  os.path.join(self.directory, 'sub', 'c.md'))
+        self.assertEqual(self.events(), [(MOVED, 'a', 'sub/c')])
+
+    def test_atomic_save_is_a_modification(self):
+        self.write('a.tmp', 'title: A\n\nchanged')
+        os.replace(os.path.join(self.directory, 'a.tmp'),
+                   os.path.join(self.directory, 'a.md'))
+        self.assertEqual(self.events(), [(MODIFIED, 'a', None)])
+
+    def test_other_files_are_ignored(self):
+        self.write('notes.txt', 'not a page')
+        self.assertEqual(self.events(), [])
+
+
+class TestPollingWatcher(WatcherTests, unittest.TestCase):
+    def create_watcher(self):
+        return PollingWatcher(self.directory, None, interval=0.01, full_every=0)
+
+    def test_in_place_modification_needs_full_compare(self):
+        with open(os.path.join(self.directory, 'sub', 'b.md'), 'a') as f:
+            f.write('more')
+        events = self.watcher.compare([self.watcher.root], recursive=True)
+        self.assertEqual([(e.kind, e.url) for e in events], [(MODIFIED, 'sub/b')])
+
+
+@unittest.skipIf(_libc() is None, 'inotify is not available')
+class TestInotifyWatcher(WatcherTests, unittest.TestCase):
+    def create_watcher(self):
+        return InotifyWatcher(self.directory, None, interval=0.5)
+
+    def test_in_place_modification(self):
+        with open(os.path.join(self.directory, 'sub', 'b.md'), 'a') as f:
+            f.write('more')
+        self.assertEqual(self.events(), [(MODIFIED, 'sub/b', None)])
+
+
+class TestWikiApply(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'a.md'), 'w') as f:
+            f.write('title: A\ntags: x\n\nalpha')
+        self.published = []
+        self.changes = ChangeFeed()
+        self.changes.subscribe(lambda *events: self.published.extend(events))
+        self.wiki = Wiki(self.directory, changes=self.changes)
+        self.watcher = PollingWatcher(self.directory, self.wiki.apply, interval=0.01)
+        self.watcher.setup()
+
+    def tearDown(self):
+        self.wiki.close()
+        shutil.rmtree(self.directory)
+
+    def test_external_changes_reach_the_indexes(self):
+        os.rename(os.path.join(self.directory, 'a.md'), os.path.join(self.directory, 'b.md'))
+        self.wiki.apply(*self.watcher.check())
+        self.assertEqual([page.url for page in self.wiki.index()], ['b'])
+        self.assertEqual([page.url for page in self.wiki.search('alpha')], ['b'])
+        self.assertEqual([page.url for page in self.wiki.index_by_tag('x')], ['b'])
+        self.assertEqual([e.kind for e in self.published], [MOVED])
+
+    def test_wiki_changes_are_published(self):
+        page = self.wiki.get('a')
+        page.save()
+        self.wiki.delete('a')
+        self.assertEqual([e.kind for e in self.published], [MODIFIED, DELETED])
+
+
+if __name__ == '__main__':
+    unittest.main()
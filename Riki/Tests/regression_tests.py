@@ -17,6 +17,8 @@ def run_tests():
     regression_test.addTests(unittest.TestLoader().discover('Tests/account_test', pattern='*_test.py'))
     regression_test.addTests(unittest.TestLoader().discover('Tests/file_storage_test', pattern='*_test.py'))
     regression_test.addTests(unittest.TestLoader().discover('Tests/wiki_download_test', pattern='*_test.py'))
+    regression_test.addTests(unittest.TestLoader().discover('Tests/core_test', pattern='*_test.py'))
+    regression_test.addTests(unittest.TestLoader().discover('Tests/web_test', pattern='*_test.py'))
     run_regression = unittest.TextTestRunner()
     run_regression.run(regression_test)
 
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from wiki.events import MODIFIED
+from wiki.web import create_app  # run with python -m unittest Tests/web_test/app_wiki_test.py
+
+CONFIG = '''
+SECRET_KEY = 'test'
+USER_DIR = {users!r}
+PRIVATE = False
+'''
+
+
+class TestAppWiki(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'config.py'), 'w') as f:
+            f.write(CONFIG.format(users=self.directory))
+        with open(os.path.join(self.directory, 'home.md'), 'w') as f:
+            f.write('title: Home\n\nhome')
+        self.app = create_app(self.directory)
+        self.wikis = self.app.extensions['wiki']
+
+    def tearDown(self):
+        self.wikis.close()
+        shutil.rmtree(self.directory)
+
+    def test_one_wiki_per_thread(self):
+        wiki = self.wikis.get()
+        self.assertIs(self.wikis.get(), wiki)
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.wikis.get()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], wiki)
+        self.assertEqual([page.url for page in other[0].index()], ['home'])
+
+    def test_wikis_of_ended_threads_are_closed(self):
+        wiki = self.wikis.get()
+        for _ in range(20):
+            thread = threading.Thread(target=self.wikis.get)
+            thread.start()
+            thread.join()
+        # every new thread closes the wikis of the threads before it
+        self.assertEqual(len(self.wikis._wikis), 2)
+        self.assertIs(self.wikis.get(), wiki)
+
+    def test_requests_share_the_wiki(self):
+        client = self.app.test_client()
+        wiki = self.wikis.get()
+        client.get('/home/')
+        client.get('/index/')
+        self.assertIs(self.wikis.get(), wiki)
+        self.assertEqual(len(self.wikis._wikis), 1)
+
+    def test_changes_of_other_processes_are_published(self):
+        published = []
+        self.app.extensions['changes'].subscribe(lambda *events: published.extend(events))
+        wiki = self.wikis.get()
+        wiki.apply()  # nothing changed, nothing recorded
+        wiki.page_index.db.execute(
+            "INSERT INTO changes (pid, kind, url, path) VALUES (?, ?, ?, ?)",
+            (os.getpid() + 1, MODIFIED, 'home', wiki.path('home')))
+        wiki.page_index.db.commit()
+        self.app.test_client().get('/home/')
+        self.assertEqual([(e.kind, e.url) for e in published], [(MODIFIED, 'home')])
+        self.wikis.sync()
+        self.assertEqual(len(published), 1)
+
+    def test_in_memory_wiki_moves_to_disk(self):
+        content = os.path.join(self.directory, 'content')
+        wikis = type(self.wikis)(content)
+        self.assertEqual(wikis.get().page_index.path, ':memory:')
+        os.mkdir(content)
+        self.assertEqual(wikis.get().page_index.path, os.path.join(content, '.index.sqlite'))
+        wikis.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
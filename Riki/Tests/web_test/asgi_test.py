@@ -0,0 +1,103 @@
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from wiki.web.asgi import environ
+from wiki.web.asgi import create_asgi_app  # run with python -m unittest Tests/web_test/asgi_test.py
+
+CONFIG = '''
+SECRET_KEY = 'test'
+USER_DIR = {users!r}
+PRIVATE = False
+WTF_CSRF_ENABLED = False
+ASGI_THREADS = 4
+CONVERSION_WAIT = 30
+'''
+
+
+class TestAsgi(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'config.py'), 'w') as f:
+            f.write(CONFIG.format(users=self.directory))
+        with open(os.path.join(self.directory, 'home.md'), 'w') as f:
+            f.write('title: Home\n\nHello.')
+        self.app = create_asgi_app(self.directory)
+
+    def tearDown(self):
+        self.app.close()
+        shutil.rmtree(self.directory)
+
+    def request(self, method, path, body=b'', headers=(), query=b''):
+        sent = []
+        messages = [{'type': 'http.request', 'body': body[:3], 'more_body': True},
+                    {'type': 'http.request', 'body': body[3:], 'more_body': False}]
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query,
+                 'headers': [(name.encode(), value.encode()) for name, value in headers],
+                 'client': ('127.0.0.1', 5000), 'server': ('testserver', 80)}
+        asyncio.run(self.app(scope, receive, send))
+        start = sent[0]
+        self.assertEqual(start['type'], 'http.response.start')
+        self.assertFalse(sent[-1].get('more_body', False))
+        return start['status'], dict(start['headers']), b''.join(m.get('body', b'') for m in sent[1:])
+
+    def test_page_view(self):
+        status, headers, body = self.request('GET', '/home/')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers[b'content-type'], b'text/html; charset=utf-8')
+        self.assertIn(b'Hello.', body)
+
+    def test_streamed_listing(self):
+        status, _, body = self.request('GET', '/index/')
+        self.assertEqual(status, 200)
+        self.assertIn(b'Home', body)
+
+    def test_repeated_headers(self):
+        scope = {'type': 'http', 'method': 'GET', 'path': '/', 'headers': [
+            (b'cookie', b'a=1'), (b'cookie', b'b=2'), (b'accept', b'text/html'), (b'accept', b'*/*')]}
+        result = environ(scope, None)
+        self.assertEqual(result['HTTP_COOKIE'], 'a=1; b=2')
+        self.assertEqual(result['HTTP_ACCEPT'], 'text/html,*/*')
+
+    def test_request_body_and_query(self):
+        status, _, body = self.request(
+            'POST', '/convert/home/', body=b'{"fileType": "txt"}',
+            headers=[('Content-Type', 'application/json')])
+        self.assertEqual(status, 200)
+        self.assertIn(b'"conversionStatus":"Success"', body.replace(b' ', b''))
+        status, headers, body = self.request('GET', '/download/home/', query=b'fileType=md')
+        self.assertEqual(status, 200)
+        self.assertIn(b'attachment', headers[b'content-disposition'])
+        self.assertIn(b'Hello.', body)
+
+    def test_conversions_in_worker_processes(self):
+        self.app.app.config['CONVERSION_PROCESSES'] = 1
+        status, _, body = self.request('GET', '/download/home/', query=b'fileType=txt')
+        self.assertEqual(status, 200)
+        self.assertIn(b'Hello.', body)
+        self.assertIn('conversion_pool', self.app.app.extensions)
+
+    def test_lifespan(self):
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(self.app({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from werkzeug.datastructures import Accept
+from wiki.web import create_app  # run with python -m unittest Tests/web_test/compression_test.py
+from wiki.web.compression import choose_encoding
+
+CONFIG = '''
+SECRET_KEY = 'test'
+USER_DIR = {users!r}
+PRIVATE = False
+WTF_CSRF_ENABLED = False
+RESPONSE_CACHE = True
+'''
+
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+class TestChooseEncoding(unittest.TestCase):
+    codecs = [('br', None), ('gzip', None)]
+
+    def test_server_order_breaks_ties(self):
+        self.assertEqual(choose_encoding(Accept([('gzip', 1), ('br', 1)]), self.codecs)[0], 'br')
+
+    def test_client_preference_wins(self):
+        self.assertEqual(choose_encoding(Accept([('gzip', 1), ('br', 0.5)]), self.codecs)[0], 'gzip')
+
+    def test_nothing_acceptable(self):
+        self.assertIsNone(choose_encoding(Accept([('deflate', 1)]), self.codecs))
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'config.py'), 'w') as f:
+            f.write(CONFIG.format(users=self.directory))
+        with open(os.path.join(self.directory, 'home.md'), 'w') as f:
+            f.write('title: Home\n\n' + 'A long paragraph. ' * 200)
+        self.app = create_app(self.directory)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_pages_are_compressed(self):
+        plain = self.client.get('/home/')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        response = self.client.get('/home/', headers=GZIP)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+        self.assertLess(len(response.data), len(plain.data))
+
+    def test_weak_etag_still_validates(self):
+        response = self.client.get('/home/', headers=GZIP)
+        etag, weak = response.get_etag()
+        self.assertTrue(weak)
+        headers = dict(GZIP, **{'If-None-Match': 'W/"%s"' % etag})
+        not_modified = self.client.get('/home/', headers=headers)
+        self.assertEqual(not_modified.status_code, 304)
+        # the same ETag as the 200 it stands in for
+        self.assertEqual(not_modified.headers['ETag'], response.headers['ETag'])
+        self.assertIn('Accept-Encoding', not_modified.headers['Vary'])
+        plain = self.client.get('/home/', headers={'If-None-Match': '"%s"' % etag})
+        self.assertEqual(plain.status_code, 304)
+        self.assertEqual(plain.get_etag(), (etag, False))
+
+    def test_cached_responses_are_compressed_once(self):
+        cache = self.app.extensions['response_cache']
+        first = self.client.get('/home/', headers=GZIP).data
+        (key, entry), = cache._entries.items()
+        self.assertEqual(entry[2], {'gzip': first})
+        self.assertEqual(self.client.get('/home/', headers=GZIP).data, first)
+
+    def test_streamed_index_is_gzipped(self):
+        self.app.extensions.pop('response_cache')
+        response = self.client.get('/index/', headers=GZIP)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn(b'Home', gzip.decompress(response.data))
+
+    def test_downloads_and_small_responses_are_left_alone(self):
+        response = self.client.get('/download/home/?fileType=md', headers=GZIP)
+        self.assertNotIn('Content-Encoding', response.headers)
+        response.close()
+        response = self.client.post('/convert/home/', json={'fileType': 'md'}, headers=GZIP)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.json['result']['conversionStatus'], 'Success')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from wiki.core import Page
+from wiki.web import create_app  # run with python -m unittest Tests/web_test/conditional_get_test.py
+
+CONFIG = '''
+SECRET_KEY = 'test'
+USER_DIR = {users!r}
+PRIVATE = False
+WTF_CSRF_ENABLED = False
+'''
+
+
+class TestConditionalGet(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('config.py', CONFIG.format(users=self.directory))
+        self.write('home.md', 'title: Home\n\nSee [[guide]].')
+        self.write('guide.md', 'title: Guide\n\nA guide.')
+        self.app = create_app(self.directory)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def test_validators_are_sent(self):
+        response = self.client.get('/guide/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.get_etag()[0])
+        self.assertFalse(response.get_etag()[1])
+        self.assertIsNotNone(response.last_modified)
+        self.assertTrue(response.cache_control.no_cache)
+
+    def test_not_modified_without_loading_the_page(self):
+        etag = self.client.get('/guide/').get_etag()[0]
+        with mock.patch.object(Page, 'load') as load:
+            response = self.client.get('/guide/', headers={'If-None-Match': '"%s"' % etag})
+            self.assertFalse(load.called)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.get_etag()[0], etag)
+
+    def test_home_not_modified_without_loading_the_page(self):
+        etag = self.client.get('/').get_etag()[0]
+        with mock.patch.object(Page, 'load') as load:
+            response = self.client.get('/', headers={'If-None-Match': '"%s"' % etag})
+            self.assertFalse(load.called)
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get('/guide/').headers['Last-Modified']
+        response = self.client.get('/guide/', headers={'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_follows_content_and_backlinks(self):
+        etag = self.client.get('/guide/').get_etag()[0]
+        self.client.post('/edit/home/', data={'title': 'Start', 'body': 'See [[guide]] again.', 'tags': ''})
+        self.client.get('/home/')  # shows the flashed message
+        response = self.client.get('/guide/', headers={'If-None-Match': '"%s"' % etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Start', response.data)
+        self.assertNotEqual(response.get_etag()[0], etag)
+
+    def test_flashed_messages_are_not_validated(self):
+        self.client.post('/edit/guide/', data={'title': 'Guide', 'body': 'Changed.', 'tags': ''})
+        response = self.client.get('/guide/')
+        self.assertIn(b'was saved', response.data)
+        self.assertIsNone(response.get_etag()[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import base64
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from wiki.web import create_app  # run with python -m unittest Tests/web_test/conversion_cache_test.py
+from wiki.web import workers
+from wiki.web.conversions import ConversionCache
+from wiki.web.converter import format_file_size
+
+CONFIG = '''
+SECRET_KEY = 'test'
+USER_DIR = {users!r}
+PRIVATE = False
+WTF_CSRF_ENABLED = False
+CONVERSION_PROCESSES = 1
+CONVERSION_WAIT = 30
+'''
+
+
+class TestConversionCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_key_covers_content_and_type(self):
+        key = ConversionCache.key('text', 'pdf', 'Title')
+        self.assertEqual(key, ConversionCache.key('text', 'PDF', 'Title'))
+        self.assertNotEqual(key, ConversionCache.key('text', 'docx', 'Title'))
+        self.assertNotEqual(key, ConversionCache.key('text!', 'pdf', 'Title'))
+        # the title is in the file, pages without one show their url
+        self.assertNotEqual(key, ConversionCache.key('text', 'pdf', 'other/url'))
+
+    def test_evicted_entries_spill_to_disk(self):
+        cache = ConversionCache(maxsize=10, directory=self.directory, disk_size=15)
+        cache.set('a', b'aaaaaa')
+        cache.set('b', b'bbbbbb')
+        self.assertEqual(list(cache._entries), ['b'])
+        artifact = cache.get('a')
+        self.assertEqual(artifact.path, os.path.join(self.directory, 'a'))
+        with artifact.open() as f:
+            self.assertEqual(f.read(), b'aaaaaa')
+        cache.set('c', b'cccccc')
+        cache.set('d', b'dddddd')
+        # b and c went to disk, a is the oldest there and pruned
+        self.assertEqual(sorted(os.listdir(self.directory)), ['b', 'c'])
+
+    def test_large_files_go_straight_to_disk(self):
+        cache = ConversionCache(maxsize=4, directory=self.directory)
+        artifact = cache.set('a', b'aaaaaa')
+        self.assertEqual((artifact.size, len(cache)), (6, 0))
+        self.assertTrue(os.path.exists(artifact.path))
+
+
+class TestConversionRoutes(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'config.py'), 'w') as f:
+            f.write(CONFIG.format(users=self.directory))
+        with open(os.path.join(self.directory, 'home.md'), 'w') as f:
+            f.write('title: Home\n\nHello.')
+        self.app = create_app(self.directory)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        workers.shutdown(self.app)
+        shutil.rmtree(self.directory)
+
+    def test_download_uses_the_conversion_of_convert(self):
+        with mock.patch.object(workers, 'convert', wraps=workers.convert) as convert:
+            result = self.client.post('/convert/home/', json={'fileType': 'html'}).json['result']
+            response = self.client.get('/download/home/?fileType=html')
+            # converted by the job of /convert/, found in the cache
+            self.assertEqual(convert.call_count, 0)
+        self.assertEqual(result['conversionStatus'], 'Success')
+        self.assertIn(b'Hello.', response.data)
+        self.assertEqual(result['fileSize'], format_file_size(len(response.data)))
+        response.close()
+
+    def test_html_is_the_page_as_rendered(self):
+        with open(os.path.join(self.directory, 'home.md'), 'w') as f:
+            f.write('title: Home\n\nSee [[guide]].\n\n    :::python\n    x = 1\n')
+        response = self.client.get('/download/home/?fileType=html')
+        document = response.data.decode('utf-8')
+        response.close()
+        self.assertTrue(document.startswith('<!DOCTYPE html>'))
+        self.assertIn("<a href='/guide/'>guide</a>", document)
+        self.assertIn('class="codehilite"', document)
+        # the metadata is not part of the body
+        self.assertNotIn('title: Home', document)
+
+    def test_pages_with_the_same_content_get_their_own_files(self):
+        for url in ('one', 'two'):
+            with open(os.path.join(self.directory, url + '.md'), 'w') as f:
+                f.write('tags: same\n\nSame text.')
+        for url in ('one', 'two'):
+            response = self.client.get('/download/%s/?fileType=html' % url)
+            self.assertIn('<title>%s</title>' % url, response.data.decode('utf-8'))
+            response.close()
+
+    def test_base64_only_on_request(self):
+        result = self.client.post('/convert/home/', json={'fileType': 'txt'}).json['result']
+        self.assertNotIn('fileContent', result)
+        result = self.client.post('/convert/home/', json={'fileType': 'txt', 'encoding': 'base64'}).json['result']
+        self.assertEqual(base64.b64decode(result['fileContent']), b'title: Home\n\nHello.')
+
+    def test_edits_are_converted_again(self):
+        with mock.patch.object(workers, 'convert', wraps=workers.convert) as convert:
+            self.client.get('/download/home/?fileType=txt').close()
+            with open(os.path.join(self.directory, 'home.md'), 'w') as f:
+                f.write('title: Home\n\nHello again.')
+            response = self.client.get('/download/home/?fileType=txt')
+            self.assertEqual(convert.call_count, 2)
+        self.assertIn(b'Hello again.', response.data)
+        response.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from wiki.web import create_app  # run with python -m unittest Tests/web_test/conversion_jobs_test.py
+from wiki.web import workers
+from wiki.web.conversions import ConversionCache
+from wiki.web.converter import Conversion, format_file_size
+from wiki.web.jobs import DONE, FAILED, JobQueue, QUEUED, QueueFull, RUNNING
+
+CONFIG = '''
+SECRET_KEY = 'test'
+USER_DIR = {users!r}
+PRIVATE = False
+WTF_CSRF_ENABLED = False
+CONVERSION_PROCESSES = 1
+CONVERSION_WAIT = 0
+'''
+
+
+class FakePool(object):
+    """Keeps the submitted futures for the test to finish them."""
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, func, *args):
+        future = Future()
+        self.futures.append(future)
+        return future
+
+
+class FakePage(object):
+    def __init__(self, content):
+        self.path = '/nowhere.md'
+        self.url = 'page'
+        self.title = 'Page'
+        self.content = content
+
+
+class TestJobQueue(unittest.TestCase):
+    def setUp(self):
+        self.pool = FakePool()
+        self.cache = ConversionCache()
+        self.queue = JobQueue(ttl=60, max_jobs=2)
+
+    def test_job_lifecycle(self):
+        job = self.queue.submit(FakePage('a'), 'txt', self.pool, self.cache)
+        self.assertEqual(job.status, QUEUED)
+        self.pool.futures[0].set_running_or_notify_cancel()
+        self.assertEqual(job.status, RUNNING)
+        self.pool.futures[0].set_result(Conversion(b'a', 'txt'))
+        self.assertEqual(job.status, DONE)
+        self.assertEqual(job.size, 1)
+        self.assertEqual(self.cache.get(job.key).data, b'a')
+        self.assertIs(self.queue.get(job.id), job)
+
+    def test_failures_are_reported(self):
+        job = self.queue.submit(FakePage('a'), 'pdf', self.pool, self.cache)
+        self.pool.futures[0].set_exception(ValueError('broken'))
+        self.assertEqual((job.status, job.error), (FAILED, 'broken'))
+
+    def test_same_conversion_is_submitted_once(self):
+        job = self.queue.submit(FakePage('a'), 'txt', self.pool, self.cache)
+        self.assertIs(self.queue.submit(FakePage('a'), 'TXT', self.pool, self.cache), job)
+        self.assertEqual(len(self.pool.futures), 1)
+
+    def test_cached_conversions_are_done_at_once(self):
+        self.cache.set(self.cache.key('a', 'txt', 'Page'), b'a')
+        job = self.queue.submit(FakePage('a'), 'txt', self.pool, self.cache)
+        self.assertEqual(job.status, DONE)
+        self.assertEqual(self.pool.futures, [])
+
+    def test_converts_outside_of_the_lock(self):
+        queue = self.queue
+
+        class LocalPool(object):
+            def submit(self, *args):
+                # like HTML, which is converted right away
+                future = Future()
+                future.set_result(Conversion(b'locked' if queue._lock.locked() else b'a', 'txt'))
+                return future
+
+        job = queue.submit(FakePage('a'), 'txt', LocalPool(), self.cache)
+        self.assertEqual(job.status, DONE)
+        self.assertEqual(self.cache.get(job.key).data, b'a')
+
+    def test_queue_is_bounded(self):
+        self.queue.submit(FakePage('a'), 'txt', self.pool, self.cache)
+        self.queue.submit(FakePage('b'), 'txt', self.pool, self.cache)
+        with self.assertRaises(QueueFull):
+            self.queue.submit(FakePage('c'), 'txt', self.pool, self.cache)
+
+    def test_finished_jobs_expire(self):
+        job = self.queue.submit(FakePage('a'), 'txt', self.pool, self.cache)
+        self.pool.futures[0].set_result(Conversion(b'a', 'txt'))
+        job.finished -= 61
+        self.assertIsNone(self.queue.get(job.id))
+
+
+class TestConversionJobRoutes(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'config.py'), 'w') as f:
+            f.write(CONFIG.format(users=self.directory))
+        with open(os.path.join(self.directory, 'home.md'), 'w') as f:
+            f.write('title: Home\n\nHello.')
+        self.app = create_app(self.directory)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        workers.shutdown(self.app)
+        shutil.rmtree(self.directory)
+
+    def test_convert_returns_a_job_to_poll(self):
+        response = self.client.post('/convert/home/', json={'fileType': 'docx'})
+        self.assertIn(response.status_code, (200, 202))
+        job = response.json['job']
+        deadline = time.time() + 60
+        while response.status_code == 202 and time.time() < deadline:
+            time.sleep(0.05)
+            response = self.client.get(job['statusUrl'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['result']['conversionStatus'], 'Success')
+        self.assertTrue(response.json['result']['fileSize'].endswith('KB'))
+        download = self.client.get(job['downloadUrl'])
+        self.assertEqual(download.status_code, 200)
+        self.assertTrue(download.data.startswith(b'PK'))
+        download.close()
+
+    def test_job_of_an_older_version_is_not_downloaded(self):
+        response = self.client.post('/convert/home/', json={'fileType': 'txt'})
+        job = response.json['job']
+        deadline = time.time() + 60
+        while response.status_code == 202 and time.time() < deadline:
+            time.sleep(0.05)
+            response = self.client.get(job['statusUrl'])
+        with open(os.path.join(self.directory, 'home.md'), 'w') as f:
+            f.write('title: Home\n\nHello again.')
+        download = self.client.get(job['downloadUrl'])
+        self.assertIn(b'Hello again.', download.data)
+        download.close()
+
+    def test_jobs_of_other_processes_are_taken_over(self):
+        response = self.client.post('/convert/home/', json={'fileType': 'txt'})
+        status_url = response.json['job']['statusUrl']
+        # another process: it neither knows the job nor has the file in memory
+        self.app.extensions['jobs'] = JobQueue()
+        self.app.extensions['conversions'].clear()
+        response = self.client.get(status_url)
+        deadline = time.time() + 60
+        while response.status_code == 202 and time.time() < deadline:
+            time.sleep(0.05)
+            response = self.client.get(status_url)
+        self.assertEqual(response.json['result']['conversionStatus'], 'Success')
+        with open(os.path.join(self.directory, 'home.md'), 'w') as f:
+            f.write('title: Home\n\nHello again.')
+        self.app.extensions['jobs'] = JobQueue()
+        self.assertEqual(self.client.get(status_url).status_code, 404)
+
+    def test_finished_jobs_keep_no_files(self):
+        response = self.client.post('/convert/home/', json={'fileType': 'html'})
+        job = self.app.extensions['jobs'].get(response.json['job']['id'])
+        self.assertEqual(job.status, DONE)
+        self.assertFalse(hasattr(job, 'artifact'))
+        self.assertEqual(response.json['result']['fileSize'], format_file_size(job.size))
+
+    def test_threads_without_conversion_processes(self):
+        del self.app.config['CONVERSION_PROCESSES']
+        self.assertIsNone(workers.conversion_pool(self.app))
+        pool = workers.conversion_pool(self.app, threads=2)
+        self.assertIsInstance(pool, ThreadPoolExecutor)
+        self.assertEqual(workers.pool_size(self.app, threads=2), 2)
+        response = self.client.post('/convert/home/', json={'fileType': 'txt'})
+        job = response.json['job']
+        deadline = time.time() + 60
+        while response.status_code == 202 and time.time() < deadline:
+            time.sleep(0.05)
+            response = self.client.get(job['statusUrl'])
+        self.assertEqual(response.json['result']['conversionStatus'], 'Success')
+        self.assertIs(self.app.extensions['conversion_pool'], pool)
+
+    def test_unknown_jobs_and_types(self):
+        self.assertEqual(self.client.get('/convert/jobs/nothing/').status_code, 404)
+        result = self.client.post('/convert/home/', json={'fileType': 'exe'}).json['result']
+        self.assertEqual(result['conversionStatus'], 'Failed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from wiki.web import create_app  # run with python -m unittest Tests/web_test/export_test.py
+from wiki.web import export
+from wiki.web import workers
+
+CONFIG = '''
+SECRET_KEY = 'test'
+USER_DIR = {users!r}
+PRIVATE = False
+WTF_CSRF_ENABLED = False
+CONVERSION_PROCESSES = 1
+'''
+
+PAGES = {
+    'home': 'title: Home\ntags: start\n\nHello.',
+    'guide/one': 'title: One\ntags: guide\n\nFirst.',
+    'guide/two': 'title: Two\ntags: guide\n\nSecond.',
+}
+
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'config.py'), 'w') as f:
+            f.write(CONFIG.format(users=self.directory))
+        for url, content in PAGES.items():
+            path = os.path.join(self.directory, url + '.md')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+        self.app = create_app(self.directory)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        workers.shutdown(self.app)
+        shutil.rmtree(self.directory)
+
+    def archive(self, query):
+        response = self.client.get('/export/' + query)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/zip')
+        self.assertTrue(response.is_streamed)
+        return zipfile.ZipFile(io.BytesIO(response.data))
+
+    def test_export_all_pages_as_markdown(self):
+        archive = self.archive('?format=md')
+        self.assertEqual(sorted(archive.namelist()), ['guide/one.md', 'guide/two.md', 'home.md'])
+        self.assertEqual(archive.read('home.md').decode('utf-8'), PAGES['home'])
+        self.assertIsNone(archive.testzip())
+
+    def test_select_by_tag_and_prefix(self):
+        archive = self.archive('?format=txt&tag=start')
+        self.assertEqual(archive.namelist(), ['home.txt'])
+        archive = self.archive('?format=txt&prefix=guide')
+        self.assertEqual(sorted(archive.namelist()), ['guide/one.txt', 'guide/two.txt'])
+        self.assertIn(b'Second.', archive.read('guide/two.txt'))
+
+    def test_converted_in_the_pool(self):
+        archive = self.archive('?format=docx&prefix=guide/')
+        self.assertEqual(sorted(archive.namelist()), ['guide/one.docx', 'guide/two.docx'])
+        self.assertEqual(archive.getinfo('guide/one.docx').compress_type, zipfile.ZIP_STORED)
+        self.assertIsNotNone(self.app.extensions.get('conversion_pool'))
+
+    def test_unknown_format_and_empty_selection(self):
+        self.assertEqual(self.client.get('/export/?format=exe').status_code, 400)
+        self.assertEqual(self.client.get('/export/?tag=nothing').status_code, 404)
+
+    def test_failures_are_listed(self):
+        class Failing(object):
+            def done(self):
+                return True
+
+            def result(self):
+                raise ValueError('broken')
+
+            def cancel(self):
+                pass
+
+        class Pool(object):
+            def submit(self, *args):
+                return Failing()
+
+        with self.app.test_request_context():
+            pages = export.select(self.app.extensions['wiki'].get(), prefix='guide')
+            data = b''.join(export.export(pages, 'pdf', Pool(), pool_size=1))
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        self.assertEqual(archive.namelist(), ['errors.txt'])
+        self.assertIn(b'guide/one: broken', archive.read('errors.txt'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import base64
+import json
+import os
+import re
+import shutil
+import tempfile
+import unittest
+from wiki.web import create_app  # run with python -m unittest Tests/web_test/index_pagination_test.py
+
+CONFIG = '''
+SECRET_KEY = 'test'
+USER_DIR = {users!r}
+PRIVATE = False
+INDEX_PAGE_SIZE = 2
+'''
+
+
+class TestIndexPagination(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('config.py', CONFIG.format(users=self.directory))
+        for name in ('echo', 'Bravo', 'alpha', 'delta', 'Charlie'):
+            self.write(name.lower() + '.md', 'title: %s\n\n%s' % (name, name))
+        self.app = create_app(self.directory)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.streamed = response.is_streamed
+        html = response.get_data(as_text=True)
+        titles = re.findall(r'<td><a href="/[^"]*/">([^<]*)</a></td>\s*<td>', html)
+        links = dict(re.findall(r'<li class="(previous|next)"><a href="([^"]*)"', html))
+        return response, titles, {k: v.replace('&amp;', '&') for k, v in links.items()}
+
+    def test_listing_is_streamed(self):
+        response, titles, links = self.get('/index/')
+        self.assertTrue(self.streamed)
+        self.assertEqual(titles, ['alpha', 'Bravo'])
+        self.assertEqual(list(links), ['next'])
+
+    def test_paging_forward_and_back(self):
+        _, _, links = self.get('/index/')
+        _, titles, links = self.get(links['next'])
+        self.assertEqual(titles, ['Charlie', 'delta'])
+        _, titles, last = self.get(links['next'])
+        self.assertEqual(titles, ['echo'])
+        self.assertEqual(list(last), ['previous'])
+        _, titles, links = self.get(last['previous'])
+        self.assertEqual(titles, ['Charlie', 'delta'])
+        _, titles, links = self.get(links['previous'])
+        self.assertEqual(titles, ['alpha', 'Bravo'])
+        self.assertEqual(list(links), ['next'])
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/index/?after=nonsense').status_code, 400)
+        for position in ([1, {}], [[1], 'x'], ['a', None]):
+            cursor = base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('ascii')
+            self.assertEqual(self.client.get('/index/?after=' + cursor).status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
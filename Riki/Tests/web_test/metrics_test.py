@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+from wiki.web import create_app  # run with python -m unittest Tests/web_test/metrics_test.py
+from wiki.web.metrics import Counter, Histogram
+
+CONFIG = '''
+SECRET_KEY = 'test'
+USER_DIR = {users!r}
+PRIVATE = False
+WTF_CSRF_ENABLED = False
+METRICS_TOKEN = 'secret'
+'''
+
+
+class TestMetricTypes(unittest.TestCase):
+    def test_counter_samples(self):
+        counter = Counter('things_total', 'Things.', ['kind'])
+        counter.inc('a')
+        counter.inc('a', amount=2)
+        counter.inc('b"')
+        self.assertEqual(counter.samples(), [
+            ('things_total', '{kind="a"}', 3),
+            ('things_total', '{kind="b\\""}', 1),
+        ])
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('took_seconds', 'Took.', buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 0.7, 5):
+            histogram.observe(value)
+        samples = {labels + name: value for name, labels, value in histogram.samples()}
+        self.assertEqual(samples['{le="0.1"}took_seconds_bucket'], 1)
+        self.assertEqual(samples['{le="1"}took_seconds_bucket'], 3)
+        self.assertEqual(samples['{le="+Inf"}took_seconds_bucket'], 4)
+        self.assertEqual(samples['took_seconds_count'], 4)
+        self.assertAlmostEqual(samples['took_seconds_sum'], 6.25)
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'config.py'), 'w') as f:
+            f.write(CONFIG.format(users=self.directory))
+        with open(os.path.join(self.directory, 'home.md'), 'w') as f:
+            f.write('title: Home\n\nHello.')
+        self.app = create_app(self.directory)
+        self.client = self.app.test_client()
+
+    def scrape(self):
+        return self.client.get('/metrics', headers={'Authorization': 'Bearer secret'}).get_data(as_text=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_requests_are_timed_by_endpoint(self):
+        self.client.get('/home/')
+        text = self.scrape()
+        self.assertIn('# TYPE riki_request_duration_seconds histogram', text)
+        self.assertIn('riki_request_duration_seconds_count{endpoint="wiki.display",method="GET"}', text)
+        self.assertIn('riki_responses_total{endpoint="wiki.display",status="200"}', text)
+        self.assertIn('riki_cache_requests_total{cache="render",result="miss"}', text)
+
+    def test_conversions_are_counted_by_type(self):
+        self.client.get('/download/home/?fileType=txt')
+        text = self.scrape()
+        self.assertRegex(text, r'riki_conversions_total\{type="txt"\} [1-9]')
+
+    def test_only_clients_with_the_token_get_the_metrics(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer wrong'})
+        self.assertEqual(response.status_code, 401)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        del self.app.config['METRICS_TOKEN']
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
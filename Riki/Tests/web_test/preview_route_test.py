@@ -0,0 +1,39 @@
+import os
+import shutil
+import tempfile
+import unittest
+from wiki.web import create_app  # run with python -m unittest Tests/web_test/preview_route_test.py
+
+CONFIG = '''
+SECRET_KEY = 'test'
+USER_DIR = {users!r}
+PRIVATE = False
+'''
+
+
+class TestPreviewRoute(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'config.py'), 'w') as f:
+            f.write(CONFIG.format(users=self.directory))
+        self.client = create_app(self.directory).test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_html(self):
+        response = self.client.post('/preview/', data={'body': 'title: x\n\n*a*\n\nb'})
+        self.assertEqual(response.data, b'<p><em>a</em></p>\n<p>b</p>')
+
+    def test_json_holds_only_unknown_blocks(self):
+        first = self.client.post('/preview/', data={'body': 'title: x\n\n*a*\n\nb', 'format': 'json'}).json
+        self.assertEqual(len(first['blocks']), 3)
+        self.assertEqual(first['html'][first['blocks'][1]], '<p><em>a</em></p>')
+        second = self.client.post('/preview/', data={
+            'body': 'title: x\n\n*a*\n\nc', 'format': 'json', 'known': ','.join(first['blocks'])}).json
+        self.assertEqual(second['blocks'][:2], first['blocks'][:2])
+        self.assertEqual(list(second['html'].values()), ['<p>c</p>'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+from wiki.web import create_app  # run with python -m unittest Tests/web_test/profiling_test.py
+
+CONFIG = '''
+SECRET_KEY = 'test'
+USER_DIR = {users!r}
+PRIVATE = False
+WTF_CSRF_ENABLED = False
+PROFILE = True
+PROFILE_SAMPLE = {sample!r}
+PROFILE_KEEP = 3
+'''
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.users = os.path.join(self.directory, 'users')
+        os.mkdir(self.users)
+        with open(os.path.join(self.users, 'users.json'), 'w') as f:
+            f.write('{}')
+        with open(os.path.join(self.directory, 'home.md'), 'w') as f:
+            f.write('title: Home\n\nHello.')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def client(self, sample):
+        with open(os.path.join(self.directory, 'config.py'), 'w') as f:
+            f.write(CONFIG.format(users=self.users, sample=sample))
+        self.app = create_app(self.directory)
+        self.store = self.app.extensions['profiles']
+        return self.app.test_client()
+
+    def login(self, client, roles):
+        with self.app.app_context():
+            self.app.extensions['users'].add_user('ann', 'secret', 'ann@example.com', roles=roles)
+        client.post('/user/login/', data={'name': 'ann', 'password': 'secret'})
+
+    def test_sampled_requests_are_profiled_and_rotated(self):
+        client = self.client(1.0)
+        for _ in range(5):
+            client.get('/home/')
+        self.assertEqual(len(self.store.names()), 3)
+        info = self.store.slowest()[0]
+        self.assertEqual((info['path'], info['endpoint'], info['status']), ('/home/', 'wiki.display', 200))
+        self.assertIn('function calls', self.store.stats(info['name']))
+
+    def test_header_only_profiles_admin_requests(self):
+        client = self.client(0.0)
+        client.get('/home/', headers={'X-Profile': '1'})
+        self.assertEqual(self.store.names(), [])
+        self.login(client, ['admin'])
+        client.get('/home/', headers={'X-Profile': '1'})
+        client.get('/home/')
+        self.assertEqual([info['path'] for info in self.store.slowest()], ['/home/'])
+
+    def test_profile_pages_are_for_admins(self):
+        client = self.client(0.0)
+        self.assertEqual(client.get('/profiles/').status_code, 403)
+        self.login(client, ['admin'])
+        client.get('/home/', headers={'X-Profile': '1'})
+        name = self.store.names()[0]
+        self.assertIn(b'/home/', client.get('/profiles/').data)
+        self.assertIn(b'function calls', client.get('/profiles/%s/' % name).data)
+        response = client.get('/profiles/%s/?download=1' % name)
+        self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename=%s.prof' % name)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+from wiki.web import create_app  # run with python -m unittest Tests/web_test/response_cache_test.py
+
+CONFIG = '''
+SECRET_KEY = 'test'
+USER_DIR = {users!r}
+PRIVATE = False
+WTF_CSRF_ENABLED = False
+RESPONSE_CACHE = True
+'''
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.write('config.py', CONFIG.format(users=self.directory))
+        self.write('home.md', 'title: Home\ntags: start\n\nSee [[guide]].')
+        self.write('guide.md', 'title: Guide\ntags: docs\n\nA guide.')
+        self.write('other.md', 'title: Other\n\nNo links.')
+        self.app = create_app(self.directory)
+        self.cache = self.app.extensions['response_cache']
+        self.client = self.app.test_client()
+        for url in ('/index/', '/tags/', '/tag/docs/', '/guide/', '/other/'):
+            self.client.get(url)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        with open(os.path.join(self.directory, name), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def cached(self):
+        return sorted(key[0] for key in self.cache._entries)
+
+    def edit(self, url, title, body, tags=''):
+        self.client.post('/edit/%s/' % url, data={'title': title, 'body': body, 'tags': tags})
+        self.client.get('/user/login/')  # shows the flashed message
+
+    def test_responses_are_served_from_the_cache(self):
+        self.assertEqual(len(self.cache), 5)
+        response = self.client.get('/index/')
+        self.assertEqual(self.cache.hits, 1)
+        self.assertIn(b'Guide', response.data)
+
+    def test_editing_the_body_keeps_the_listings(self):
+        self.edit('guide', 'Guide', 'A better guide.', 'docs')
+        self.assertEqual(self.cached(), ['/index/?', '/other/?', '/tag/docs/?', '/tags/?'])
+        self.assertIn(b'A better guide', self.client.get('/guide/').data)
+
+    def test_new_title_and_tags_reach_the_listings(self):
+        self.edit('other', 'Another', 'No links.', 'docs')
+        self.assertEqual(self.cached(), ['/guide/?'])
+        self.assertIn(b'Another', self.client.get('/tag/docs/').data)
+
+    def test_new_backlink_drops_the_page_view(self):
+        self.edit('other', 'Other', 'Now with [[guide]].')
+        self.assertEqual(self.cached(), ['/index/?', '/tag/docs/?', '/tags/?'])
+        self.assertIn(b'Other', self.client.get('/guide/').data)
+
+    def test_move_and_delete(self):
+        self.client.post('/move/other/', data={'url': 'moved'})
+        self.assertEqual(self.cached(), ['/guide/?', '/tag/docs/?', '/tags/?'])
+        self.client.get('/delete/guide/')
+        self.assertEqual(self.cached(), [])
+
+    def test_cache_is_opt_in(self):
+        self.write('config.py', CONFIG.format(users=self.directory).replace('True', 'False'))
+        self.assertNotIn('response_cache', create_app(self.directory).extensions)
+
+
+if __name__ == '__main__':
+    unittest.main()
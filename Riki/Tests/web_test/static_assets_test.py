@@ -0,0 +1,83 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+from flask import url_for
+from wiki.web import assets
+from wiki.web.cache import template_version
+from wiki.web import create_app  # run with python -m unittest Tests/web_test/static_assets_test.py
+
+CONFIG = '''
+SECRET_KEY = 'test'
+USER_DIR = {users!r}
+PRIVATE = False
+STATIC_BUILD = True
+STATIC_BUILD_DIR = {build!r}
+'''
+
+
+class TestStaticAssets(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.build = os.path.join(self.directory, 'build')
+        with open(os.path.join(self.directory, 'config.py'), 'w') as f:
+            f.write(CONFIG.format(users=self.directory, build=self.build))
+        self.app = create_app(self.directory)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def url(self, filename):
+        with self.app.test_request_context():
+            return url_for('static', filename=filename)
+
+    def test_urls_are_fingerprinted(self):
+        url = self.url('bootstrap.css')
+        self.assertRegex(url, r'^/static/build/bootstrap\.[0-9a-f]{12}\.css$')
+        self.assertIn(url, self.client.get('/index/').get_data(as_text=True))
+
+    def test_compressed_variant_is_served_when_accepted(self):
+        url = self.url('bootstrap.css')
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(response.mimetype, 'text/css')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        with open(os.path.join(self.app.static_folder, 'bootstrap.css'), 'rb') as f:
+            self.assertEqual(gzip.decompress(response.data), f.read())
+        response.close()
+
+    def test_identity_without_accept_encoding(self):
+        response = self.client.get(self.url('pygments.css'))
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn(b'.codehilite', response.data)
+        response.close()
+
+    def test_page_etags_follow_the_build(self):
+        with self.app.test_request_context():
+            before = template_version()
+            self.app.extensions['assets_version'] = assets.version({'bootstrap.css': 'bootstrap.0.css'})
+            self.assertNotEqual(template_version(), before)
+
+    def test_files_of_the_build_before_are_kept(self):
+        static = os.path.join(self.directory, 'static')
+        build = os.path.join(self.directory, 'other')
+        os.mkdir(static)
+        names = []
+        for content in ('one', 'two', 'three'):
+            with open(os.path.join(static, 'a.css'), 'w') as f:
+                f.write(content)
+            names.append(assets.build(static, build)['a.css'])
+        self.assertEqual(sorted(os.listdir(build)), sorted(names[1:] + ['manifest.json']))
+
+    def test_unknown_built_files_are_not_found(self):
+        self.assertEqual(self.client.get('/static/build/manifest.json').status_code, 404)
+        response = self.client.get('/static/pygments.css')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
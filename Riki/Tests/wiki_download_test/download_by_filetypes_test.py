@@ -1,3 +1,4 @@
+import base64
 import unittest
 from unittest.mock import Mock
 from wiki.web.converter import Converter, get_file_size # run with python -m unittest Tests/wiki_download_test/download_by_filetypes_test.py
@@ -8,6 +9,7 @@ class TestConverter(unittest.TestCase):
         self.page = Mock()
         self.page.title = "Test Page"
         self.page.content = "Test content"
+        self.page.html = "<p>Test content</p>"
 
     def test_get_file_size(self):
         # Test get_file_size function with various sizes
@@ -50,6 +52,38 @@ class TestConverter(unittest.TestCase):
         self.assertTrue(isinstance(file_size, str))
         self.assertTrue(file_size.endswith('KB'))
 
+    def test_convert_returns_bytes(self):
+        conversion = Converter(self.page).convert('txt')
+
+        self.assertEqual(conversion.data, b'Test content')
+        self.assertEqual(conversion.size, 12)
+        self.assertEqual(conversion.formatted_size, '12 B')
+        self.assertTrue(conversion.mimetype.startswith('text/plain'))
+        self.assertEqual(conversion.open().read(), b'Test content')
+        self.assertEqual(base64.b64decode(conversion.base64()), b'Test content')
+
+    def test_convert_PDF_bytes(self):
+        conversion = Converter(self.page).convert('PDF')
+
+        self.assertTrue(conversion.data.startswith(b'%PDF'))
+        self.assertEqual(conversion.mimetype, 'application/pdf')
+
+    def test_convert_HTML_uses_the_rendered_page(self):
+        conversion = Converter(self.page).convert('html')
+        self.assertEqual(conversion.data, b'<p>Test content</p>')
+
+        self.page.title = "Tests & more"
+        document = Converter(self.page, standalone=True).convert('html').data.decode('utf-8')
+        self.assertTrue(document.startswith('<!DOCTYPE html>'))
+        self.assertIn('<title>Tests &amp; more</title>', document)
+        self.assertIn('.codehilite', document)
+        self.assertIn('<p>Test content</p>', document)
+
+    def test_convert_unsupported_type(self):
+        self.assertFalse(Converter.supports('exe'))
+        with self.assertRaises(AttributeError):
+            Converter(self.page).convert('exe')
+
 
 if __name__ == '__main__':
     unittest.main()
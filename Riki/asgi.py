@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+"""
+ASGI entry point, the counterpart of Riki.py for ASGI servers.
+
+run with uvicorn asgi:app (or hypercorn asgi:app) from the content
+directory, with the Riki directory on PYTHONPATH
+"""
+import os
+
+from wiki.web.asgi import create_asgi_app
+
+directory = os.getcwd()
+app = create_asgi_app(directory)
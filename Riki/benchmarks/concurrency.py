@@ -0,0 +1,213 @@
+"""
+Concurrency benchmark: the wiki served over WSGI (werkzeug's threaded
+server, what Riki.py runs) against ASGI (uvicorn with wiki.web.asgi),
+under many concurrent clients.
+
+Every client loops over a mix of page views, listings and conversions
+for --duration seconds; with --slow-read it reads responses slowly, like
+a client on a bad connection. Throughput and latency percentiles per mode
+are written as JSON.
+
+run with python benchmarks/concurrency.py [--clients N] [--mode wsgi|asgi]
+from the Riki directory; the asgi mode needs uvicorn
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchmarks import corpus  # noqa: E402
+
+MODES = ['wsgi', 'asgi']
+
+
+def serve(mode, content, port, threads, processes):
+    """Runs the server of a mode, in the process started by :func:`start`."""
+    from wiki.web import create_app
+    from wiki.web.asgi import AsgiApp
+    app = create_app(content)
+    app.config['CONVERSION_PROCESSES'] = processes
+    if mode == 'wsgi':
+        from werkzeug.serving import make_server
+        make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+    else:
+        import uvicorn
+        uvicorn.run(AsgiApp(app, threads), host='127.0.0.1', port=port,
+                    log_level='warning')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start(mode, content, threads, processes):
+    port = free_port()
+    server = subprocess.Popen([
+        sys.executable, os.path.abspath(__file__), '--serve', mode,
+        '--threads', str(threads), '--processes', str(processes),
+        '--port', str(port), content])
+    deadline = time.time() + 30
+    while True:
+        try:
+            urllib.request.urlopen(
+                'http://127.0.0.1:{0}/index/'.format(port)).read()
+            return server, port
+        except OSError:
+            if server.poll() is not None or time.time() > deadline:
+                server.kill()
+                raise RuntimeError('the {0} server did not start'.format(mode))
+            time.sleep(0.2)
+
+
+async def fetch(port, path, slow_read):
+    """
+        One request on its own connection.
+
+        :returns: the status code
+    """
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write('GET {0} HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+                     'Connection: close\r\n\r\n'.format(path).encode())
+        await writer.drain()
+        status = None
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                break
+            if status is None:
+                status = int(data.split(b' ', 2)[1])
+            if slow_read:
+                await asyncio.sleep(slow_read)
+        return status
+    finally:
+        writer.close()
+
+
+async def client(port, paths, until, slow_read, latencies, errors, seed):
+    rnd = random.Random(seed)
+    while time.perf_counter() < until:
+        path = rnd.choice(paths)
+        started = time.perf_counter()
+        try:
+            status = await fetch(port, path, slow_read)
+        except OSError:
+            status = None
+        if status != 200:
+            errors.append(path)
+        latencies.append(time.perf_counter() - started)
+
+
+async def load(port, paths, clients, duration, slow_read):
+    latencies = []
+    errors = []
+    until = time.perf_counter() + duration
+    await asyncio.gather(*[
+        client(port, paths, until, slow_read, latencies, errors, seed)
+        for seed in range(clients)])
+    return latencies, errors
+
+
+def percentile(values, fraction):
+    return sorted(values)[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run_mode(mode, content, paths, args):
+    server, port = start(mode, content, args.threads, args.processes)
+    try:
+        started = time.perf_counter()
+        latencies, errors = asyncio.run(load(
+            port, paths, args.clients, args.duration, args.slow_read))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+    result = {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput': len(latencies) / elapsed,
+        'mean': statistics.mean(latencies) if latencies else None,
+        'p50': percentile(latencies, 0.5) if latencies else None,
+        'p95': percentile(latencies, 0.95) if latencies else None,
+        'p99': percentile(latencies, 0.99) if latencies else None,
+    }
+    print('{0:<6} {1:>8.1f} req/s  p50 {2:>8.1f} ms  p99 {3:>8.1f} ms  '
+          '{4} errors'.format(mode, result['throughput'],
+                              (result['p50'] or 0) * 1e3,
+                              (result['p99'] or 0) * 1e3, len(errors)),
+          file=sys.stderr)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--serve', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('content', nargs='?', help=argparse.SUPPRESS)
+    corpus.add_arguments(parser)
+    parser.add_argument('--mode', choices=MODES + ['both'], default='both')
+    parser.add_argument('--clients', type=int, default=50,
+                        help='concurrent connections')
+    parser.add_argument('--duration', type=float, default=10,
+                        help='seconds of load per mode')
+    parser.add_argument('--slow-read', type=float, default=0,
+                        help='seconds a client waits after every 4 KB')
+    parser.add_argument('--threads', type=int, default=32,
+                        help='thread pool size of the ASGI mode')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='conversion processes (CONVERSION_PROCESSES)')
+    parser.add_argument('-o', '--output', help='write the JSON here')
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.content, args.port, args.threads,
+              args.processes)
+        return
+
+    options = corpus.options(args)
+    directory = tempfile.mkdtemp(prefix='riki-concurrency-')
+    try:
+        content = corpus.generate(directory, **options)
+        rnd = random.Random(args.seed)
+        urls = [corpus.page_url(rnd.randrange(args.pages)) for _ in range(50)]
+        paths = ['/{0}/'.format(url) for url in urls] * 8 + \
+            ['/index/', '/tags/'] * 4 + \
+            ['/download/{0}/?fileType=pdf'.format(url) for url in urls[:10]]
+        modes = MODES if args.mode == 'both' else [args.mode]
+        results = {mode: run_mode(mode, content, paths, args)
+                   for mode in modes}
+    finally:
+        shutil.rmtree(directory)
+
+    report = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'corpus': options,
+        'clients': args.clients,
+        'duration': args.duration,
+        'slow_read': args.slow_read,
+        'threads': args.threads,
+        'processes': args.processes,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
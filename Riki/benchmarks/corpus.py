@@ -0,0 +1,169 @@
+"""
+Generator for synthetic content directories, used by the benchmark suite
+and handy for trying the wiki on a large corpus by hand.
+
+The pages are deterministic for a given seed: titles, tags, wikilinks
+between the pages (including some broken ones), code blocks, tables and
+plain paragraphs. A config.py with a public wiki is written next to them
+so the directory can be passed to create_app() directly.
+
+run with python benchmarks/corpus.py <directory> [--pages N ...] from the
+Riki directory
+"""
+import argparse
+import json
+import os
+import random
+
+WORDS = (
+    'wiki page link index search render markdown python flask cache table '
+    'query token engine request response server client module package test '
+    'value record update delete create move title author draft review note '
+    'branch commit merge tree graph node edge path file folder stream block '
+    'alpha beta gamma delta epsilon zeta theta lambda sigma omega'
+).split()
+
+CODE = '''```python
+def handler_{0}(request):
+    """Returns the page {0}."""
+    return render(request, "page_{0}.html", {{"id": {0}}})
+```'''
+
+TABLE = '''| key | value |
+|-----|-------|
+| {0} | {1} |
+| {1} | {0} |'''
+
+CONFIG = '''# encoding: utf-8
+# generated by benchmarks/corpus.py
+
+SECRET_KEY = 'benchmark'
+TITLE = 'Benchmark'
+CONTENT_DIR = {content!r}
+USER_DIR = {users!r}
+PRIVATE = False
+WTF_CSRF_ENABLED = False
+'''
+
+
+def page_url(number):
+    # a few directories, like a real wiki
+    if number % 10 == 0:
+        return 'page_{0}'.format(number)
+    return 'section_{0}/page_{1}'.format(number % 7, number)
+
+
+def sentence(rnd, words):
+    text = ' '.join(rnd.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def make_page(rnd, number, pages, words=300, links=5, tags=3, tag_count=40,
+              code_blocks=1):
+    """
+        Returns the content of one page.
+
+        :param int number: the number of the page
+        :param int pages: the number of pages in the corpus, links point
+            to pages below it (and about one in twenty beyond it, broken)
+        :param int words: approximate number of words in the body
+        :param int links: wikilinks per page
+        :param int tags: tags per page
+        :param int tag_count: size of the tag vocabulary
+        :param int code_blocks: fenced code blocks per page
+    """
+    page_tags = sorted(set('tag{0}'.format(rnd.randrange(tag_count))
+                           for _ in range(tags)))
+    blocks = []
+    written = 0
+    while written < words:
+        length = rnd.randint(20, 60)
+        blocks.append(' '.join(sentence(rnd, rnd.randint(5, 12))
+                               for _ in range(length // 8 + 1)))
+        written += length
+    for i in range(links):
+        target = rnd.randrange(pages + pages // 20 + 1)
+        link = '[[{0}]]'.format(page_url(target))
+        if i % 2:
+            link = '[[{0}|{1}]]'.format(page_url(target), rnd.choice(WORDS))
+        paragraph = rnd.randrange(len(blocks))
+        blocks[paragraph] = '{0} See {1}.'.format(blocks[paragraph], link)
+    for i in range(code_blocks):
+        blocks.insert(rnd.randrange(len(blocks) + 1),
+                      CODE.format(number * 10 + i))
+    if number % 5 == 0:
+        blocks.append(TABLE.format(rnd.choice(WORDS), rnd.choice(WORDS)))
+    blocks.insert(0, '## {0}'.format(sentence(rnd, 3)[:-1]))
+    meta = 'title: Page {0} {1}\ntags: {2}\n'.format(
+        number, rnd.choice(WORDS), ', '.join(page_tags))
+    return meta + '\n' + '\n\n'.join(blocks) + '\n'
+
+
+def generate(directory, pages=500, seed=0, **options):
+    """
+        Writes a synthetic wiki to `directory`.
+
+        :param str directory: created if it does not exist, the pages go
+            into its ``content`` subdirectory
+        :param int pages: number of pages
+        :param int seed: seed of the random generator
+        :param options: passed on to :func:`make_page`
+
+        :returns: the content directory
+        :rtype: str
+    """
+    directory = os.path.abspath(directory)
+    content = os.path.join(directory, 'content')
+    users = os.path.join(directory, 'user')
+    os.makedirs(content, exist_ok=True)
+    os.makedirs(users, exist_ok=True)
+    rnd = random.Random(seed)
+    for number in range(pages):
+        path = os.path.join(content, page_url(number) + '.md')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(make_page(rnd, number, pages, **options))
+    with open(os.path.join(content, 'config.py'), 'w') as f:
+        f.write(CONFIG.format(content=content, users=users))
+    with open(os.path.join(users, 'users.json'), 'w') as f:
+        json.dump({}, f)
+    return content
+
+
+def add_arguments(parser):
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--words', type=int, default=300,
+                        help='approximate words per page')
+    parser.add_argument('--links', type=int, default=5,
+                        help='wikilinks per page')
+    parser.add_argument('--tags', type=int, default=3,
+                        help='tags per page')
+    parser.add_argument('--tag-count', type=int, default=40,
+                        help='size of the tag vocabulary')
+    parser.add_argument('--code-blocks', type=int, default=1,
+                        help='fenced code blocks per page')
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def options(args):
+    return {
+        'pages': args.pages,
+        'words': args.words,
+        'links': args.links,
+        'tags': args.tags,
+        'tag_count': args.tag_count,
+        'code_blocks': args.code_blocks,
+        'seed': args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('directory')
+    add_arguments(parser)
+    args = parser.parse_args()
+    print(generate(args.directory, **options(args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Micro-benchmark comparing a freshly built Markdown engine per render (the
+old behaviour of :class:`wiki.core.Processor`) against the thread-local
+engine that is now reused between renders.
+
+run with python benchmarks/markdown_engine.py from the Riki directory
+"""
+import os
+import sys
+import timeit
+
+import markdown
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from wiki.core import MARKDOWN_EXTENSIONS, Processor  # noqa: E402
+
+PAGE = '''title: Benchmark
+tags: bench, markdown
+
+A *small* page with a [link](http://example.com) and some `code`.
+
+```python
+print("hello")
+```
+
+| a | b |
+|---|---|
+| 1 | 2 |
+'''
+
+
+def fresh_engine():
+    md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    md.convert(PAGE)
+
+
+def pooled_processor():
+    Processor(PAGE).process()
+
+
+def measure(func, number):
+    best = min(timeit.repeat(func, number=number, repeat=5))
+    return best / number * 1e6
+
+
+def main(number=200):
+    before = measure(fresh_engine, number)
+    after = measure(pooled_processor, number)
+    print('fresh engine per render:  {:8.1f} us'.format(before))
+    print('reused engine per render: {:8.1f} us'.format(after))
+    print('speedup:                  {:8.1f}x'.format(before / after))
+
+
+if __name__ == '__main__':
+    main()
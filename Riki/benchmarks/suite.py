@@ -0,0 +1,311 @@
+"""
+Benchmark suite for the wiki. Generates a synthetic corpus (see
+benchmarks/corpus.py) and times the core (Processor, Wiki listings,
+tags and search), the converters and the main routes through the
+Flask test client.
+
+The results are written as JSON, one entry per benchmark with the best,
+median and mean time per call in seconds. Pass an earlier result file
+with --compare to see the ratios and have regressions reported; the exit
+status is 1 if any benchmark got slower than --threshold allows.
+
+run with python benchmarks/suite.py [--pages N] [-o results.json]
+[--compare baseline.json] from the Riki directory
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchmarks import corpus  # noqa: E402
+from wiki.core import Page, Processor, Wiki, render_cache  # noqa: E402
+from wiki.web import create_app  # noqa: E402
+from wiki.web import workers  # noqa: E402
+from wiki.web.conversions import ConversionCache  # noqa: E402
+from wiki.web.converter import Converter  # noqa: E402
+
+SEARCH_TERMS = ['wiki', 'render cache', '"flask server"', 'tok*', 'Python']
+
+
+class Suite(object):
+    """
+        Collects the benchmarks and runs them against one corpus.
+
+        :param str content: the content directory of the corpus
+        :param int repeat: timing runs per benchmark, the best is reported
+        :param float min_time: each run calls a benchmark often enough to
+            take at least this many seconds
+        :param str select: only run benchmarks whose name contains this
+    """
+
+    def __init__(self, content, repeat=5, min_time=0.2, select=None):
+        self.content = content
+        self.repeat = repeat
+        self.min_time = min_time
+        self.select = select
+        self.results = {}
+
+    def selected(self, name):
+        return not self.select or self.select in name
+
+    def time(self, name, func, number=None):
+        """Times `func`, a function without arguments."""
+        if not self.selected(name):
+            return
+        if number is None:
+            # calibrate like timeit's autorange, to about min_time a run
+            number = 1
+            while True:
+                elapsed = timeit.timeit(func, number=number)
+                if elapsed >= self.min_time or number >= 1e6:
+                    break
+                number *= 10 if elapsed < self.min_time / 10 else 2
+        runs = [elapsed / number for elapsed in
+                timeit.repeat(func, number=number, repeat=self.repeat)]
+        self.results[name] = {
+            'best': min(runs),
+            'median': statistics.median(runs),
+            'mean': statistics.mean(runs),
+            'number': number,
+            'repeat': self.repeat,
+        }
+        print('{:<40} {:>12.3f} ms'.format(name, min(runs) * 1e3),
+              file=sys.stderr)
+
+    def sample(self, wiki, count=50):
+        pages = wiki.index()
+        return random.Random(0).sample(pages, min(count, len(pages)))
+
+    def run(self):
+        self.bench_index_build()
+        app = create_app(self.content)
+        app.config['TESTING'] = True
+        wiki = Wiki(self.content)
+        try:
+            pages = self.sample(wiki)
+            # wikilinks are rendered with url_for
+            with app.test_request_context():
+                self.bench_processor(pages)
+                self.bench_wiki(wiki)
+                self.bench_converters(wiki, pages)
+            self.bench_routes(app, pages)
+        finally:
+            wiki.close()
+            workers.shutdown(app)
+            watcher = app.extensions.get('watcher')
+            if watcher is not None:
+                watcher.stop()
+        return self.results
+
+    def bench_index_build(self):
+        path = os.path.join(self.content, Wiki.INDEX_FILE)
+
+        def build():
+            if os.path.exists(path):
+                os.remove(path)
+            Wiki(self.content).close()
+
+        self.time('wiki.build_index', build, number=1)
+        if not os.path.exists(path):
+            build()
+
+    def bench_processor(self, pages):
+        contents = itertools.cycle([page.content for page in pages])
+        self.time('processor.process',
+                  lambda: Processor(next(contents)).process())
+
+    def bench_wiki(self, wiki):
+        self.time('wiki.index', wiki.index)
+        self.time('wiki.get_tags', wiki.get_tags)
+        self.time('wiki.tag_counts', wiki.tag_counts)
+        tag = max(wiki.tag_counts().items(), key=lambda item: item[1])[0]
+        self.time('wiki.index_by_tag', lambda: wiki.index_by_tag(tag))
+        for term in SEARCH_TERMS:
+            self.time('wiki.search[{0}]'.format(term),
+                      lambda term=term: wiki.search(term))
+        self.time('wiki.search[Python, case sensitive]',
+                  lambda: wiki.search('Python', ignore_case=False))
+
+    def bench_converters(self, wiki, pages):
+        pages = [wiki.get(page.url) for page in pages[:5]]
+        for method in sorted(name for name in dir(Converter)
+                             if name.startswith('convert_to_')):
+            # cold: a page read from disk and rendered for the conversion,
+            # as the first download of a page version does
+            cold = itertools.cycle(pages)
+
+            def convert_cold(method=method, cold=cold):
+                page = next(cold)
+                render_cache.clear()
+                getattr(Converter(Page(page.path, page.url, lazy=True)),
+                        method)()
+
+            self.time('converter.{0}[cold]'.format(method), convert_cold)
+            # cached: pages that hold their content and html already, only
+            # the conversion itself is left
+            converters = itertools.cycle([Converter(page) for page in pages])
+            self.time('converter.{0}[cached]'.format(method),
+                      lambda method=method, converters=converters:
+                      getattr(next(converters), method)())
+
+    def bench_routes(self, app, pages):
+        client = app.test_client()
+        # in memory only, so the cold runs below convert every time
+        conversions = app.extensions['conversions'] = ConversionCache(
+            directory=None)
+        urls = itertools.cycle([page.url for page in pages])
+        contents = itertools.cycle([page.content for page in pages])
+        tags = itertools.cycle(sorted(
+            {tag.strip() for page in pages for tag in page.tags.split(',')
+             if tag.strip()}))
+
+        def get(path, status=200, **kwargs):
+            response = client.get(path, **kwargs)
+            assert response.status_code == status, (path, response.status_code)
+            # stream the whole body like a browser would
+            response.get_data()
+
+        def post(path, status=(200,), **kwargs):
+            response = client.post(path, **kwargs)
+            assert response.status_code in status, (path, response.status_code)
+            response.get_data()
+
+        etags = {url: client.get('/{0}/'.format(url)).get_etag()[0]
+                 for url in set(page.url for page in pages)}
+
+        def revalidate():
+            url = next(urls)
+            get('/{0}/'.format(url), status=304,
+                headers={'If-None-Match': '"{0}"'.format(etags[url])})
+
+        routes = [
+            ('route.home', lambda: get('/')),
+            ('route.index', lambda: get('/index/')),
+            ('route.display', lambda: get('/{0}/'.format(next(urls)))),
+            ('route.display_cold', lambda: (
+                render_cache.clear(), get('/{0}/'.format(next(urls))))),
+            ('route.display_not_modified', revalidate),
+            ('route.tags', lambda: get('/tags/')),
+            ('route.tag', lambda: get('/tag/{0}/'.format(next(tags)))),
+            ('route.search', lambda: post(
+                '/search/', data={'term': 'render cache', 'ignore_case': 'y'})),
+            ('route.preview', lambda: post(
+                '/preview/', data={'body': next(contents)})),
+            ('route.links', lambda: get('/links/{0}/'.format(next(urls)))),
+            ('route.download_txt[cached]', lambda: get(
+                '/download/{0}/?fileType=txt'.format(next(urls)))),
+            ('route.download_html[cached]', lambda: get(
+                '/download/{0}/?fileType=html'.format(next(urls)))),
+            ('route.download_html[cold]', lambda: (
+                render_cache.clear(), conversions.clear(), get(
+                    '/download/{0}/?fileType=html'.format(next(urls))))),
+            # a job that is not done within CONVERSION_WAIT answers 202
+            ('route.convert_pdf', lambda: post(
+                '/convert/{0}/'.format(next(urls)), status=(200, 202),
+                json={'fileType': 'pdf'})),
+        ]
+        for name, func in routes:
+            self.time(name, func)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """
+        Prints the ratio of every benchmark to the baseline.
+
+        :returns: the names of the benchmarks that got slower by more
+            than `threshold` (0.1 is 10%)
+        :rtype: list
+    """
+    regressions = []
+    old = baseline['results']
+    print('{:<40} {:>12} {:>12} {:>8}'.format(
+        'benchmark', 'before ms', 'after ms', 'ratio'), file=sys.stderr)
+    for name, result in sorted(results.items()):
+        if name not in old:
+            continue
+        before, after = old[name]['best'], result['best']
+        ratio = after / before if before else float('inf')
+        mark = ''
+        if ratio > 1 + threshold:
+            regressions.append(name)
+            mark = ' slower'
+        print('{:<40} {:>12.3f} {:>12.3f} {:>8.2f}{}'.format(
+            name, before * 1e3, after * 1e3, ratio, mark), file=sys.stderr)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    corpus.add_arguments(parser)
+    parser.add_argument('--directory',
+                        help='keep the corpus here instead of a temporary '
+                             'directory (it is reused if it exists)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='seconds per timing run')
+    parser.add_argument('-k', dest='select',
+                        help='only run benchmarks whose name contains this')
+    parser.add_argument('-o', '--output', help='write the JSON here')
+    parser.add_argument('--compare', help='JSON of an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='slowdown reported as regression (0.1 is 10%%)')
+    args = parser.parse_args()
+
+    options = corpus.options(args)
+    directory = args.directory or tempfile.mkdtemp(prefix='riki-bench-')
+    try:
+        content = os.path.join(directory, 'content')
+        if not os.path.exists(os.path.join(content, 'config.py')):
+            corpus.generate(directory, **options)
+        suite = Suite(content, args.repeat, args.min_time, args.select)
+        results = suite.run()
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory)
+
+    report = {
+        'revision': git_revision(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'corpus': options,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('regressions: ' + ', '.join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
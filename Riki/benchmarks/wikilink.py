@@ -0,0 +1,70 @@
+"""
+Benchmark of the wikilink postprocessor on link heavy pages. The previous
+implementation re-scanned the whole document for every link, so its cost
+per link grows with the number of links; the single pass version should
+stay flat.
+
+run with python benchmarks/wikilink.py from the Riki directory
+"""
+import os
+import re
+import sys
+import timeit
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from wiki.core import clean_url, wikilink  # noqa: E402
+
+
+def url_formatter(endpoint, url):
+    return '/' + url + '/'
+
+
+def legacy_wikilink(text, url_formatter=url_formatter):
+    link_regex = re.compile(
+        r"((?<!\<code\>)\[\[([^<].+?) \s*([|] \s* (.+?) \s*)?]])",
+        re.X | re.U
+    )
+    for i in link_regex.findall(text):
+        title = [i[-1] if i[-1] else i[1]][0]
+        url = clean_url(i[1])
+        html_url = "<a href='{0}'>{1}</a>".format(
+            url_formatter('wiki.display', url=url),
+            title
+        )
+        text = re.sub(link_regex, html_url, text, count=1)
+    return text
+
+
+def make_page(links):
+    # a few distinct targets, like real pages that link the same pages
+    # over and over again
+    return '\n'.join(
+        '<p>Text around [[Page {0}|a link]] and more.</p>'.format(i % 50)
+        for i in range(links))
+
+
+def measure(func, text, number):
+    best = min(timeit.repeat(lambda: func(text, url_formatter),
+                             number=number, repeat=3))
+    return best / number
+
+
+def main():
+    print('{:>6} {:>14} {:>14} {:>14}'.format(
+        'links', 'legacy ms', 'single ms', 'single us/link'))
+    for links in (1000, 2000, 4000, 8000, 16000):
+        text = make_page(links)
+        single = measure(wikilink, text, 5)
+        # the legacy version takes minutes on the larger pages
+        if links <= 2000:
+            assert legacy_wikilink(text) == wikilink(text, url_formatter)
+            legacy = '{:>14.1f}'.format(
+                measure(legacy_wikilink, text, 1) * 1e3)
+        else:
+            legacy = '{:>14}'.format('-')
+        print('{:>6} {} {:>14.1f} {:>14.2f}'.format(
+            links, legacy, single * 1e3, single / links * 1e6))
+
+
+if __name__ == '__main__':
+    main()
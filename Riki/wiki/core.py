@@ -4,13 +4,57 @@
 """
 from collections import OrderedDict
 from io import open
+import hashlib
 import os
 import re
+import threading
 
 from flask import abort
 from flask import url_for
 import markdown
 
+from wiki.events import ChangeEvent
+from wiki.events import ChangeLog
+from wiki.events import CREATED
+from wiki.events import DELETED
+from wiki.events import MODIFIED
+from wiki.events import MOVED
+from wiki.index import IndexEntry
+from wiki.index import PageIndex
+from wiki.links import LinkGraph
+from wiki.search import clause_regex
+from wiki.search import parse_query
+from wiki.search import SearchIndex
+
+
+#: The Python-Markdown extensions every page is rendered with.
+MARKDOWN_EXTENSIONS = [
+    'codehilite',
+    'fenced_code',
+    'meta',
+    'tables'
+]
+
+_engines = threading.local()
+
+
+def markdown_engine():
+    """
+        Returns the Markdown instance of the current thread.
+
+        Loading the extensions costs more than converting a typical
+        page, so every thread builds its engine once and then reuses it.
+        Callers have to :meth:`~markdown.Markdown.reset` it before each
+        conversion.
+
+        :returns: the thread's markdown engine
+        :rtype: markdown.Markdown
+    """
+    md = getattr(_engines, 'md', None)
+    if md is None:
+        md = _engines.md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    return md
+
 
 def clean_url(url):
     """
@@ -31,7 +75,13 @@ def clean_url(url):
     return url
 
 
-def wikilink(text, url_formatter=None):
+LINK_RE = re.compile(
+    r"((?<!\<code\>)\[\[([^<].+?) \s*([|] \s* (.+?) \s*)?]])",
+    re.X | re.U
+)
+
+
+def wikilink(text, url_formatter=None, batch_formatter=None):
     """
         Processes Wikilink syntax "[[Link]]" within the html body.
         This is intended to be run after content has been processed
@@ -40,6 +90,10 @@ def wikilink(text, url_formatter=None):
         :param str text: the html to highlight wiki links in.
         :param function url_formatter: which URL formatter to use,
             will by default use the flask url formatter
+        :param function batch_formatter: if given, it is called once
+            with the list of all (cleaned) link targets of the page and
+            has to return a mapping of those to their URLs. It takes
+            precedence over `url_formatter`.
 
         Syntax:
             This accepts Wikilink syntax in the form of [[WikiLink]] or
@@ -52,19 +106,66 @@ def wikilink(text, url_formatter=None):
     """
     if url_formatter is None:
         url_formatter = url_for
-    link_regex = re.compile(
-        r"((?<!\<code\>)\[\[([^<].+?) \s*([|] \s* (.+?) \s*)?]])",
-        re.X | re.U
-    )
-    for i in link_regex.findall(text):
-        title = [i[-1] if i[-1] else i[1]][0]
-        url = clean_url(i[1])
-        html_url = "<a href='{0}'>{1}</a>".format(
-            url_formatter('wiki.display', url=url),
-            title
-        )
-        text = re.sub(link_regex, html_url, text, count=1)
-    return text
+    # every target is only cleaned and turned into a URL once per page
+    hrefs = {}
+    if batch_formatter is not None:
+        targets = {match.group(2) for match in LINK_RE.finditer(text)}
+        if not targets:
+            return text
+        urls = {target: clean_url(target) for target in targets}
+        formatted = batch_formatter(sorted(set(urls.values())))
+        hrefs = {target: formatted[url] for target, url in urls.items()}
+
+    def replace(match):
+        target = match.group(2)
+        href = hrefs.get(target)
+        if href is None:
+            href = hrefs[target] = url_formatter(
+                'wiki.display', url=clean_url(target))
+        return "<a href='{0}'>{1}</a>".format(
+            href, match.group(4) or target)
+
+    return LINK_RE.sub(replace, text)
+
+
+CODE_SPAN_RE = re.compile(r'(`+)[^\n]+?\1')
+
+
+def wikilinks(text):
+    """
+        Finds the targets of the wikilinks in a page's markdown source,
+        using the same pattern as :func:`wikilink` so no rendering is
+        needed. Links inside inline code spans are not links.
+
+        :param str text: the markdown source
+
+        :returns: the cleaned urls of all link targets
+        :rtype: list
+    """
+    text = CODE_SPAN_RE.sub('', text)
+    return sorted({clean_url(match.group(2))
+                   for match in LINK_RE.finditer(text)})
+
+
+def read_meta(path):
+    """
+        Reads only the metadata block of a page file, i.e. everything
+        up to the first blank line, without touching the body.
+
+        :param str path: the page file to read
+
+        :returns: the metadata, keys are lowercased like the ones
+            :class:`Processor` produces
+        :rtype: OrderedDict
+    """
+    meta = OrderedDict()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                break
+            key, _, value = line.partition(':')
+            meta[key.strip().lower()] = value.strip()
+    return meta
 
 
 class Processor(object):
@@ -85,12 +186,7 @@ class Processor(object):
 
             :param str text: the text to process
         """
-        self.md = markdown.Markdown(extensions=[
-            'codehilite',
-            'fenced_code',
-            'meta',
-            'tables'
-        ])
+        self.md = markdown_engine()
         self.input = text
         self.markdown = None
         self.meta_raw = None
@@ -113,14 +209,14 @@ class Processor(object):
         """
             Convert to HTML.
         """
-        self.html = self.md.convert(self.pre)
+        self.html = self.md.reset().convert(self.pre)
 
 
     def split_raw(self):
         """
             Split text into raw meta and content.
         """
-        self.meta_raw, self.markdown = self.pre.split('\n\n', 1)
+        self.meta_raw, _, self.markdown = self.pre.partition('\n\n')
 
     def process_meta(self):
         """
@@ -164,12 +260,141 @@ class Processor(object):
         return self.final, self.markdown, self.meta
 
 
+class RenderCache(object):
+    """
+        A process-wide LRU cache for the output of :meth:`Processor.process`.
+
+        Entries are keyed by page path and remember the modification time
+        and size of the file they were rendered from, as well as a hash of
+        its content. A lookup is a hit when the file still has the same
+        mtime and size or, failing that, when the content hashes to the
+        same digest (e.g. after a ``touch`` or a checkout that rewrote an
+        unchanged file).
+    """
+
+    def __init__(self, maxsize=512):
+        """
+            Initialization of the cache.
+
+            :param int maxsize: the maximum number of rendered pages to
+                keep, the least recently used one is evicted first
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def digest(content):
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def get(self, path, content, stat=None):
+        """
+            Looks up the rendered version of a page.
+
+            :param str path: the path of the page file
+            :param str content: the raw content that was read from `path`
+            :param stat: the result of ``os.stat`` taken before `content`
+                was read, if available
+
+            :returns: a ``(html, body, meta)`` tuple or `None` on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                mtime, size, digest, result = entry
+                if stat is not None and \
+                        (stat.st_mtime_ns, stat.st_size) == (mtime, size):
+                    hit = True
+                else:
+                    hit = self.digest(content) == digest
+                    if hit and stat is not None:
+                        self._entries[path] = (
+                            stat.st_mtime_ns, stat.st_size, digest, result)
+                if hit:
+                    self._entries.move_to_end(path)
+                    self.hits += 1
+                    html, body, meta = result
+                    return html, body, OrderedDict(meta)
+            self.misses += 1
+            return None
+
+    def set(self, path, content, result, stat=None):
+        """
+            Stores the rendered version of a page.
+
+            :param str path: the path of the page file
+            :param str content: the raw content that was rendered
+            :param tuple result: the ``(html, body, meta)`` tuple returned
+                by :meth:`Processor.process`
+            :param stat: the result of ``os.stat`` taken before `content`
+                was read, if available
+        """
+        html, body, meta = result
+        if stat is not None:
+            mtime, size = stat.st_mtime_ns, stat.st_size
+        else:
+            mtime, size = None, None
+        entry = (mtime, size, self.digest(content),
+                 (html, body, OrderedDict(meta)))
+        with self._lock:
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def invalidate(self, *events):
+        """
+            Drops the pages touched by :class:`wiki.events.ChangeEvent`
+            objects, meant to be subscribed to a
+            :class:`wiki.events.ChangeFeed`.
+        """
+        for event in events:
+            self.discard(event.path)
+            if event.dest_path is not None:
+                self.discard(event.dest_path)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+render_cache = RenderCache()
+
+
 class Page(object):
-    def __init__(self, path, url, new=False):
+    def __init__(self, path, url, new=False, wiki=None, lazy=False):
+        """
+            :param str path: the page file
+            :param str url: the url of the page
+            :param bool new: the page does not exist on disk yet
+            :param wiki: the wiki the page belongs to, it is notified
+                when the page gets saved
+            :param bool lazy: do not read the page up front. The
+                metadata block is read on first access, the content is
+                only loaded and rendered when body or html are needed.
+        """
         self.path = path
         self.url = url
+        self.wiki = wiki
         self._meta = OrderedDict()
-        if not new:
+        self._stat = None
+        self._content = None
+        self._body = None
+        self._html = None
+        if lazy:
+            self._meta = None
+        elif not new:
             self.load()
             self.render()
 
@@ -178,18 +403,49 @@ class Page(object):
 
     def load(self):
         with open(self.path, 'r', encoding='utf-8') as f:
-            self.content = f.read()
+            # stat before reading, so a concurrent write can at worst
+            # make the cache fall back to comparing content hashes
+            self._stat = os.fstat(f.fileno())
+            self._content = f.read()
+
+    @property
+    def content(self):
+        if self._content is None:
+            self.load()
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
 
     def render(self):
-        processor = Processor(self.content)
-        self._html, self.body, self._meta = processor.process()
+        result = render_cache.get(self.path, self.content, self._stat)
+        if result is None:
+            processor = Processor(self.content)
+            result = processor.process()
+            render_cache.set(self.path, self.content, result, self._stat)
+        self._html, self._body, self._meta = result
+
+    @property
+    def body(self):
+        if self._body is None:
+            # splitting off the metadata needs no markdown rendering
+            processor = Processor(self.content)
+            processor.process_pre()
+            processor.split_raw()
+            self._body = processor.markdown
+        return self._body
+
+    @body.setter
+    def body(self, value):
+        self._body = value
 
     def save(self, update=True):
         folder = os.path.dirname(self.path)
         if not os.path.exists(folder):
             os.makedirs(folder)
         with open(self.path, 'w', encoding='utf-8') as f:
-            for key, value in list(self._meta.items()):
+            for key, value in list(self.meta.items()):
                 line = '%s: %s\n' % (key, value)
                 f.write(line)
             f.write('\n')
@@ -197,19 +453,25 @@ class Page(object):
         if update:
             self.load()
             self.render()
+        if self.wiki is not None:
+            self.wiki.page_saved(self)
 
     @property
     def meta(self):
+        if self._meta is None:
+            self._meta = read_meta(self.path)
         return self._meta
 
     def __getitem__(self, name):
-        return self._meta[name]
+        return self.meta[name]
 
     def __setitem__(self, name, value):
-        self._meta[name] = value
+        self.meta[name] = value
 
     @property
     def html(self):
+        if self._html is None:
+            self.render()
         return self._html
 
     def __html__(self):
@@ -237,12 +499,49 @@ class Page(object):
     def tags(self, value):
         self['tags'] = value
 
+    @property
+    def links(self):
+        return wikilinks(self.body)
+
     def get_path(self):
         return self.path
 
 class Wiki(object):
-    def __init__(self, root):
+    #: name of the page index database inside the content directory
+    INDEX_FILE = '.index.sqlite'
+
+    def __init__(self, root, index_path=None, changes=None):
+        """
+            :param str root: the content directory
+            :param str index_path: where to keep the page index, by
+                default in :attr:`INDEX_FILE` inside `root`
+            :param changes: a :class:`wiki.events.ChangeFeed` that is told
+                about every change once the indexes are up to date
+        """
         self.root = root
+        self.changes = changes
+        if index_path is None:
+            if os.path.isdir(root):
+                index_path = os.path.join(root, self.INDEX_FILE)
+            else:
+                # there is nothing to index (yet), the content directory
+                # is only created once the first page gets saved
+                index_path = ':memory:'
+        self.page_index = PageIndex(index_path)
+        self.search_index = SearchIndex(self.page_index.db)
+        self.link_graph = LinkGraph(self.page_index.db)
+        self.change_log = ChangeLog(self.page_index.db)
+        # a new database (or a new table in an old one) has to be filled
+        # from every page on disk
+        self.reindexed = (self.page_index.created or
+                          self.page_index.upgraded or
+                          self.search_index.created or
+                          self.link_graph.created)
+        if self.reindexed:
+            self.reconcile(full=True)
+
+    def close(self):
+        self.page_index.close()
 
     def path(self, url):
         return os.path.join(self.root, url + '.md')
@@ -255,7 +554,7 @@ class Wiki(object):
         path = self.path(url)
         #path = os.path.join(self.root, url + '.md')
         if self.exists(url):
-            return Page(path, url)
+            return Page(path, url, wiki=self)
         return None
 
     def get_or_404(self, url):
@@ -268,7 +567,7 @@ class Wiki(object):
         path = self.path(url)
         if self.exists(url):
             return False
-        return Page(path, url, new=True)
+        return Page(path, url, new=True, wiki=self)
 
     def move(self, url, newurl):
         source = os.path.join(self.root, url) + '.md'
@@ -290,35 +589,219 @@ class Wiki(object):
         if not os.path.exists(folder):
             os.makedirs(folder)
         os.rename(source, target)
+        self.apply(ChangeEvent(MOVED, clean_url(url), source,
+                               clean_url(newurl), target))
 
     def delete(self, url):
         path = self.path(url)
         if not self.exists(url):
             return False
         os.remove(path)
+        self.apply(ChangeEvent(DELETED, clean_url(url), path))
         return True
 
-    def index(self):
+    def page_saved(self, page):
         """
-            Builds up a list of all the available pages.
+            Updates the indexes after `page` was written to disk.
+
+            :param page: the saved page
+            :type page: :class:`Page`
+        """
+        self.apply(ChangeEvent(MODIFIED, clean_url(page.url), page.path))
+
+    def apply(self, *events):
+        """
+            Updates the page, tag and search indexes for the given
+            changes, records them in the :attr:`change_log` and then
+            publishes them to :attr:`changes`.
+            Pages whose file still has the indexed mtime and size are
+            not read again, so applying an event twice is cheap.
+
+            :param events: :class:`wiki.events.ChangeEvent` objects
+        """
+        removed = []
+        changed = OrderedDict()
+        for event in events:
+            if event.kind in (DELETED, MOVED):
+                removed.append(event.url)
+                changed.pop(event.url, None)
+            if event.kind == MOVED:
+                changed[event.dest_url] = event.dest_path
+            elif event.kind in (CREATED, MODIFIED):
+                changed[event.url] = event.path
+        pages = []
+        for url, path in changed.items():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # gone again, the deletion is reported separately
+                continue
+            entry = self.page_index.get(url)
+            if entry is None or entry.path != path or \
+                    (entry.mtime, entry.size) != (stat.st_mtime_ns,
+                                                  stat.st_size):
+                pages.append(Page(path, url, lazy=True))
+        self._remove_from_indexes(
+            *[url for url in removed if url not in changed])
+        self._update_indexes(*pages)
+        if events:
+            self.change_log.record(*events)
+        if self.changes is not None:
+            self.changes.publish(*events)
+
+    def _update_indexes(self, *pages):
+        entries = []
+        documents = []
+        links = []
+        for page in pages:
+            url = clean_url(page.url)
+            digest = RenderCache.digest(page.content)
+            # taken when the content was read, see Page.load
+            stat = page._stat
+            entries.append(IndexEntry(url, page.path, page.title, page.tags,
+                                      stat.st_mtime_ns, stat.st_size,
+                                      digest))
+            documents.append((url, {'title': page.title,
+                                    'tags': page.tags,
+                                    'body': page.body}))
+            links.append((url, page.links))
+        self.page_index.update(*entries)
+        self.search_index.update(*documents)
+        self.link_graph.update(*links)
+
+    def _remove_from_indexes(self, *urls):
+        self.page_index.remove(*urls)
+        self.search_index.remove(*urls)
+        self.link_graph.remove(*urls)
+
+    def backlinks(self, url):
+        """
+            Get the pages that link to `url`, sorted by title.
 
-            :returns: a list of all the wiki pages
             :rtype: list
         """
+        urls = self.link_graph.backlinks(clean_url(url))
+        return [self._page(entry) for entry in self.page_index.entries(urls)]
+
+    def version(self, url):
+        """
+            Identifies the current version of a page as displayed, i.e.
+            its content and the pages linking to it, from a stat and the
+            indexes alone.
+
+            :returns: ``(digest, mtime, backlinks)`` with a hex digest,
+                the latest modification time (in seconds) of the page
+                and its backlinks and the backlinks as lazy pages, or
+                `None` if the page is not indexed or was changed since
+            :rtype: tuple
+        """
+        path = self.path(url)
+        entry = self.page_index.get(clean_url(url))
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if entry is None or not entry.digest or entry.path != path or \
+                (entry.mtime, entry.size) != (stat.st_mtime_ns, stat.st_size):
+            return None
+        backlinks = self.page_index.entries(
+            self.link_graph.backlinks(entry.url))
+        digest = hashlib.sha1(entry.digest.encode('ascii'))
+        for linking in backlinks:
+            digest.update('\0{0}\0{1}'.format(
+                linking.url, linking.title).encode('utf-8'))
+        mtime = max([entry.mtime] + [linking.mtime for linking in backlinks])
+        return (digest.hexdigest(), mtime / 1e9,
+                [self._page(linking) for linking in backlinks])
+
+    def links(self, url):
+        """
+            Get the outgoing links of a page from the link graph.
+
+            :returns: a dictionary with the sorted urls of the pages it
+                links to (``outgoing``), that link to it (``backlinks``)
+                and of the link targets that do not exist (``broken``)
+            :rtype: dict
+        """
+        url = clean_url(url)
+        return {
+            'url': url,
+            'outgoing': self.link_graph.outgoing(url),
+            'backlinks': self.link_graph.backlinks(url),
+            'broken': [target for _, target in self.link_graph.broken(url)],
+        }
+
+    def walk(self):
+        """
+            Walks the content directory.
+
+            :returns: an iterator over ``(url, path)`` of every page
+                file on disk
+        """
         # make sure we always have the absolute path for fixing the
         # walk path
-        pages = []
         root = os.path.abspath(self.root)
         for cur_dir, _, files in os.walk(root):
             # get the url of the current directory
             cur_dir_url = cur_dir[len(root)+1:]
             for cur_file in files:
-                path = os.path.join(cur_dir, cur_file)
                 if cur_file.endswith('.md'):
+                    path = os.path.join(cur_dir, cur_file)
                     url = clean_url(os.path.join(cur_dir_url, cur_file[:-3]))
-                    page = Page(path, url)
-                    pages.append(page)
-        return sorted(pages, key=lambda x: x.title.lower())
+                    yield url, path
+
+    def reconcile(self, full=False):
+        """
+            Brings the indexes in line with the content directory.
+            Only pages whose mtime or size differ from the indexed values
+            are read again, pages that vanished are dropped.
+
+            :param bool full: read every page again
+        """
+        known = self.page_index.stats()
+        changed = []
+        for url, path in self.walk():
+            stat = os.stat(path)
+            if known.pop(url, None) != (stat.st_mtime_ns, stat.st_size) \
+                    or full:
+                changed.append(Page(path, url, lazy=True))
+            if len(changed) >= 500:
+                self._update_indexes(*changed)
+                changed = []
+        self._update_indexes(*changed)
+        self._remove_from_indexes(*known)
+
+    def _page(self, entry):
+        """
+            Turns an index entry into a lazy page that knows its title and
+            tags without opening the file.
+        """
+        page = Page(entry.path, entry.url, wiki=self, lazy=True)
+        page._meta = OrderedDict([('title', entry.title),
+                                  ('tags', entry.tags)])
+        return page
+
+    def index(self, after=None, before=None, limit=None):
+        """
+            Builds up a list of all the available pages from the page
+            index, sorted by title. The pages are lazy, so listing them
+            does not read or render any page file.
+
+            :param tuple after: only list the pages following this
+                position in the title order (see
+                :func:`wiki.index.position`)
+            :param tuple before: only list the pages preceding it
+            :param int limit: list at most this many pages, the first
+                ones after `after` or the last ones before `before`
+
+            :returns: a list of all the wiki pages
+            :rtype: list
+        """
+        if after is None and before is None and limit is None:
+            entries = self.page_index.entries()
+        else:
+            entries = self.page_index.window(after, before, limit or -1)
+        return [self._page(entry) for entry in entries]
 
     def index_by(self, key):
         """
@@ -359,19 +842,68 @@ class Wiki(object):
                     tags[tag] = [page]
         return tags
 
+    def tag_counts(self):
+        """
+            Get the number of pages per tag from the tag index.
+
+            :rtype: dict
+        """
+        return self.page_index.tag_counts()
+
+    def tags_by_url(self):
+        """
+            Get the tags of every tagged page from the tag index.
+
+            :rtype: dict
+        """
+        return self.page_index.tags_by_url()
+
     def index_by_tag(self, tag):
-        pages = self.index()
-        tagged = []
-        for page in pages:
-            if tag in page.tags:
-                tagged.append(page)
-        return sorted(tagged, key=lambda x: x.title.lower())
+        """
+            Get the pages tagged with exactly `tag`, sorted by title.
 
-    def search(self, term, ignore_case=True, attrs=['title', 'tags', 'body']):
-        pages = self.index()
+            :rtype: list
+        """
+        return [self._page(entry) for entry in self.page_index.tagged(tag)]
+
+    def search(self, term, ignore_case=True, attrs=['title', 'tags', 'body'],
+               regex=False):
+        """
+            Searches the wiki.
+
+            The term is looked up in the full-text index: every word has
+            to appear in the page, quoted words have to appear as a
+            phrase and a trailing ``*`` matches any word starting with
+            what precedes it.
+
+            :param str term: what to search for
+            :param bool ignore_case: whether the search is case insensitive
+            :param list attrs: the page attributes to search in
+            :param bool regex: treat `term` as regular expression instead.
+                This reads every page of the wiki and is therefore slow.
+
+            :returns: the matching pages, sorted by title
+            :rtype: list
+        """
+        if regex:
+            return self.search_regex(term, ignore_case, attrs)
+        urls = self.search_index.query(term, attrs)
+        pages = [self._page(entry) for entry in self.page_index.entries(urls)]
+        if not ignore_case:
+            # the index is case insensitive, the candidates have to be
+            # checked against the pages themselves
+            regexes = [clause_regex(clause, ignore_case=False)
+                       for clause in parse_query(term)]
+            pages = [page for page in pages if all(
+                any(r.search(getattr(page, attr)) for attr in attrs)
+                for r in regexes)]
+        return pages
+
+    def search_regex(self, term, ignore_case=True,
+                     attrs=['title', 'tags', 'body']):
         regex = re.compile(term, re.IGNORECASE if ignore_case else 0)
         matched = []
-        for page in pages:
+        for page in self.index():
             for attr in attrs:
                 if regex.search(getattr(page, attr)):
                     matched.append(page)
@@ -0,0 +1,115 @@
+"""
+    Change events
+    ~~~~~~~~~~~~~
+
+    Changes to pages are described by :class:`ChangeEvent` objects, no
+    matter whether they were made through the wiki or noticed by the
+    :mod:`wiki.watcher`. A :class:`ChangeFeed` hands them on to every cache
+    that needs to know, and a :class:`ChangeLog` carries them to the
+    other processes that serve the same wiki.
+"""
+from collections import namedtuple
+import os
+import threading
+
+
+CREATED = 'created'
+MODIFIED = 'modified'
+DELETED = 'deleted'
+MOVED = 'moved'
+
+#: A change to a page file. Moves carry the new location in `dest_url`
+#: and `dest_path`.
+ChangeEvent = namedtuple('ChangeEvent', 'kind url path dest_url dest_path',
+                         defaults=(None, None))
+
+
+class ChangeFeed(object):
+    """
+        Distributes batches of change events to subscribers.
+    """
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """
+            :param function callback: called with the events of every
+                published batch as positional arguments
+        """
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers.remove(callback)
+
+    def publish(self, *events):
+        if not events:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(*events)
+
+
+class ChangeLog(object):
+    """
+        The most recent change events, kept in the page index database so
+        every process serving the wiki can learn about the changes made by
+        the others and drop what it cached of the affected pages. The
+        indexes themselves are shared and need no such help.
+    """
+
+    #: how many events to keep, a process that falls further behind
+    #: than this misses events
+    KEEP = 1000
+
+    def __init__(self, db):
+        """
+            :param db: the sqlite connection of the page index
+        """
+        self.db = db
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS changes ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " pid INTEGER NOT NULL,"
+                " kind TEXT NOT NULL,"
+                " url TEXT NOT NULL,"
+                " path TEXT NOT NULL,"
+                " dest_url TEXT,"
+                " dest_path TEXT)")
+
+    def last(self):
+        """Returns the id of the latest event, 0 if there is none."""
+        return self.db.execute(
+            "SELECT coalesce(max(id), 0) FROM changes").fetchone()[0]
+
+    def record(self, *events):
+        with self.db:
+            self.db.executemany(
+                "INSERT INTO changes "
+                "(pid, kind, url, path, dest_url, dest_path) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(os.getpid(),) + tuple(event) for event in events])
+            self.db.execute(
+                "DELETE FROM changes WHERE id <= "
+                "(SELECT max(id) FROM changes) - ?", (self.KEEP,))
+
+    def since(self, last):
+        """
+            Returns the events other processes recorded after `last`.
+
+            :returns: the id of the latest event and the events
+            :rtype: tuple
+        """
+        rows = self.db.execute(
+            "SELECT id, pid, kind, url, path, dest_url, dest_path "
+            "FROM changes WHERE id > ? ORDER BY id", (last,)).fetchall()
+        if not rows:
+            return last, []
+        pid = os.getpid()
+        return rows[-1][0], [ChangeEvent(*row[2:]) for row in rows
+                             if row[1] != pid]
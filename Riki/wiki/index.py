@@ -0,0 +1,261 @@
+"""
+    Page index
+    ~~~~~~~~~~
+
+    A persistent catalogue of the wiki's pages and their metadata, so that
+    listings can be answered without opening and rendering every page.
+"""
+from collections import namedtuple
+import sqlite3
+
+
+#: A single row of the page index. `digest` is the sha1 of the page
+#: content (see :meth:`wiki.core.RenderCache.digest`).
+IndexEntry = namedtuple('IndexEntry', 'url path title tags mtime size digest',
+                        defaults=('',))
+
+COLUMNS = 'url, path, title, tags, mtime, size, digest'
+
+
+def split_tags(tags):
+    """
+        Splits the comma separated tags of a page.
+
+        :param str tags: the value of the page's tags metadata
+
+        :returns: the distinct, stripped tags in their original order
+        :rtype: list
+    """
+    split = []
+    for tag in tags.split(','):
+        tag = tag.strip()
+        if tag and tag not in split:
+            split.append(tag)
+    return split
+
+
+def position(entry):
+    """
+        The place of a page in the title order of the index.
+
+        :rtype: tuple
+    """
+    return entry.title.lower(), entry.url
+
+
+class PageIndex(object):
+    """
+        Keeps url, path, title, tags, mtime, size and content digest of
+        every page in a SQLite database.
+
+        Tags are additionally kept as one row per (tag, page), so pages
+        with a given tag and the number of pages per tag can be looked up
+        without going through all pages.
+
+        The index is only a cache of what is on disk: it is updated
+        incrementally whenever a page is saved, moved or deleted through
+        the wiki and reconciled against the content directory by
+        :meth:`wiki.core.Wiki.reconcile`.
+    """
+
+    def __init__(self, path):
+        """
+            Opens (and if necessary creates) the index.
+
+            :param str path: the database file, or ``':memory:'``
+        """
+        self.path = path
+        # a connection is only ever used by one thread, but may be
+        # closed by another one when the application shuts down
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.created = not self._has_table('pages')
+        tags_created = not self._has_table('tags')
+        #: the index was created by an older version and its pages
+        #: have to be read again to fill in the new columns
+        self.upgraded = False
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " url TEXT PRIMARY KEY,"
+                " path TEXT NOT NULL,"
+                " title TEXT NOT NULL,"
+                " sort_key TEXT NOT NULL,"
+                " tags TEXT NOT NULL,"
+                " mtime INTEGER NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " digest TEXT NOT NULL DEFAULT '')")
+            if not self.created and not self._has_column('pages', 'digest'):
+                self.db.execute("ALTER TABLE pages "
+                                "ADD COLUMN digest TEXT NOT NULL DEFAULT ''")
+                self.upgraded = True
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS pages_by_title "
+                "ON pages (sort_key, url)")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS tags ("
+                " tag TEXT NOT NULL,"
+                " url TEXT NOT NULL,"
+                " PRIMARY KEY (tag, url)) WITHOUT ROWID")
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS tags_by_url ON tags (url)")
+        if tags_created and not self.created:
+            # an index from before tags were tracked separately
+            self._update_tags(self.entries())
+
+    def _has_table(self, name):
+        row = self.db.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'table' AND name = ?", (name,)).fetchone()
+        return row is not None
+
+    def _has_column(self, table, name):
+        return any(row[1] == name for row in
+                   self.db.execute("PRAGMA table_info(%s)" % table))
+
+    def close(self):
+        self.db.close()
+
+    def __len__(self):
+        return self.db.execute("SELECT count(*) FROM pages").fetchone()[0]
+
+    def get(self, url):
+        row = self.db.execute(
+            "SELECT " + COLUMNS + " FROM pages WHERE url = ?",
+            (url,)).fetchone()
+        if row is None:
+            return None
+        return IndexEntry(*row)
+
+    def entries(self, urls=None):
+        """
+            Returns pages ordered by (case insensitive) title.
+
+            :param urls: only return the pages with these urls, all
+                pages if not given
+
+            :rtype: list of :class:`IndexEntry`
+        """
+        query = "SELECT " + COLUMNS + ", sort_key FROM pages"
+        if urls is None:
+            rows = self.db.execute(query + " ORDER BY sort_key, url")
+            return [IndexEntry(*row[:-1]) for row in rows]
+        urls = list(urls)
+        rows = []
+        # stay below sqlite's limit of host parameters per statement
+        for start in range(0, len(urls), 500):
+            chunk = urls[start:start + 500]
+            rows.extend(self.db.execute(
+                query + " WHERE url IN (%s)" % ', '.join('?' * len(chunk)),
+                chunk))
+        rows.sort(key=lambda row: (row[-1], row[0]))
+        return [IndexEntry(*row[:-1]) for row in rows]
+
+    def window(self, after=None, before=None, limit=100):
+        """
+            Returns a window of the pages ordered by title, for paging
+            through the index with a cursor.
+
+            :param tuple after: the :func:`position` of the page to start
+                after
+            :param tuple before: the :func:`position` of the page to end
+                before, ignored if `after` is given
+            :param int limit: the maximum number of pages
+
+            :rtype: list of :class:`IndexEntry`
+        """
+        query = "SELECT " + COLUMNS + " FROM pages"
+        if after is not None:
+            rows = self.db.execute(
+                query + " WHERE (sort_key, url) > (?, ?) "
+                "ORDER BY sort_key, url LIMIT ?", (after[0], after[1], limit))
+            return [IndexEntry(*row) for row in rows]
+        if before is not None:
+            rows = self.db.execute(
+                query + " WHERE (sort_key, url) < (?, ?) "
+                "ORDER BY sort_key DESC, url DESC LIMIT ?",
+                (before[0], before[1], limit)).fetchall()
+            return [IndexEntry(*row) for row in reversed(rows)]
+        rows = self.db.execute(
+            query + " ORDER BY sort_key, url LIMIT ?", (limit,))
+        return [IndexEntry(*row) for row in rows]
+
+    def stats(self):
+        """
+            Returns the recorded ``(mtime, size)`` of every page.
+
+            :rtype: dict
+        """
+        rows = self.db.execute("SELECT url, mtime, size FROM pages")
+        return {url: (mtime, size) for url, mtime, size in rows}
+
+    def update(self, *entries):
+        """
+            Adds or replaces pages in the index.
+
+            :param entries: the :class:`IndexEntry` rows to store
+        """
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO pages "
+                "(url, path, title, sort_key, tags, mtime, size, digest) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(e.url, e.path, e.title, position(e)[0], e.tags,
+                  e.mtime, e.size, e.digest) for e in entries])
+            self._update_tags(entries)
+
+    def _update_tags(self, entries):
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM tags WHERE url = ?", [(e.url,) for e in entries])
+            self.db.executemany(
+                "INSERT INTO tags (tag, url) VALUES (?, ?)",
+                [(tag, e.url) for e in entries for tag in split_tags(e.tags)])
+
+    def remove(self, *urls):
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM pages WHERE url = ?", [(url,) for url in urls])
+            self.db.executemany(
+                "DELETE FROM tags WHERE url = ?", [(url,) for url in urls])
+
+    def tag_counts(self):
+        """
+            Returns the number of pages per tag.
+
+            :rtype: dict
+        """
+        return dict(self.db.execute(
+            "SELECT tag, count(*) FROM tags GROUP BY tag"))
+
+    def tagged(self, tag):
+        """
+            Returns the pages with exactly this tag, ordered by title.
+
+            :rtype: list of :class:`IndexEntry`
+        """
+        rows = self.db.execute(
+            "SELECT p.url, p.path, p.title, p.tags, p.mtime, p.size, "
+            "p.digest FROM tags t JOIN pages p ON p.url = t.url "
+            "WHERE t.tag = ? ORDER BY p.sort_key, p.url", (tag,))
+        return [IndexEntry(*row) for row in rows]
+
+    def tags_by_url(self):
+        """
+            Returns the tags of every tagged page, sorted.
+
+            :rtype: dict of url to tuple
+        """
+        tags = {}
+        for url, tag in self.db.execute(
+                "SELECT url, tag FROM tags ORDER BY url, tag"):
+            tags.setdefault(url, []).append(tag)
+        return {url: tuple(page_tags) for url, page_tags in tags.items()}
+
+    def tag_urls(self, tag):
+        """
+            Returns the urls of the pages with exactly this tag.
+
+            :rtype: set
+        """
+        return {url for url, in self.db.execute(
+            "SELECT url FROM tags WHERE tag = ?", (tag,))}
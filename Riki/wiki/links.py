@@ -0,0 +1,99 @@
+"""
+    Link graph
+    ~~~~~~~~~~
+
+    The wikilinks between pages, kept in the same database as the
+    :class:`wiki.index.PageIndex` so "what links here" can be answered
+    without rendering the wiki.
+"""
+
+
+class LinkGraph(object):
+    """
+        Stores one row per (source, target) wikilink. Links are kept by
+        the url of their target whether that page exists or not, so
+        broken links and pages that nothing links to can be found with
+        a join against the page index.
+    """
+
+    def __init__(self, db):
+        """
+            :param db: the sqlite connection of the page index
+        """
+        self.db = db
+        self.created = self.db.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'table' AND name = 'links'").fetchone() is None
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS links ("
+                " source TEXT NOT NULL,"
+                " target TEXT NOT NULL,"
+                " PRIMARY KEY (source, target)) WITHOUT ROWID")
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS links_by_target "
+                "ON links (target, source)")
+
+    def update(self, *pages):
+        """
+            Replaces the outgoing links of pages.
+
+            :param pages: ``(url, targets)`` tuples
+        """
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM links WHERE source = ?",
+                [(url,) for url, _ in pages])
+            self.db.executemany(
+                "INSERT OR IGNORE INTO links (source, target) VALUES (?, ?)",
+                [(url, target) for url, targets in pages
+                 for target in targets])
+
+    def remove(self, *urls):
+        """
+            Drops the outgoing links of removed pages. Links pointing to
+            them are kept, they are broken now.
+        """
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM links WHERE source = ?", [(url,) for url in urls])
+
+    def outgoing(self, url):
+        return [target for target, in self.db.execute(
+            "SELECT target FROM links WHERE source = ? ORDER BY target",
+            (url,))]
+
+    def backlinks(self, url):
+        return [source for source, in self.db.execute(
+            "SELECT source FROM links WHERE target = ? ORDER BY source",
+            (url,))]
+
+    def broken(self, url=None):
+        """
+            Returns links whose target page does not exist.
+
+            :param str url: only look at the links of this page
+
+            :returns: ``(source, target)`` tuples
+            :rtype: list
+        """
+        query = ("SELECT l.source, l.target FROM links l "
+                 "LEFT JOIN pages p ON p.url = l.target "
+                 "WHERE p.url IS NULL")
+        if url is None:
+            return self.db.execute(
+                query + " ORDER BY l.source, l.target").fetchall()
+        return self.db.execute(
+            query + " AND l.source = ? ORDER BY l.target", (url,)).fetchall()
+
+    def orphans(self):
+        """
+            Returns the urls of the pages no other page links to.
+
+            :rtype: list
+        """
+        return [url for url, in self.db.execute(
+            "SELECT p.url FROM pages p WHERE NOT EXISTS ("
+            " SELECT 1 FROM links l"
+            " WHERE l.target = p.url AND l.source != p.url) "
+            "ORDER BY p.sort_key, p.url")]
@@ -0,0 +1,195 @@
+"""
+    Incremental preview
+    ~~~~~~~~~~~~~~~~~~~
+
+    The editor asks for a preview of the whole document again and again
+    while only a paragraph or two change in between. The document is
+    therefore split into its top level Markdown blocks and every block is
+    rendered on its own, with the result cached by a hash of its source,
+    so only new or changed blocks are rendered.
+"""
+from collections import OrderedDict
+import hashlib
+import re
+import threading
+
+import markdown
+
+from wiki.core import MARKDOWN_EXTENSIONS
+from wiki.core import Processor
+
+FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+LIST_RE = re.compile(r'^ {0,3}([*+-]|\d+\.)[ \t]')
+#: link reference definitions, they apply to the whole document
+REFERENCE_RE = re.compile(r'^ {0,3}\[[^\]]+\]:[ \t]*\S')
+
+_engines = threading.local()
+
+
+def block_engine():
+    """
+        Returns the Markdown instance of the current thread that renders
+        blocks of the body, like :func:`wiki.core.markdown_engine` but
+        without the meta extension: only the start of the document holds
+        metadata.
+    """
+    md = getattr(_engines, 'md', None)
+    if md is None:
+        md = _engines.md = markdown.Markdown(extensions=[
+            extension for extension in MARKDOWN_EXTENSIONS
+            if extension != 'meta'])
+    return md
+
+
+def _continues(previous, chunk):
+    """
+        Tells whether `chunk` belongs to the same top level block as the
+        chunk before it, although a blank line separates them.
+    """
+    first = chunk.lstrip('\n').split('\n', 1)[0]
+    if first.startswith(('    ', '\t')):
+        # a list item's next paragraph or a code block, either way it
+        # depends on what precedes it
+        return True
+    last = previous.split('\n', 1)[0]
+    if LIST_RE.match(first) and LIST_RE.match(last):
+        # loose list items end up in one list
+        return True
+    if first.startswith('>') and last.startswith('>'):
+        return True
+    return False
+
+
+def split_blocks(text):
+    """
+        Splits Markdown into top level blocks, which render the same on
+        their own as they do within the document.
+
+        :param str text: the markdown without metadata
+
+        :returns: the blocks and the link reference definitions of the
+            document, or `None` if it cannot be split (raw HTML blocks can
+            span blank lines)
+        :rtype: tuple
+    """
+    chunks = []
+    references = []
+    current = []
+    fence = None
+    for line in text.split('\n'):
+        if fence is not None:
+            current.append(line)
+            if line.strip().startswith(fence):
+                fence = None
+            continue
+        match = FENCE_RE.match(line)
+        if match:
+            fence = match.group(1)
+        elif line.startswith('<'):
+            return None
+        elif REFERENCE_RE.match(line):
+            references.append(line)
+        if line.strip() or fence is not None:
+            current.append(line)
+        elif current:
+            chunks.append('\n'.join(current))
+            current = []
+    if current:
+        chunks.append('\n'.join(current))
+    blocks = []
+    for chunk in chunks:
+        if blocks and _continues(blocks[-1], chunk):
+            blocks[-1] += '\n\n' + chunk
+        else:
+            blocks.append(chunk)
+    return blocks, references
+
+
+def digest(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class BlockCache(object):
+    """
+        A process-wide LRU cache of rendered blocks, keyed by the digest
+        of their source.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            html = self._entries.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def set(self, key, html):
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+block_cache = BlockCache()
+
+
+def _render(kind, source, md):
+    key = digest(kind + '\0' + source)
+    html = block_cache.get(key)
+    if html is None:
+        html = md.reset().convert(source)
+        for processor in Processor.postprocessors:
+            html = processor(html)
+        block_cache.set(key, html)
+    return key, html
+
+
+def render_blocks(text):
+    """
+        Renders a document block by block, reusing the cached blocks.
+
+        :param str text: the document, with its metadata
+
+        :returns: ``(digest, html)`` of every block in order, the first
+            one is the metadata block. Joined by :func:`join_blocks` the
+            html is the html of :meth:`wiki.core.Processor.process`.
+        :rtype: list
+    """
+    processor = Processor(text)
+    processor.process_pre()
+    processor.split_raw()
+    split = split_blocks(processor.markdown)
+    if split is None:
+        # render the body as a whole, still cached by its digest
+        blocks, references = [processor.markdown], []
+    else:
+        blocks, references = split
+    # whatever is not metadata in the metadata block ends up in the html
+    rendered = [_render('meta', processor.meta_raw, processor.md)]
+    suffix = '\n\n' + '\n'.join(references) if references else ''
+    md = block_engine()
+    rendered.extend(_render('block', block + suffix, md) for block in blocks)
+    return rendered
+
+
+def join_blocks(blocks):
+    return '\n'.join(html for _, html in blocks if html)
@@ -0,0 +1,188 @@
+"""
+    Full-text search
+    ~~~~~~~~~~~~~~~~
+
+    An inverted index (token -> postings with positions) over the title,
+    tags and body of every page, kept in the same database as the
+    :class:`wiki.index.PageIndex`.
+"""
+from array import array
+from collections import defaultdict
+from collections import namedtuple
+import re
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+QUERY_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+#: A part of a search query, all of its `words` have to appear next to
+#: each other. If `prefix` is set the last word only has to be the start
+#: of a token.
+Clause = namedtuple('Clause', 'words prefix')
+
+
+def tokenize(text):
+    """
+        Splits text into lowercased word tokens.
+
+        :param str text: the text to split
+
+        :rtype: list
+    """
+    return [token.lower() for token in TOKEN_RE.findall(text)]
+
+
+def parse_query(term):
+    """
+        Parses a search term into clauses. Quoted parts are phrases,
+        every other word is a clause on its own and a trailing ``*``
+        turns a word into a prefix query. A page has to match all
+        clauses.
+
+        :param str term: the search term as entered by the user
+
+        :rtype: list of :class:`Clause`
+    """
+    clauses = []
+    for phrase, word in QUERY_RE.findall(term):
+        prefix = not phrase and word.endswith('*')
+        words = TOKEN_RE.findall(phrase or word)
+        if words:
+            clauses.append(Clause(words, prefix))
+    return clauses
+
+
+def clause_regex(clause, ignore_case=True):
+    """
+        Builds a regular expression that finds `clause` in a text, used
+        to double check index results for case sensitive searches.
+    """
+    pattern = r'\W+'.join(re.escape(word) for word in clause.words)
+    pattern = r'\b' + pattern + (r'' if clause.prefix else r'\b')
+    return re.compile(pattern, re.IGNORECASE if ignore_case else 0)
+
+
+class SearchIndex(object):
+    """
+        Token postings of every page field. A posting records the
+        positions of a token within one field of one page, which allows
+        phrase queries without reading any page.
+    """
+
+    FIELDS = ('title', 'tags', 'body')
+
+    def __init__(self, db):
+        """
+            :param db: the sqlite connection of the page index
+        """
+        self.db = db
+        self.created = self.db.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE type = 'table' AND name = 'postings'").fetchone() is None
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                " token TEXT NOT NULL,"
+                " url TEXT NOT NULL,"
+                " field TEXT NOT NULL,"
+                " positions BLOB NOT NULL,"
+                " PRIMARY KEY (token, url, field)) WITHOUT ROWID")
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS postings_by_url "
+                "ON postings (url)")
+
+    def update(self, *documents):
+        """
+            (Re)indexes pages.
+
+            :param documents: ``(url, fields)`` tuples where fields maps
+                field names to their text
+        """
+        rows = []
+        for url, fields in documents:
+            for field, text in fields.items():
+                positions = defaultdict(lambda: array('I'))
+                for position, token in enumerate(tokenize(text)):
+                    positions[token].append(position)
+                rows.extend((token, url, field, found.tobytes())
+                            for token, found in positions.items())
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM postings WHERE url = ?",
+                [(url,) for url, _ in documents])
+            self.db.executemany(
+                "INSERT INTO postings (token, url, field, positions) "
+                "VALUES (?, ?, ?, ?)", rows)
+
+    def remove(self, *urls):
+        with self.db:
+            self.db.executemany(
+                "DELETE FROM postings WHERE url = ?", [(url,) for url in urls])
+
+    def _postings(self, token, fields, prefix=False):
+        """
+            :returns: a mapping of ``(url, field)`` to the positions of
+                `token` (or of every token starting with it)
+        """
+        if prefix:
+            where = "token >= ? AND token < ?"
+            args = (token, token + '\U0010ffff')
+        else:
+            where = "token = ?"
+            args = (token,)
+        rows = self.db.execute(
+            "SELECT url, field, positions FROM postings WHERE " + where +
+            " AND field IN (%s)" % ', '.join('?' * len(fields)),
+            args + tuple(fields))
+        postings = defaultdict(set)
+        for url, field, blob in rows:
+            found = array('I')
+            found.frombytes(blob)
+            postings[(url, field)].update(found)
+        return postings
+
+    def _match(self, clause, fields):
+        tokens = [word.lower() for word in clause.words]
+        last = len(tokens) - 1
+        candidates = None
+        for offset, token in enumerate(tokens):
+            postings = self._postings(token, fields,
+                                      clause.prefix and offset == last)
+            if candidates is None:
+                candidates = {key: set(found)
+                              for key, found in postings.items()}
+            else:
+                # keep the phrase starts that continue with this token
+                candidates = {
+                    key: {start for start in starts
+                          if start + offset in postings[key]}
+                    for key, starts in candidates.items() if key in postings
+                }
+            candidates = {key: starts
+                          for key, starts in candidates.items() if starts}
+            if not candidates:
+                break
+        return {url for url, _ in candidates}
+
+    def query(self, term, fields=FIELDS):
+        """
+            Finds the pages that match all clauses of `term`, ignoring
+            case.
+
+            :param str term: the search term, see :func:`parse_query`
+            :param fields: the fields to search in
+
+            :returns: the urls of the matching pages
+            :rtype: set
+        """
+        fields = [field for field in fields if field in self.FIELDS]
+        clauses = parse_query(term)
+        if not clauses or not fields:
+            return set()
+        urls = None
+        for clause in clauses:
+            matched = self._match(clause, fields)
+            urls = matched if urls is None else urls & matched
+            if not urls:
+                break
+        return urls
@@ -0,0 +1,357 @@
+"""
+    Content watcher
+    ~~~~~~~~~~~~~~~
+
+    Notices changes to the content directory that did not go through the
+    wiki (git pulls, scripts, editors) and reports them as
+    :class:`wiki.events.ChangeEvent` objects, so the indexes and caches can be updated
+    without rescanning the whole wiki.
+
+    On Linux the watcher uses inotify to learn which directories changed,
+    elsewhere it polls the modification time of the known directories.
+    Either way only changed directories are listed and stat'ed.
+"""
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+
+from wiki.core import clean_url
+from wiki.events import ChangeEvent
+from wiki.events import CREATED
+from wiki.events import DELETED
+from wiki.events import MODIFIED
+from wiki.events import MOVED
+
+
+logger = logging.getLogger(__name__)
+
+
+class Watcher(object):
+    """
+        Base class of the watchers. Keeps a snapshot of the page files
+        (mtime, size and inode) per directory and turns differences to it
+        into change events. Subclasses decide which directories need to
+        be compared again.
+    """
+
+    def __init__(self, root, callback, interval=1.0):
+        """
+            :param str root: the content directory
+            :param function callback: called with the events of every
+                batch of changes, from the watcher thread
+            :param float interval: seconds between checks
+        """
+        self.root = os.path.abspath(root)
+        self.callback = callback
+        self.interval = interval
+        self.snapshot = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.run, name='riki-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run(self):
+        # the content directory is only created with the first page
+        while not os.path.isdir(self.root):
+            if self._stop.wait(self.interval):
+                return
+        self.setup()
+        while not self._stop.is_set():
+            try:
+                self.callback(*self.check())
+            except Exception:
+                # e.g. a page that is still being written, it will be
+                # reported again once it is complete
+                logger.exception('Failed to process content changes')
+        self.teardown()
+
+    def setup(self):
+        self._scan(self.root)
+
+    def teardown(self):
+        pass
+
+    def check(self):
+        """
+            Waits for changes and returns the resulting events.
+
+            :rtype: list of :class:`ChangeEvent`
+        """
+        raise NotImplementedError
+
+    def url(self, path):
+        return clean_url(os.path.relpath(path, self.root)[:-3])
+
+    @staticmethod
+    def _watched(name):
+        # hidden directories (.git and friends) are not watched, pages
+        # in there are only picked up by Wiki.reconcile
+        return not name.startswith('.')
+
+    def _list(self, directory):
+        files = {}
+        dirs = set()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return None
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if self._watched(entry.name):
+                        dirs.add(entry.name)
+                elif entry.name.endswith('.md'):
+                    st = entry.stat()
+                    files[entry.name] = (st.st_mtime_ns, st.st_size,
+                                         st.st_ino)
+            except OSError:
+                # vanished while listing
+                continue
+        try:
+            mtime = os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+        return {'mtime': mtime, 'files': files, 'dirs': dirs}
+
+    def _scan(self, directory):
+        """
+            Adds a directory tree to the snapshot.
+
+            :returns: ``(path, stat)`` of all page files in it
+        """
+        listing = self._list(directory)
+        if listing is None:
+            return []
+        self.snapshot[directory] = listing
+        self.added(directory)
+        found = [(os.path.join(directory, name), st)
+                 for name, st in listing['files'].items()]
+        for name in listing['dirs']:
+            found.extend(self._scan(os.path.join(directory, name)))
+        return found
+
+    def _forget(self, directory):
+        """
+            Removes a directory tree from the snapshot.
+
+            :returns: ``(path, stat)`` of all page files it contained
+        """
+        listing = self.snapshot.pop(directory, None)
+        if listing is None:
+            return []
+        self.removed(directory)
+        found = [(os.path.join(directory, name), st)
+                 for name, st in listing['files'].items()]
+        for name in listing['dirs']:
+            found.extend(self._forget(os.path.join(directory, name)))
+        return found
+
+    def added(self, directory):
+        """Hook, called when a directory is added to the snapshot."""
+
+    def removed(self, directory):
+        """Hook, called when a directory is removed from the snapshot."""
+
+    def compare(self, directories, recursive=False):
+        """
+            Compares directories with the snapshot and updates it.
+
+            :param directories: the directories to list again
+            :param bool recursive: compare their subdirectories as well
+
+            :rtype: list of :class:`ChangeEvent`
+        """
+        created = []
+        deleted = []
+        modified = []
+        replaced = set()
+        pending = list(directories)
+        while pending:
+            directory = pending.pop()
+            old = self.snapshot.get(directory)
+            if old is None:
+                continue
+            new = self._list(directory)
+            if new is None:
+                deleted.extend(self._forget(directory))
+                continue
+            self.snapshot[directory] = new
+            for name, st in new['files'].items():
+                path = os.path.join(directory, name)
+                if name not in old['files']:
+                    created.append((path, st))
+                elif old['files'][name] != st:
+                    if old['files'][name][2] != st[2]:
+                        # replaced by another file (e.g. an editor's
+                        # atomic save or a move onto it)
+                        created.append((path, st))
+                        replaced.add(path)
+                    else:
+                        modified.append(path)
+            deleted.extend((os.path.join(directory, name), st)
+                           for name, st in old['files'].items()
+                           if name not in new['files'])
+            for name in new['dirs'] - old['dirs']:
+                created.extend(self._scan(os.path.join(directory, name)))
+            for name in old['dirs'] - new['dirs']:
+                deleted.extend(self._forget(os.path.join(directory, name)))
+            if recursive:
+                pending.extend(os.path.join(directory, name)
+                               for name in new['dirs'] & old['dirs'])
+        return self._events(created, deleted, modified, replaced)
+
+    def _events(self, created, deleted, modified, replaced):
+        events = []
+        # a file that disappeared in one place and showed up in another
+        # with the same inode was moved
+        gone = {st[2]: path for path, st in deleted}
+        for path, st in created:
+            source = gone.pop(st[2], None)
+            if source is not None:
+                events.append(ChangeEvent(
+                    MOVED, self.url(source), source, self.url(path), path))
+            elif path in replaced:
+                events.append(ChangeEvent(MODIFIED, self.url(path), path))
+            else:
+                events.append(ChangeEvent(CREATED, self.url(path), path))
+        for path, st in deleted:
+            if gone.get(st[2]) == path:
+                events.append(ChangeEvent(DELETED, self.url(path), path))
+        events.extend(ChangeEvent(MODIFIED, self.url(path), path)
+                      for path in modified)
+        return events
+
+
+class PollingWatcher(Watcher):
+    """
+        Stats the known directories every `interval` seconds and lists
+        those whose modification time changed. Files that are changed in
+        place do not touch their directory, so every `full_every` checks
+        all page files are stat'ed as well.
+    """
+
+    def __init__(self, root, callback, interval=1.0, full_every=30):
+        Watcher.__init__(self, root, callback, interval)
+        self.full_every = full_every
+        self._checks = 0
+
+    def check(self):
+        if self._stop.wait(self.interval):
+            return []
+        self._checks += 1
+        if self.full_every and self._checks % self.full_every == 0:
+            return self.compare([self.root], recursive=True)
+        changed = []
+        for directory, listing in list(self.snapshot.items()):
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime != listing['mtime']:
+                changed.append(directory)
+        return self.compare(changed)
+
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_CLOEXEC = 0o2000000
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def _libc():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                           use_errno=True)
+        libc.inotify_init1
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class InotifyWatcher(Watcher):
+    """
+        Uses inotify to learn which directories changed and compares only
+        those with the snapshot. Needs no third party module, the system
+        calls are made through ctypes.
+    """
+
+    MASK = (IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+            IN_DELETE | IN_ONLYDIR)
+
+    def __init__(self, root, callback, interval=1.0):
+        Watcher.__init__(self, root, callback, interval)
+        self.libc = _libc()
+        self.fd = None
+        self.watches = {}
+
+    def setup(self):
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        Watcher.setup(self)
+
+    def teardown(self):
+        os.close(self.fd)
+
+    def added(self, directory):
+        wd = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(directory), self.MASK)
+        if wd >= 0:
+            self.watches[wd] = directory
+
+    def removed(self, directory):
+        for wd, watched in list(self.watches.items()):
+            if watched == directory:
+                del self.watches[wd]
+                self.libc.inotify_rm_watch(self.fd, wd)
+
+    def check(self):
+        readable, _, _ = select.select([self.fd], [], [], self.interval)
+        if not readable:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                # events were lost, compare everything once
+                return self.compare([self.root], recursive=True)
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+            elif wd in self.watches:
+                changed.add(self.watches[wd])
+        return self.compare(changed)
+
+
+def create_watcher(root, callback, interval=1.0):
+    """
+        Creates the best watcher for this platform: inotify on Linux,
+        polling everywhere else.
+    """
+    if _libc() is not None:
+        return InotifyWatcher(root, callback, interval)
+    return PollingWatcher(root, callback, interval)
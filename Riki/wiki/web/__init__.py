@@ -1,34 +1,154 @@
 import os
+import threading
 
 from flask import current_app
 from flask import Flask
-from flask import g
 from flask_login import LoginManager
 from werkzeug.local import LocalProxy
 
+from wiki.core import render_cache
 from wiki.core import Wiki
+from wiki.events import ChangeFeed
+from wiki.watcher import create_watcher
+from wiki.web import assets
+from wiki.web.cache import ResponseCache
+from wiki.web import compression
+from wiki.web import conversions
+from wiki.web import jobs
+from wiki.web import metrics
+from wiki.web import profiling
 from wiki.web.user import UserManager
 
 class WikiError(Exception):
     pass
 
+
+class AppWiki(object):
+    """
+        The wiki of an application, shared by all of its requests and
+        threads for as long as the application lives.
+
+        SQLite connections must not be used by two threads at once, so
+        every thread gets its own :class:`wiki.core.Wiki` (and with it its
+        own connection) the first time it asks and keeps it until the
+        thread ends: servers that start a thread per connection would
+        otherwise pile up a connection per request. Everything
+        cached in memory (rendered pages and responses) is process-wide
+        and kept up to date through the change feed, which
+        :meth:`sync` also feeds with the changes of other processes.
+    """
+
+    def __init__(self, root, index_path=None, changes=None):
+        """
+            :param str root: the content directory
+            :param str index_path: see :class:`wiki.core.Wiki`
+            :param changes: the application's
+                :class:`wiki.events.ChangeFeed`
+        """
+        self.root = root
+        self.index_path = index_path
+        self.changes = changes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        #: the wikis by the thread they belong to
+        self._wikis = {}
+        self._last_change = self.get().change_log.last()
+
+    def get(self):
+        """
+            Returns the wiki of the current thread.
+
+            :rtype: :class:`wiki.core.Wiki`
+        """
+        wiki = getattr(self._local, 'wiki', None)
+        if wiki is not None and wiki.page_index.path == ':memory:' and \
+                os.path.isdir(self.root):
+            # the first page has been saved, from now on there is an
+            # index on disk to share
+            self._discard(wiki)
+            wiki = None
+        if wiki is None:
+            self._reap()
+            wiki = self._local.wiki = Wiki(
+                self.root, self.index_path, self.changes)
+            with self._lock:
+                self._wikis[threading.current_thread()] = wiki
+        return wiki
+
+    def _discard(self, wiki):
+        with self._lock:
+            self._wikis.pop(threading.current_thread(), None)
+        wiki.close()
+
+    def _reap(self):
+        # the connections are not bound to their threads, so the wikis of
+        # threads that ended can be closed from here
+        with self._lock:
+            dead = [thread for thread in self._wikis
+                    if not thread.is_alive()]
+            wikis = [self._wikis.pop(thread) for thread in dead]
+        for wiki in wikis:
+            wiki.close()
+
+    def sync(self):
+        """
+            Publishes the changes other processes made since the last
+            call, so the caches of this one drop the affected pages.
+        """
+        last, events = self.get().change_log.since(self._last_change)
+        if last == self._last_change:
+            return
+        with self._lock:
+            if last <= self._last_change:
+                # another thread got here first
+                return
+            self._last_change = last
+        if events and self.changes is not None:
+            self.changes.publish(*events)
+
+    def close(self):
+        """Closes the wikis of all threads."""
+        with self._lock:
+            wikis, self._wikis = list(self._wikis.values()), {}
+        for wiki in wikis:
+            wiki.close()
+        self._local = threading.local()
+
+
 def get_wiki():
-    wiki = getattr(g, '_wiki', None)
-    if wiki is None:
-        wiki = g._wiki = Wiki(current_app.config['CONTENT_DIR'])
-    return wiki
+    return current_app.extensions['wiki'].get()
+
 
 current_wiki = LocalProxy(get_wiki)
 
+
 def get_users():
-    users = getattr(g, '_users', None)
-    if users is None:
-        users = g._users = UserManager(current_app.config['USER_DIR'])
-    return users
+    return current_app.extensions['users']
+
 
 current_users = LocalProxy(get_users)
 
 
+def watch_content(app):
+    """
+        Starts a watcher thread that applies changes made to the content
+        directory outside of the wiki to the indexes and caches.
+    """
+    root = app.config['CONTENT_DIR']
+    wikis = app.extensions['wiki']
+
+    def apply(*events):
+        if events:
+            # runs in the watcher thread, which gets its own wiki
+            wikis.get().apply(*events)
+
+    watcher = create_watcher(root, apply,
+                             app.config.get('WATCH_INTERVAL', 1.0))
+    watcher.start()
+    app.extensions['watcher'] = watcher
+    return watcher
+
+
 def create_app(directory):
     app = Flask(__name__)
     app.config['CONTENT_DIR'] = directory
@@ -41,6 +161,38 @@ def create_app(directory):
         msg = "You need to place a config.py in your content directory."
         raise WikiError(msg)
 
+    render_cache.maxsize = app.config.get(
+        'RENDER_CACHE_SIZE', render_cache.maxsize)
+    app.extensions['changes'] = ChangeFeed()
+    app.extensions['changes'].subscribe(render_cache.invalidate)
+    if app.config.get('RESPONSE_CACHE'):
+        cache = ResponseCache(app.config.get('RESPONSE_CACHE_SIZE', 128))
+        app.extensions['response_cache'] = cache
+        app.extensions['changes'].subscribe(cache.invalidate)
+    app.extensions['wiki'] = AppWiki(app.config['CONTENT_DIR'],
+                                     app.config.get('INDEX_PATH'),
+                                     app.extensions['changes'])
+    app.extensions['users'] = UserManager(app.config['USER_DIR'])
+    if app.config.get('PROFILE'):
+        # first, so the profiles cover the other request hooks
+        profiling.init_app(app)
+    app.before_request(app.extensions['wiki'].sync)
+    if app.config.get('WATCH_CONTENT'):
+        watch_content(app)
+
+    # pick up pages that were changed while the wiki was not running, a
+    # freshly created index has already been filled by the wiki itself
+    wiki = app.extensions['wiki'].get()
+    if not wiki.reindexed:
+        wiki.reconcile()
+
+    if app.config.get('METRICS', True):
+        metrics.init_app(app)
+    assets.init_app(app)
+    conversions.init_app(app)
+    jobs.init_app(app)
+    if app.config.get('COMPRESS', True):
+        compression.init_app(app)
     loginmanager.init_app(app)
 
     from wiki.web.routes import bp
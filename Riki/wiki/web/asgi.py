@@ -0,0 +1,210 @@
+"""
+    ASGI
+    ~~~~
+
+    Serves the wiki from an ASGI server (uvicorn, hypercorn, ...) without
+    tying a thread to every connection: request bodies are received and
+    responses sent on the event loop, and only the work in between (the
+    Flask view, reading pages and files, producing the next chunk of a
+    streamed response or a download) runs in a thread pool of ASGI_THREADS
+    threads. A slow client uploading or downloading a file costs a
+    coroutine, not a worker thread.
+
+    Set CONVERSION_PROCESSES as well to move the converters out of the
+    process (see :mod:`wiki.web.workers`).
+
+    run with uvicorn asgi:app from the content directory, see asgi.py
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import sys
+import tempfile
+
+from wiki.web import create_app
+from wiki.web import workers
+
+#: request bodies larger than this are spooled to a temporary file
+SPOOL_SIZE = 1024 * 1024
+
+
+class AsgiApp(object):
+    """
+        An ASGI application running a Flask app.
+
+        :param app: the :class:`flask.Flask` app
+        :param int threads: size of the thread pool, ASGI_THREADS (32) by
+            default
+    """
+
+    def __init__(self, app, threads=None):
+        self.app = app
+        self.executor = ThreadPoolExecutor(
+            threads or app.config.get('ASGI_THREADS', 32),
+            thread_name_prefix='riki-asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise ValueError('unsupported ASGI scope ' + scope['type'])
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.close)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def close(self):
+        """Stops the thread and process pools and the watcher."""
+        self.executor.shutdown()
+        workers.shutdown(self.app)
+        watcher = self.app.extensions.get('watcher')
+        if watcher is not None:
+            watcher.stop()
+        self.app.extensions['wiki'].close()
+
+    async def http(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        # the WSGI app and its response iterator (which may push the
+        # request context, as stream_with_context does) see the same
+        # context variables, whichever pool thread runs them
+        context = contextvars.copy_context()
+
+        def run(func, *args):
+            return loop.run_in_executor(
+                self.executor, context.run, func, *args)
+
+        body = await self.read_body(receive, run)
+        if body is None:
+            # the client went away
+            return
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info is not None and response.get('started'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [
+                (name.lower().encode('latin-1'), value.encode('latin-1'))
+                for name, value in headers]
+            return self._write_unsupported
+
+        try:
+            iterable = await run(self.app, environ(scope, body),
+                                 start_response)
+            try:
+                iterator = iter(iterable)
+                while True:
+                    chunk = await run(next, iterator, None)
+                    if chunk is None:
+                        break
+                    if not response.get('started'):
+                        await self.start(send, response)
+                    if chunk:
+                        await send({'type': 'http.response.body',
+                                    'body': chunk, 'more_body': True})
+            finally:
+                if hasattr(iterable, 'close'):
+                    await run(iterable.close)
+            if not response.get('started'):
+                await self.start(send, response)
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            await run(body.close)
+
+    @staticmethod
+    def _write_unsupported(data):
+        raise NotImplementedError('the write callable is not supported')
+
+    @staticmethod
+    async def start(send, response):
+        response['started'] = True
+        await send({'type': 'http.response.start',
+                    'status': response['status'],
+                    'headers': response['headers']})
+
+    async def read_body(self, receive, run):
+        """
+            Receives the request body, into memory or beyond SPOOL_SIZE a
+            temporary file (written from the pool).
+
+            :returns: the body as a file, `None` if the client disconnected
+        """
+        body = tempfile.SpooledTemporaryFile(SPOOL_SIZE)
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                await run(body.close)
+                return None
+            chunk = message.get('body', b'')
+            if chunk:
+                size += len(chunk)
+                if size > SPOOL_SIZE:
+                    await run(body.write, chunk)
+                else:
+                    body.write(chunk)
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+        return body
+
+
+def environ(scope, body):
+    """
+        The WSGI environ of an ASGI HTTP scope.
+
+        :param body: the request body, a file
+    """
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name not in ('CONTENT_LENGTH', 'CONTENT_TYPE'):
+            name = 'HTTP_' + name
+        if name in environ:
+            # HTTP/2 sends every cookie as a header of its own, and cookies
+            # are separated differently than other list values
+            separator = '; ' if name == 'HTTP_COOKIE' else ','
+            value = environ[name] + separator + value
+        environ[name] = value
+    return environ
+
+
+def create_asgi_app(directory):
+    """
+        Like :func:`wiki.web.create_app`, but returns an ASGI application.
+    """
+    return AsgiApp(create_app(directory))
@@ -0,0 +1,223 @@
+"""
+    Static assets
+    ~~~~~~~~~~~~~
+
+    A build step for the static files: every file is copied to the build
+    directory under a name with a digest of its content in it
+    (``bootstrap.css`` becomes ``bootstrap.1a2b3c4d5e6f.css``), next to
+    gzip and, if the brotli module is installed, brotli compressed
+    variants. A manifest maps the original names to the built ones.
+
+    When the manifest exists, ``url_for('static', ...)`` emits the built
+    names and the static route serves them with the best variant the
+    client accepts, cached for a year: a changed file gets a new name.
+
+    run with python -m wiki.web.assets [build directory] from the Riki
+    directory
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from flask import current_app
+from flask import request
+from flask import send_from_directory
+from werkzeug.exceptions import NotFound
+
+MANIFEST = 'manifest.json'
+#: the url prefix of built files within the static route
+PREFIX = 'build/'
+#: files smaller than this are not worth compressing
+MIN_SIZE = 256
+ONE_YEAR = 365 * 24 * 3600
+
+#: Content-Encoding and file extension of the variants, preferred first
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def fingerprint(name, content):
+    """
+        :returns: `name` with a digest of `content` before the extension
+        :rtype: str
+    """
+    root, extension = os.path.splitext(name)
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    return '{0}.{1}{2}'.format(root, digest, extension)
+
+
+def _write(path, content):
+    tmp = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(content)
+    os.replace(tmp, path)
+
+
+def build(static_dir, build_dir):
+    """
+        Writes the fingerprinted and compressed static files and the
+        manifest. The files of the build before are kept for the pages
+        that still link to them (and for processes that still serve
+        them), those of older builds are removed.
+
+        :returns: the manifest, original names to built names
+        :rtype: dict
+    """
+    os.makedirs(build_dir, exist_ok=True)
+    previous = load_manifest(build_dir) or {}
+    manifest = {}
+    build_dir = os.path.abspath(build_dir)
+    for cur_dir, dirs, files in os.walk(static_dir):
+        if os.path.abspath(cur_dir) == build_dir:
+            continue
+        # do not descend into the build directory
+        dirs[:] = [name for name in dirs if os.path.abspath(
+            os.path.join(cur_dir, name)) != build_dir]
+        for name in sorted(files):
+            path = os.path.join(cur_dir, name)
+            source = os.path.relpath(path, static_dir).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                content = f.read()
+            built = fingerprint(source, content)
+            manifest[source] = built
+            target = os.path.join(build_dir, built)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if not os.path.exists(target):
+                _write(target, content)
+            if len(content) < MIN_SIZE:
+                continue
+            variants = [('.gz', lambda: gzip.compress(
+                content, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                variants.append(('.br', lambda: brotli.compress(content)))
+            for extension, compress in variants:
+                if not os.path.exists(target + extension):
+                    compressed = compress()
+                    if len(compressed) < len(content):
+                        _write(target + extension, compressed)
+    _write(os.path.join(build_dir, MANIFEST),
+           json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    _clean(build_dir, manifest, previous)
+    return manifest
+
+
+def _clean(build_dir, *manifests):
+    keep = {MANIFEST}
+    for manifest in manifests:
+        for built in manifest.values():
+            keep.update(built + extension
+                        for extension in ('', '.gz', '.br'))
+    for cur_dir, _, files in os.walk(build_dir):
+        for name in files:
+            path = os.path.join(cur_dir, name)
+            relative = os.path.relpath(path, build_dir).replace(os.sep, '/')
+            if relative not in keep:
+                os.remove(path)
+
+
+def load_manifest(build_dir):
+    """
+        :returns: the manifest of a build, `None` if there is none
+        :rtype: dict
+    """
+    try:
+        with open(os.path.join(build_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def version(manifest):
+    """
+        :returns: a digest of a manifest, which changes with the names
+            the pages link to
+        :rtype: str
+    """
+    return hashlib.sha1(json.dumps(manifest, sort_keys=True).encode(
+        'utf-8')).hexdigest()[:12]
+
+
+def _url_defaults(endpoint, values):
+    if endpoint != 'static':
+        return
+    manifest = current_app.extensions['assets'][1]
+    built = manifest.get(values.get('filename'))
+    if built is not None:
+        values['filename'] = PREFIX + built
+
+
+def _accepted(encoding):
+    return request.accept_encodings[encoding] > 0
+
+
+def send_static_file(filename):
+    """
+        The view of the static route: built files are served with their
+        compressed variant and cached for good, the others as usual.
+    """
+    build_dir = current_app.extensions['assets'][0]
+    if not filename.startswith(PREFIX):
+        return current_app.send_static_file(filename)
+    built = filename[len(PREFIX):]
+    if built not in current_app.extensions['assets'][1].values():
+        raise NotFound()
+    mimetype = mimetypes.guess_type(built)[0] or 'application/octet-stream'
+    response = None
+    for encoding, extension in ENCODINGS:
+        if _accepted(encoding) and \
+                os.path.exists(os.path.join(build_dir, built + extension)):
+            response = send_from_directory(
+                build_dir, built + extension, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_from_directory(build_dir, built, mimetype=mimetype)
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.max_age = ONE_YEAR
+    response.cache_control.immutable = True
+    response.cache_control.no_cache = None
+    return response
+
+
+def init_app(app):
+    """
+        Serves the built static files of `app`, if they have been built.
+        STATIC_BUILD_DIR sets the build directory, ``static/build`` by
+        default; set STATIC_BUILD = True to build at startup.
+    """
+    build_dir = app.config.get('STATIC_BUILD_DIR') or os.path.join(
+        app.static_folder, 'build')
+    if app.config.get('STATIC_BUILD'):
+        manifest = build(app.static_folder, build_dir)
+    else:
+        manifest = load_manifest(build_dir)
+    if manifest is None:
+        return
+    app.extensions['assets'] = build_dir, manifest
+    app.extensions['assets_version'] = version(manifest)
+    app.url_defaults(_url_defaults)
+    app.view_functions['static'] = send_static_file
+
+
+def main():
+    static_dir = os.path.join(os.path.dirname(__file__), 'static')
+    build_dir = sys.argv[1] if len(sys.argv) > 1 else \
+        os.path.join(static_dir, 'build')
+    manifest = build(static_dir, build_dir)
+    for source, built in sorted(manifest.items()):
+        print('{0} -> {1}'.format(source, built))
+    if brotli is None:
+        print('brotli is not installed, only gzip variants were written',
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
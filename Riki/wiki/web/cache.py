@@ -0,0 +1,368 @@
+"""
+    HTTP caching
+    ~~~~~~~~~~~~
+
+    Validators for conditional requests, so clients and proxies that hold
+    the current version of a page get a ``304 Not Modified`` without the
+    page being loaded or rendered, and an optional cache of the rendered
+    HTML of the read-only views.
+"""
+from collections import OrderedDict
+from datetime import datetime
+from datetime import timezone
+import hashlib
+import os
+import threading
+
+from flask import current_app
+from flask import g
+from flask import make_response
+from flask import request
+from flask import session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+from wiki.core import clean_url
+from wiki.core import Page
+from wiki.events import CREATED
+from wiki.events import DELETED
+from wiki.events import MODIFIED
+from wiki.events import MOVED
+from wiki.index import split_tags
+
+
+def template_version():
+    """
+        Identifies the templates the pages are rendered with, so a new
+        deployment changes the ETags of all pages. Set TEMPLATE_VERSION
+        in the config to choose it explicitly, otherwise it is a digest
+        of the names, sizes and modification times of the template files.
+        Either way it includes the version of the static build, whose
+        file names the pages link to.
+
+        :rtype: str
+    """
+    app = current_app
+    assets = app.extensions.get('assets_version')
+    version = _templates_version(app)
+    return '{0}.{1}'.format(version, assets) if assets else version
+
+
+def _templates_version(app):
+    version = app.config.get('TEMPLATE_VERSION')
+    if version:
+        return str(version)
+    version = app.extensions.get('template_version')
+    if version is None or app.jinja_env.auto_reload:
+        digest = hashlib.sha1()
+        loaders = [app.jinja_loader] + [
+            blueprint.jinja_loader for blueprint in app.iter_blueprints()]
+        for loader in loaders:
+            for folder in getattr(loader, 'searchpath', []):
+                for cur_dir, _, files in sorted(os.walk(folder)):
+                    for name in sorted(files):
+                        path = os.path.join(cur_dir, name)
+                        stat = os.stat(path)
+                        digest.update('{0}\0{1}\0{2}\0'.format(
+                            os.path.relpath(path, folder), stat.st_size,
+                            stat.st_mtime_ns).encode('utf-8'))
+        version = app.extensions['template_version'] = digest.hexdigest()
+    return version
+
+
+def page_validators(wiki, url):
+    """
+        Computes the validators of a page view from the indexes.
+
+        The strong ETag covers the page content, the pages linking to it,
+        the template version and the logged in user (the navigation
+        differs). Last-Modified is the latest modification of the page
+        and its backlinks.
+
+        :returns: ``(etag, last_modified, backlinks)``, or `None` if the
+            response cannot be validated up front: the page is not (or
+            not freshly) indexed, or there are flashed messages to show
+        :rtype: tuple
+    """
+    if session.get('_flashes'):
+        return None
+    version = wiki.version(url)
+    if version is None:
+        return None
+    digest, mtime, backlinks = version
+    user = current_user.get_id() if current_user.is_authenticated else ''
+    etag = hashlib.sha1('{0}\0{1}\0{2}'.format(
+        digest, template_version(), user).encode('utf-8')).hexdigest()
+    last_modified = datetime.fromtimestamp(int(mtime), timezone.utc)
+    return etag, last_modified, backlinks
+
+
+def is_fresh(etag, last_modified):
+    """
+        Tells whether the client already holds this version, following
+        RFC 7232: If-None-Match takes precedence over If-Modified-Since.
+    """
+    return not is_resource_modified(
+        request.environ, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, etag, last_modified):
+    """
+        Adds the validators to a page response. Caches have to revalidate
+        on every use, and must not share pages of a private wiki.
+    """
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    if current_app.config.get('PRIVATE'):
+        response.cache_control.private = True
+    response.vary.add('Cookie')
+    return response
+
+
+def user_role():
+    """
+        The part of the current user that changes how pages look: logged
+        in or not, and the roles.
+    """
+    if not current_user.is_authenticated:
+        return 'anonymous'
+    return 'user:' + ','.join(sorted(current_user.get('roles') or []))
+
+
+#: dependency value of a page whose every change invalidates an entry
+ALWAYS = object()
+
+
+class PageView(object):
+    """
+        What a rendered page view depends on: the page itself and the
+        titles of the pages linking to it. Pages that start linking to it
+        invalidate it as well.
+    """
+
+    def __init__(self, url, backlinks):
+        self.url = url = clean_url(url)
+        self.pages = {linking.url: linking.title for linking in backlinks}
+        self.pages[url] = ALWAYS
+
+    def value(self, url, meta, links):
+        if self.url in links:
+            return meta.get('title', url)
+        return None
+
+
+class PageListing(object):
+    """The title of every listed page, for /index/."""
+
+    def __init__(self, pages):
+        self.pages = {page.url: page.title for page in pages}
+
+    def value(self, url, meta, links):
+        return meta.get('title', url)
+
+
+class TagListing(object):
+    """The titles of the pages with one tag, for /tag/<name>/."""
+
+    def __init__(self, tag, pages):
+        self.tag = tag
+        self.pages = {page.url: page.title for page in pages}
+
+    def value(self, url, meta, links):
+        if self.tag in split_tags(meta.get('tags', '')):
+            return meta.get('title', url)
+        return None
+
+
+class TagCounts(object):
+    """
+        The tags of every tagged page, for /tags/.
+
+        :param dict tags: the sorted tags by url, as
+            :meth:`wiki.core.Wiki.tags_by_url` returns them
+    """
+
+    def __init__(self, tags):
+        self.pages = dict(tags)
+
+    def value(self, url, meta, links):
+        return tuple(sorted(split_tags(meta.get('tags', '')))) or None
+
+
+class ResponseCache(object):
+    """
+        An LRU cache of rendered HTML responses, keyed by the request's
+        path and query, the user role and the template version.
+
+        Every entry remembers what it depends on (see :class:`PageView`
+        and friends): the pages it shows with the values it shows of them,
+        and which new pages would show up in it. When a page changes only
+        the entries whose values of that page changed are dropped, so an
+        edit that keeps the title does not evict /index/.
+
+        Entries also keep their compressed bodies (see :meth:`encoded`),
+        which go with them.
+    """
+
+    def __init__(self, maxsize=128):
+        """
+            :param int maxsize: the maximum number of responses to keep
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key():
+        """
+            The cache key of the current request, or `None` if it must not
+            be served from or stored in the cache (it has flashed messages
+            to show).
+        """
+        if session.get('_flashes'):
+            return None
+        return request.full_path, user_role(), template_version()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def encoded(self, key, encoding, encode):
+        """
+            Returns the body of an entry in a content encoding, encoded
+            only the first time it is asked for.
+
+            :param str encoding: e.g. ``gzip``
+            :param function encode: returns the encoded body, called if it
+                is not cached (or the entry is gone)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and encoding in entry[2]:
+                return entry[2][encoding]
+        body = encode()
+        if entry is not None:
+            with self._lock:
+                entry[2][encoding] = body
+        return body
+
+    def set(self, key, body, dependencies):
+        """
+            :param key: the :meth:`key` of the request
+            :param str body: the rendered response
+            :param dependencies: a :class:`PageView`, :class:`PageListing`,
+                :class:`TagListing` or :class:`TagCounts`
+        """
+        with self._lock:
+            self._entries[key] = (body, dependencies, {})
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *events):
+        """
+            Drops the responses affected by :class:`wiki.events.ChangeEvent`
+            objects, meant to be subscribed to a
+            :class:`wiki.events.ChangeFeed`.
+        """
+        if not self._entries:
+            return
+        for event in events:
+            if event.kind in (DELETED, MOVED):
+                self._changed(event.url, None, ())
+            if event.kind == MOVED:
+                self._read(event.dest_url, event.dest_path)
+            elif event.kind in (CREATED, MODIFIED):
+                self._read(event.url, event.path)
+
+    def _read(self, url, path):
+        page = Page(path, url, lazy=True)
+        try:
+            meta = page.meta
+            links = set(page.links)
+        except (OSError, ValueError):
+            # unreadable for now, it may affect anything
+            self.clear()
+            return
+        self._changed(url, meta, links)
+
+    def _changed(self, url, meta, links):
+        """
+            :param meta: the new metadata of the page, `None` if it is gone
+            :param links: the urls it links to now
+        """
+        with self._lock:
+            for key, (_, dependencies, _) in list(self._entries.items()):
+                old = dependencies.pages.get(url, None)
+                if meta is None:
+                    new = None
+                else:
+                    new = dependencies.value(url, meta, links)
+                if old is ALWAYS or old != new:
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def response_cache():
+    """
+        The app's :class:`ResponseCache`, `None` unless RESPONSE_CACHE is
+        enabled.
+    """
+    return current_app.extensions.get('response_cache')
+
+
+def cached_response():
+    """
+        Looks up the current request in the app's response cache.
+
+        :returns: the cached response, or `None` when caching is off or
+            it was not cached
+    """
+    cache = response_cache()
+    if cache is None:
+        return None
+    key = cache.key()
+    if key is None:
+        return None
+    body = cache.get(key)
+    if body is None:
+        return None
+    g.response_cache_key = key
+    return make_response(body)
+
+
+def cache_response(body, dependencies):
+    """
+        Stores a rendered response in the app's response cache, if it is
+        enabled.
+
+        :param str body: the rendered response
+        :param function dependencies: returns what the response depends
+            on, only called when the cache is enabled
+
+        :returns: the response
+    """
+    cache = response_cache()
+    if cache is not None:
+        key = cache.key()
+        if key is not None:
+            cache.set(key, body, dependencies())
+            g.response_cache_key = key
+    return make_response(body)
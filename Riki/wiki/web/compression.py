@@ -0,0 +1,159 @@
+"""
+    Response compression
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Compresses the HTML, JSON and text responses for clients that accept
+    it: gzip always, brotli and zstd if their modules (``brotli``,
+    ``zstandard``) are installed. Small responses, other content types,
+    downloads and responses that are already encoded are sent as they
+    are. Streamed responses are gzipped chunk by chunk, so they still
+    stream.
+
+    Responses served from or stored in the response cache are compressed
+    once: the compressed body is kept with the cache entry.
+"""
+import gzip
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from flask import current_app
+from flask import g
+from flask import request
+
+from wiki.web.cache import response_cache
+
+#: content types worth compressing, unless COMPRESS_TYPES says otherwise
+TYPES = ('text/html', 'text/plain', 'text/css', 'text/markdown',
+         'text/javascript', 'application/javascript', 'application/json',
+         'image/svg+xml')
+#: responses smaller than this are not worth compressing
+MIN_SIZE = 500
+
+
+def _gzip(data):
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+#: encodings by preference, with their compress function
+CODECS = [('gzip', _gzip)]
+if zstandard is not None:
+    CODECS.insert(0, ('zstd', lambda data: zstandard.ZstdCompressor(
+        level=3).compress(data)))
+if brotli is not None:
+    CODECS.insert(0, ('br', lambda data: brotli.compress(data, quality=5)))
+
+
+def choose_encoding(accept_encodings, codecs=None):
+    """
+        Picks the encoding for a request: the one the client prefers, the
+        one first in `codecs` among equally preferred ones.
+
+        :param accept_encodings: the request's Accept-Encoding, a
+            :class:`werkzeug.datastructures.Accept`
+        :returns: ``(encoding, compress)``, or `None` to send it as it is
+    """
+    best = None
+    for encoding, compress in codecs or CODECS:
+        quality = accept_encodings[encoding]
+        if quality > 0 and (best is None or quality > best[0]):
+            best = quality, encoding, compress
+    if best is None:
+        return None
+    return best[1:]
+
+
+def _compressible(response):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        # files sent with send_file, and what is encoded already
+        return False
+    if 'attachment' in response.headers.get('Content-Disposition', ''):
+        return False
+    if response.cache_control.no_transform:
+        return False
+    types = current_app.config.get('COMPRESS_TYPES', TYPES)
+    return response.mimetype in types
+
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        # flush so every chunk reaches the client as it is produced
+        data += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _weaken(response):
+    # the encoded body is not byte for byte the same, but conditional
+    # requests (which compare weakly) still match the same version
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def _not_modified(response):
+    # a 304 stands in for the 200 the client holds, which was compressed
+    # and sent with a weak ETag if the client accepts an encoding
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return
+    if response.cache_control.no_transform:
+        return
+    if response.mimetype not in current_app.config.get('COMPRESS_TYPES', TYPES):
+        return
+    if choose_encoding(request.accept_encodings) is None:
+        return
+    response.vary.add('Accept-Encoding')
+    _weaken(response)
+
+
+def compress(response):
+    """Compresses `response` if the client accepts it and it is worth it."""
+    if response.status_code == 304:
+        _not_modified(response)
+        return response
+    if not _compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.is_streamed:
+        if request.accept_encodings['gzip'] <= 0:
+            return response
+        response.response = _gzip_stream(response.iter_encoded())
+        response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = 'gzip'
+        _weaken(response)
+        return response
+    choice = choose_encoding(request.accept_encodings)
+    if choice is None:
+        return response
+    data = response.get_data()
+    if len(data) < current_app.config.get('COMPRESS_MIN_SIZE', MIN_SIZE):
+        return response
+    encoding, codec = choice
+    key = g.get('response_cache_key')
+    cache = response_cache()
+    if key is not None and cache is not None:
+        body = cache.encoded(key, encoding, lambda: codec(data))
+    else:
+        body = codec(data)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    _weaken(response)
+    return response
+
+
+def init_app(app):
+    """Compresses the responses of `app`."""
+    app.after_request(compress)
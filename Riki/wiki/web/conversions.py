@@ -0,0 +1,218 @@
+"""
+    Conversion cache
+    ~~~~~~~~~~~~~~~~
+
+    The download dialog converts a page twice: once to report the size
+    (``/convert/``) and once for the download itself. Converted files are
+    therefore kept in a cache keyed by what they are made from: the page
+    content, the file type and :attr:`Converter.VERSION`. The same page
+    version is never converted twice as long as it is cached. The key also
+    covers the page's title (its url if it has none), which the PDF and
+    HTML files show, so pages with the same content do not share files.
+
+    Entries are the bytes of the files, which downloads send as they are.
+    The cache holds CONVERSION_CACHE_SIZE bytes in memory; what falls out
+    is spilled to CONVERSION_CACHE_DIR (``.conversions`` in the content
+    directory), which holds CONVERSION_CACHE_DISK bytes and is shared by
+    all processes of the wiki. Files that other processes may ask for, like
+    the results of conversion jobs, are written there right away.
+"""
+from collections import OrderedDict
+import hashlib
+from io import BytesIO
+import os
+import threading
+
+from flask import current_app
+
+from wiki.web import metrics
+from wiki.web import workers
+from wiki.web.converter import Converter
+
+
+class Artifact(object):
+    """
+        A converted file, in memory (`data`) or on disk (`path`).
+    """
+
+    def __init__(self, key, size, data=None, path=None):
+        self.key = key
+        self.size = size
+        self.data = data
+        self.path = path
+
+    def open(self):
+        """:returns: the file, to read it from the start"""
+        if self.data is not None:
+            return BytesIO(self.data)
+        return open(self.path, 'rb')
+
+
+class ConversionCache(object):
+    """
+        :param int maxsize: bytes kept in memory
+        :param str directory: where entries go when they fall out of
+            memory, `None` to drop them
+        :param int disk_size: bytes kept in `directory`
+    """
+
+    def __init__(self, maxsize=32 * 1024 * 1024, directory=None,
+                 disk_size=256 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.disk_size = disk_size
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(content, filetype, title):
+        """
+            :param str title: the title of the page, as
+                :attr:`wiki.core.Page.title` returns it
+            :returns: the key of `content` converted to `filetype`
+            :rtype: str
+        """
+        digest = hashlib.sha1('{0}\0{1}\0{2}\0'.format(
+            Converter.VERSION, filetype.lower(), title).encode('utf-8'))
+        digest.update(content.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """
+            :returns: the :class:`Artifact`, `None` if it is not cached
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return Artifact(key, len(data), data=data)
+        if self.directory is not None:
+            path = self._path(key)
+            try:
+                # the modification time orders the disk entries
+                os.utime(path)
+                size = os.path.getsize(path)
+            except OSError:
+                pass
+            else:
+                with self._lock:
+                    self.hits += 1
+                return Artifact(key, size, path=path)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, data, shared=False):
+        """
+            Caches a converted file.
+
+            :param bytes data: the file
+            :param bool shared: write it to the directory right away, for
+                the other processes
+            :returns: its :class:`Artifact`
+        """
+        if shared and self.directory is not None and \
+                len(data) <= self.maxsize:
+            self._spill(key, data)
+            self._prune()
+        if len(data) > self.maxsize:
+            # too large for memory, straight to disk
+            if self.directory is None:
+                return Artifact(key, len(data), data=data)
+            self._spill(key, data)
+            self._prune()
+            return Artifact(key, len(data), path=self._path(key))
+        spilled = []
+        with self._lock:
+            if key not in self._entries:
+                self.size += len(data)
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while self.size > self.maxsize:
+                old_key, old_data = self._entries.popitem(last=False)
+                self.size -= len(old_data)
+                spilled.append((old_key, old_data))
+        if self.directory is not None and spilled:
+            for old_key, old_data in spilled:
+                if not os.path.exists(self._path(old_key)):
+                    self._spill(old_key, old_data)
+            self._prune()
+        return Artifact(key, len(data), data=data)
+
+    def _spill(self, key, data):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp = '{0}.{1}.{2}.tmp'.format(
+            path, os.getpid(), threading.get_ident())
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _prune(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.tmp'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # another process pruned it
+                pass
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+
+def conversion_cache():
+    """The app's :class:`ConversionCache`."""
+    return current_app.extensions['conversions']
+
+
+def init_app(app):
+    directory = app.config.get('CONVERSION_CACHE_DIR') or os.path.join(
+        app.config['CONTENT_DIR'], '.conversions')
+    app.extensions['conversions'] = ConversionCache(
+        app.config.get('CONVERSION_CACHE_SIZE', 32 * 1024 * 1024),
+        directory,
+        app.config.get('CONVERSION_CACHE_DISK', 256 * 1024 * 1024))
+
+
+def convert(page, filetype):
+    """
+        Converts a page, or finds it converted in the cache.
+
+        :returns: the :class:`Artifact`
+        :raises AttributeError: for an unknown file type
+    """
+    cache = conversion_cache()
+    key = cache.key(page.content, filetype, page.title)
+    artifact = cache.get(key)
+    if artifact is None:
+        conversion = workers.convert(page, filetype)
+        metrics.CONVERSIONS.inc(filetype.lower())
+        artifact = cache.set(key, conversion.data)
+    return artifact
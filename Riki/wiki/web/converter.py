@@ -1,5 +1,7 @@
 import base64
-import markdown2
+import functools
+import html
+import os
 from docx import Document
 from io import BytesIO
 from pdfdocument.document import PDFDocument
@@ -16,8 +18,20 @@ def get_file_size(data):
         str: A string with the formatted file size.
 
     """
-    size_in_bytes = len(data)
+    return format_file_size(len(data))
 
+
+def format_file_size(size_in_bytes):
+    """
+    Format a file size for readability.
+
+    Args:
+        size_in_bytes (int): The size to format.
+
+    Returns:
+        str: A string with the formatted file size.
+
+    """
     units = ['B', 'KB', 'MB', 'GB']
     factor = 1024
     size = size_in_bytes
@@ -37,50 +51,204 @@ def get_file_size(data):
     return formatted_size
 
 
+MIMETYPES = {
+    'pdf': 'application/pdf',
+    'txt': 'text/plain; charset=utf-8',
+    'html': 'text/html; charset=utf-8',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+}
+
+
+STANDALONE_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+{css}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+{body}
+</body>
+</html>
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def pygments_css():
+    """
+    Returns the code highlighting styles of the wiki, read once.
+    """
+    path = os.path.join(os.path.dirname(__file__), 'static', 'pygments.css')
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+class Conversion(object):
+    """
+    The result of a conversion, as bytes.
+
+    Attributes:
+        data (bytes): The converted file.
+        filetype (str): The file type, e.g. 'pdf'.
+        mimetype (str): The MIME type of the file.
+        size (int): The size of the file in bytes.
+
+    """
+
+    def __init__(self, data, filetype):
+        self.data = data
+        self.filetype = filetype.lower()
+        self.mimetype = MIMETYPES.get(self.filetype, 'application/octet-stream')
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    @property
+    def formatted_size(self):
+        return format_file_size(self.size)
+
+    def open(self):
+        """
+        Returns the file as a file-like object, without copying it.
+        """
+        return BytesIO(self.data)
+
+    def base64(self):
+        """
+        Returns the file encoded as base64 text, for callers that need text.
+        """
+        return base64.b64encode(self.data).decode('utf-8')
+
+
 class Converter(object):
     """
     converts content to different formats.
 
     Attributes:
         page (object): The page object to be converted.
+        standalone (bool): Whether HTML is a complete document with the
+            code highlighting styles inlined, instead of the page body only.
 
     Methods:
-        convert_to_PDF(): Convert content to PDF format.
-        convert_to_TXT(): Convert content to plain text format.
-        convert_to_HTML(): Convert content to HTML format.
-        convert_to_DOCX(): Convert content to DOCX format.
+        convert(filetype): Convert content to a format, as a Conversion.
+        to_PDF(), to_TXT(), to_HTML(), to_DOCX(): Convert content to a format, as bytes.
+        convert_to_PDF(), convert_to_TXT(), convert_to_HTML(), convert_to_DOCX():
+            Convert content to a format, as base64 text and the formatted size.
 
     """
 
-    def __init__(self, page):
+    #: bump when the output of a conversion changes, cached conversions
+    #: of older versions are not used anymore
+    VERSION = 2
+
+    def __init__(self, page, standalone=False):
         """
         Initialize Converter object.
 
         Args:
             page (object): The page object to be converted.
+            standalone (bool): Whether HTML is a complete document.
 
         """
         self.page = page
+        self.standalone = standalone
+
+    @classmethod
+    def supports(cls, filetype):
+        return hasattr(cls, 'to_' + filetype.upper())
+
+    def convert(self, filetype):
+        """
+        Convert content to a format.
+
+        Args:
+            filetype (str): The file type, e.g. 'pdf'.
+
+        Returns:
+            Conversion: The converted file.
+
+        Raises:
+            AttributeError: If the file type is not supported.
 
-    def convert_to_PDF(self):
+        """
+        data = getattr(self, 'to_' + filetype.upper())()
+        return Conversion(data, filetype)
+
+    def to_PDF(self):
         """
         Convert content to PDF format.
 
         Returns:
-            tuple: A tuple containing PDF content as base64 and file size.
+            bytes: The PDF file.
 
         """
-        markdown_content = self.page.content
         pdf_buffer = BytesIO()
         pdf_content = PDFDocument(pdf_buffer)
         pdf_content.init_report()
         pdf_content.h1(self.page.title)
-        pdf_content.p(markdown_content)
+        pdf_content.p(self.page.content)
         pdf_content.generate()
-        pdf_bytes = pdf_buffer.getvalue()
-        pdf_base64 = base64.b64encode(pdf_bytes).decode('utf-8')
-        file_size = get_file_size(pdf_bytes)
-        return pdf_base64, file_size
+        return pdf_buffer.getvalue()
+
+    def to_TXT(self):
+        """
+        Convert content to plain text format.
+
+        Returns:
+            bytes: The text, UTF-8 encoded.
+
+        """
+        return self.page.content.encode('utf-8')
+
+    def to_HTML(self):
+        """
+        Convert content to HTML format.
+
+        The page is rendered like the wiki shows it, and usually is already,
+        in the render cache. Wiki links are resolved with url_for, which
+        needs an application or request context.
+
+        Returns:
+            bytes: The HTML, UTF-8 encoded.
+
+        """
+        body = self.page.html
+        if self.standalone:
+            body = STANDALONE_HTML.format(
+                title=html.escape(self.page.title), css=pygments_css(), body=body)
+        return body.encode('utf-8')
+
+    def to_DOCX(self):
+        """
+        Convert content to DOCX format.
+
+        Returns:
+            bytes: The DOCX file.
+
+        """
+        doc = Document()
+        doc.add_paragraph(self.page.content)
+        docx_content = BytesIO()
+        doc.save(docx_content)
+        return docx_content.getvalue()
+
+    def _convert_to_base64(self, filetype):
+        conversion = self.convert(filetype)
+        return conversion.base64(), conversion.formatted_size
+
+    def convert_to_PDF(self):
+        """
+        Convert content to PDF format.
+
+        Returns:
+            tuple: A tuple containing PDF content as base64 and file size.
+
+        """
+        return self._convert_to_base64('pdf')
 
     def convert_to_TXT(self):
         """
@@ -90,10 +258,7 @@ class Converter(object):
             tuple: A tuple containing text content as base64 and file size.
 
         """
-        txt_content = self.page.content.encode('utf-8')
-        txt_base64 = base64.b64encode(txt_content).decode('utf-8')
-        formatted_size = get_file_size(txt_content)
-        return txt_base64, formatted_size
+        return self._convert_to_base64('txt')
 
     def convert_to_HTML(self):
         """
@@ -103,11 +268,7 @@ class Converter(object):
             tuple: A tuple containing HTML content as base64 and file size.
 
         """
-        html_content = markdown2.markdown(self.page.content)
-        html_content_bytes = html_content.encode('utf-8')
-        html_base64 = base64.b64encode(html_content_bytes).decode('utf-8')
-        formatted_size = get_file_size(html_content_bytes)
-        return html_base64, formatted_size
+        return self._convert_to_base64('html')
 
     def convert_to_DOCX(self):
         """
@@ -117,11 +278,4 @@ class Converter(object):
             tuple: A tuple containing DOCX content as base64 and file size.
 
         """
-        doc = Document()
-        doc.add_paragraph(self.page.content)
-        docx_content = BytesIO()
-        doc.save(docx_content)
-        docx_bytes = docx_content.getvalue()
-        docx_base64 = base64.b64encode(docx_bytes).decode('utf-8')
-        file_size = get_file_size(docx_bytes)
-        return docx_base64, file_size
+        return self._convert_to_base64('docx')
@@ -0,0 +1,208 @@
+"""
+    Bulk export
+    ~~~~~~~~~~~
+
+    Exports many pages in one format as a ZIP archive: all pages, the
+    pages with a tag or the pages under a url prefix. The pages are
+    converted in parallel on the conversion process pool and every entry
+    is written to the archive as soon as it is converted, so the archive
+    is streamed and never held in memory as a whole. Conversions in the
+    conversion cache are used as they are.
+
+    run with python -m wiki.web.export <content directory> --format pdf
+    [--tag TAG] [--prefix PREFIX] [-o export.zip] from the Riki directory
+"""
+import argparse
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+import os
+import sys
+import time
+import zipfile
+
+from wiki.web import workers
+from wiki.web.converter import Converter
+
+#: formats that are compressed already, stored as they are
+STORED = {'pdf', 'docx'}
+
+
+def select(wiki, tag=None, prefix=None):
+    """
+        The pages to export, sorted by title.
+
+        :param str tag: only the pages with this tag
+        :param str prefix: only the pages whose url starts with it
+        :rtype: list
+    """
+    pages = wiki.index_by_tag(tag) if tag else wiki.index()
+    if prefix:
+        prefix = prefix.strip('/')
+        pages = [page for page in pages if page.url == prefix or
+                 page.url.startswith(prefix + '/')]
+    return pages
+
+
+class _Output(object):
+    """The archive's file: collects what is written until it is taken."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _info(page, filetype):
+    try:
+        date_time = time.localtime(os.path.getmtime(page.path))[:6]
+    except OSError:
+        date_time = time.localtime()[:6]
+    info = zipfile.ZipInfo('{0}.{1}'.format(page.url, filetype), date_time)
+    if filetype in STORED:
+        info.compress_type = zipfile.ZIP_STORED
+    else:
+        info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+
+def _content(page, filetype, cache):
+    """The exported file of a page, if it needs no conversion."""
+    if filetype == 'md':
+        return page.content.encode('utf-8')
+    if cache is not None:
+        artifact = cache.get(cache.key(page.content, filetype, page.title))
+        if artifact is not None:
+            with artifact.open() as f:
+                return f.read()
+    return None
+
+
+def export(pages, filetype, pool=None, cache=None, pool_size=1):
+    """
+        Writes a ZIP archive of the pages, chunk by chunk.
+
+        :param str filetype: ``md`` or a format of
+            :class:`wiki.web.converter.Converter`
+        :param pool: the process pool to convert in, `None` to convert
+            one page after the other right here
+        :param cache: a :class:`wiki.web.conversions.ConversionCache` to
+            take conversions from
+        :param int pool_size: the number of conversions the pool runs at
+            a time; twice as many are submitted at most, which bounds the
+            converted files held in memory
+
+        :returns: an iterator over the bytes of the archive
+        :raises AttributeError: for an unknown file type
+    """
+    filetype = filetype.lower()
+    if filetype != 'md' and not Converter.supports(filetype):
+        raise AttributeError('cannot convert to ' + filetype)
+    window = 2 * max(pool_size, 1)
+    return _chunks(pages, filetype, pool, cache, window)
+
+
+def _chunks(pages, filetype, pool, cache, window):
+    output = _Output()
+    archive = zipfile.ZipFile(output, 'w')
+    failed = []
+    pending = {}
+
+    def finish(page, data):
+        archive.writestr(_info(page, filetype), data)
+
+    def collect(block):
+        done = [future for future in pending if future.done()]
+        if block and not done:
+            done = wait(pending, return_when=FIRST_COMPLETED).done
+        for future in done:
+            page = pending.pop(future)
+            try:
+                finish(page, future.result().data)
+            except Exception as e:
+                failed.append('{0}: {1}'.format(page.url, e))
+
+    try:
+        for page in pages:
+            data = _content(page, filetype, cache)
+            if data is not None:
+                finish(page, data)
+            elif pool is None:
+                try:
+                    finish(page, workers.local(page, filetype).data)
+                except Exception as e:
+                    failed.append('{0}: {1}'.format(page.url, e))
+            else:
+                pending[workers.submit(pool, page, filetype)] = page
+                if len(pending) >= window:
+                    collect(block=True)
+                else:
+                    collect(block=False)
+            chunk = output.take()
+            if chunk:
+                yield chunk
+        while pending:
+            collect(block=True)
+            chunk = output.take()
+            if chunk:
+                yield chunk
+        if failed:
+            archive.writestr('errors.txt', '\n'.join(failed) + '\n')
+        archive.close()
+        yield output.take()
+    finally:
+        for future in pending:
+            # the client went away, do not convert the rest
+            future.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('directory', help='the content directory')
+    parser.add_argument('--format', default='md', help='md, pdf, docx, ...')
+    parser.add_argument('--tag', help='only the pages with this tag')
+    parser.add_argument('--prefix', help='only the pages under this url')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                        help='conversion processes')
+    parser.add_argument('-o', '--output', help='the ZIP file, - for stdout')
+    args = parser.parse_args()
+
+    from wiki.web import create_app
+    from wiki.web.conversions import conversion_cache
+    app = create_app(os.path.abspath(args.directory))
+    if args.format != 'md':
+        app.config['CONVERSION_PROCESSES'] = args.processes
+    output = args.output or 'export-{0}.zip'.format(args.format)
+    # HTML rendering builds links with url_for
+    with app.test_request_context():
+        pages = select(app.extensions['wiki'].get(), args.tag, args.prefix)
+        pool = workers.conversion_pool(app)
+        try:
+            chunks = export(pages, args.format, pool, conversion_cache(),
+                            workers.pool_size(app))
+            if output == '-':
+                for chunk in chunks:
+                    sys.stdout.buffer.write(chunk)
+            else:
+                with open(output, 'wb') as f:
+                    for chunk in chunks:
+                        f.write(chunk)
+        finally:
+            workers.shutdown(app)
+            app.extensions['wiki'].close()
+    if output != '-':
+        print('{0} pages exported to {1}'.format(len(pages), output),
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
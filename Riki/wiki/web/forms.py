@@ -32,6 +32,9 @@ class SearchForm(FlaskForm):
         description='Ignore Case',
         # FIXME: default is not correctly populated
         default=True)
+    regex = BooleanField(
+        description='Regular Expression',
+        default=False)
 
 
 class EditorForm(FlaskForm):
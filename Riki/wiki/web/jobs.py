@@ -0,0 +1,199 @@
+"""
+    Conversion jobs
+    ~~~~~~~~~~~~~~~
+
+    /convert/ does not convert in the request: it submits a job to the
+    conversion pool (CONVERSION_PROCESSES processes, else 2 threads) and
+    answers with the job's status, which the browser then polls until
+    the job is done. The result goes to the conversion cache, written to
+    its directory right away, and downloads take it from there.
+
+    A job is known by the key of its conversion in the cache, so any
+    process of the wiki can answer a poll: with the job if it took it,
+    with the file if it is in the cache's directory, or by taking over
+    the conversion. Jobs keep no files, only their state, for
+    CONVERSION_JOB_TTL seconds; at most CONVERSION_MAX_JOBS of them wait
+    or run at a time.
+"""
+import threading
+import time
+
+from flask import current_app
+
+from wiki.web import metrics
+from wiki.web import workers
+from wiki.web.conversions import conversion_cache
+from wiki.web.converter import Converter
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job(object):
+    """
+        The conversion of one page version to one file type.
+    """
+
+    def __init__(self, url, filetype, key):
+        #: the key of the conversion in the cache
+        self.id = self.key = key
+        self.url = url
+        self.filetype = filetype
+        self.created = time.time()
+        self.finished = None
+        self.future = None
+        #: the size of the converted file, once it is done
+        self.size = None
+        self.error = None
+
+    @property
+    def status(self):
+        if self.size is not None:
+            return DONE
+        if self.error is not None:
+            return FAILED
+        if self.future is not None and self.future.running():
+            return RUNNING
+        return QUEUED
+
+    def wait(self, timeout):
+        """
+            Waits up to `timeout` seconds for the job to finish.
+
+            :returns: whether it is finished
+        """
+        if self.future is not None and timeout > 0:
+            done = threading.Event()
+            self.future.add_done_callback(lambda future: done.set())
+            done.wait(timeout)
+            # the queue's callback, registered first, has run by now
+        return self.status in (DONE, FAILED)
+
+
+class JobQueue(object):
+    """
+        :param int ttl: seconds finished jobs are kept
+        :param int max_jobs: the maximum number of unfinished jobs
+    """
+
+    def __init__(self, ttl=600, max_jobs=64):
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._jobs)
+
+    def get(self, job_id):
+        """
+            :returns: the :class:`Job` of this process, `None` if it is
+                unknown or expired
+        """
+        self.expire()
+        return self._jobs.get(job_id)
+
+    def submit(self, page, filetype, pool, cache):
+        """
+            Starts converting a page, unless it is converted or being
+            converted already.
+
+            :param pool: the process pool to convert in
+            :param cache: the :class:`wiki.web.conversions.ConversionCache`
+                the result goes to
+            :returns: the :class:`Job`
+            :raises QueueFull: if there are `max_jobs` unfinished jobs
+        """
+        self.expire()
+        key = cache.key(page.content, filetype, page.title)
+        # the lock only guards the jobs, looking into the cache (which
+        # may touch the disk) and converting happen outside of it
+        job = self._find(key)
+        if job is not None:
+            return job
+        artifact = cache.get(key)
+        with self._lock:
+            job = self._find(key)
+            if job is not None:
+                return job
+            if artifact is None and self.pending() >= self.max_jobs:
+                raise QueueFull('too many conversions are waiting')
+            job = Job(page.url, filetype, key)
+            if artifact is not None:
+                job.size = artifact.size
+                job.finished = job.created
+            self._jobs[job.id] = job
+        if artifact is not None:
+            return job
+        try:
+            future = workers.submit(pool, page, filetype)
+        except Exception as e:
+            job.error = str(e) or e.__class__.__name__
+            job.finished = time.time()
+            return job
+        future.add_done_callback(
+            lambda future: self._finished(job, future, cache))
+        job.future = future
+        return job
+
+    def _find(self, key):
+        job = self._jobs.get(key)
+        if job is not None and job.status != FAILED:
+            return job
+        return None
+
+    def pending(self):
+        return sum(1 for job in self._jobs.values()
+                   if job.status in (QUEUED, RUNNING))
+
+    def _finished(self, job, future, cache):
+        try:
+            conversion = future.result()
+        except Exception as e:
+            job.error = str(e) or e.__class__.__name__
+        else:
+            metrics.CONVERSIONS.inc(job.filetype.lower())
+            # polls and downloads may come to other processes
+            cache.set(job.key, conversion.data, shared=True)
+            job.size = len(conversion.data)
+        job.finished = time.time()
+
+    def expire(self):
+        """Drops the jobs that finished more than `ttl` seconds ago."""
+        limit = time.time() - self.ttl
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.finished is not None and job.finished < limit:
+                    del self._jobs[job_id]
+
+
+def job_queue():
+    """The app's :class:`JobQueue`."""
+    return current_app.extensions['jobs']
+
+
+def init_app(app):
+    app.extensions['jobs'] = JobQueue(
+        app.config.get('CONVERSION_JOB_TTL', 600),
+        app.config.get('CONVERSION_MAX_JOBS', 64))
+
+
+def submit(page, filetype):
+    """
+        Submits the conversion of a page with the app's pool and cache.
+
+        :returns: the :class:`Job`
+        :raises AttributeError: for an unknown file type
+        :raises QueueFull: if too many conversions are waiting
+    """
+    if not Converter.supports(filetype):
+        raise AttributeError('cannot convert to ' + filetype)
+    return job_queue().submit(page, filetype,
+                              workers.conversion_pool(threads=2),
+                              conversion_cache())
@@ -0,0 +1,212 @@
+"""
+    Metrics
+    ~~~~~~~
+
+    Request latencies and a few counters, exposed on ``/metrics`` in the
+    Prometheus text format. Recording is a lock and a few additions per
+    request, and the cache statistics are only read when scraped, so the
+    metrics can stay on under load.
+
+    Every process keeps its own numbers, so with a multi-process server
+    every process has to be scraped (or only one is seen).
+"""
+from bisect import bisect_left
+import threading
+import time
+
+from flask import current_app
+from flask import g
+from flask import request
+
+from wiki.core import render_cache
+from wiki.preview import block_cache
+
+#: upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n') \
+        .replace('"', r'\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{0}="{1}"'.format(name, _escape(value))
+                          for name, value in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return repr(int(value))
+    return repr(value)
+
+
+class Counter(object):
+    """A counter, optionally split by labels."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        """
+            :param labels: the values of the labels, in order
+            :param amount: what to add
+        """
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name, _labels(self.labels, key), value)
+                for key, value in values]
+
+
+class Histogram(object):
+    """A histogram with fixed buckets, optionally split by labels."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # per bucket counts (the last one is +Inf) and the sum
+                counts = [0] * (len(self.buckets) + 1) + [0.0]
+                self._values[labels] = counts
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(counts))
+                            for key, counts in self._values.items())
+        samples = []
+        for key, counts in values:
+            total = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                total += count
+                samples.append((self.name + '_bucket', _labels(
+                    self.labels, key, [('le', _number(bound))]), total))
+            samples.append((self.name + '_sum', _labels(self.labels, key),
+                            counts[-1]))
+            samples.append((self.name + '_count', _labels(self.labels, key),
+                            total))
+        return samples
+
+
+class Collected(object):
+    """
+        A counter whose samples are taken from elsewhere when scraped.
+
+        :param function collect: returns ``(label values, value)`` pairs
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels, collect):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def samples(self):
+        return [(self.name, _labels(self.labels, key), value)
+                for key, value in self.collect()]
+
+
+def _cache_requests():
+    caches = [('render', render_cache), ('preview', block_cache)]
+    for name in ('response_cache', 'conversions'):
+        cache = current_app.extensions.get(name)
+        if cache is not None:
+            caches.append((name.replace('_cache', ''), cache))
+    for name, cache in caches:
+        yield (name, 'hit'), cache.hits
+        yield (name, 'miss'), cache.misses
+
+
+REQUEST_SECONDS = Histogram(
+    'riki_request_duration_seconds', 'Time spent handling requests.',
+    ['endpoint', 'method'])
+RESPONSES = Counter(
+    'riki_responses_total', 'Responses sent, by endpoint and status.',
+    ['endpoint', 'status'])
+CONVERSIONS = Counter(
+    'riki_conversions_total', 'Pages converted for download, by file type.',
+    ['type'])
+UPLOAD_BYTES = Counter(
+    'riki_upload_bytes_total', 'Bytes of uploaded files.')
+PAGE_RENDERS = Collected(
+    'riki_page_renders_total', 'Pages rendered from Markdown.', [],
+    lambda: [((), render_cache.misses)])
+CACHE_REQUESTS = Collected(
+    'riki_cache_requests_total', 'Cache lookups, by cache and result.',
+    ['cache', 'result'], _cache_requests)
+
+METRICS = [REQUEST_SECONDS, RESPONSES, CONVERSIONS, UPLOAD_BYTES,
+           PAGE_RENDERS, CACHE_REQUESTS]
+
+
+def render():
+    """
+        Renders all metrics in the Prometheus text format.
+
+        :rtype: str
+    """
+    lines = []
+    for metric in METRICS:
+        lines.append('# HELP {0} {1}'.format(metric.name, metric.help))
+        lines.append('# TYPE {0} {1}'.format(metric.name, metric.kind))
+        for name, labels, value in metric.samples():
+            lines.append('{0}{1} {2}'.format(name, labels, _number(value)))
+    return '\n'.join(lines) + '\n'
+
+
+def _start():
+    g._metrics_start = time.perf_counter()
+
+
+def _status(response):
+    g._metrics_status = response.status_code
+    return response
+
+
+def _finish(exception=None):
+    start = g.pop('_metrics_start', None)
+    if start is None:
+        return
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint,
+                            request.method)
+    RESPONSES.inc(endpoint, str(g.pop('_metrics_status', 500)))
+
+
+def init_app(app):
+    """
+        Records the latency and status of every request of `app`.
+    """
+    app.before_request(_start)
+    app.after_request(_status)
+    app.teardown_request(_finish)
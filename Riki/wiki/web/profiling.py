@@ -0,0 +1,177 @@
+"""
+    Profiling
+    ~~~~~~~~~
+
+    Profiles live requests with cProfile: a sampled fraction of them
+    (PROFILE_SAMPLE, 0.01 is one in a hundred) and those of admins that
+    carry the PROFILE_HEADER header. Every profile is written as a
+    ``.prof`` file, which ``python -m pstats`` and snakeviz read, next to
+    a ``.json`` file describing the request. Only the latest PROFILE_KEEP
+    profiles are kept in PROFILE_DIR.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import threading
+import time
+
+from flask import current_app
+from flask import g
+from flask import request
+
+from wiki.web.user import is_admin
+
+
+class ProfileStore(object):
+    """
+        A directory of profiles, which deletes the oldest ones beyond
+        `keep`.
+    """
+
+    def __init__(self, directory, keep=100):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._count = 0
+
+    def save(self, profiler, info):
+        """
+            Writes a profile.
+
+            :param profiler: a disabled :class:`cProfile.Profile`
+            :param dict info: what was profiled, stored next to it
+
+            :returns: the name of the profile
+            :rtype: str
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self._count += 1
+            name = '{0}-{1}-{2}'.format(
+                int(info['time'] * 1000), os.getpid(), self._count)
+        profiler.dump_stats(self.path(name, '.prof'))
+        with open(self.path(name, '.json'), 'w') as f:
+            json.dump(dict(info, name=name), f)
+        self.rotate()
+        return name
+
+    def path(self, name, extension='.prof'):
+        return os.path.join(self.directory, os.path.basename(name) + extension)
+
+    def names(self):
+        """The names of the stored profiles, oldest first."""
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        names = [name[:-5] for name in files if name.endswith('.prof')]
+        return sorted(names, key=lambda name: [
+            int(part) for part in name.split('-') if part.isdigit()])
+
+    def rotate(self):
+        names = self.names()
+        for name in names[:max(len(names) - self.keep, 0)]:
+            for extension in ('.prof', '.json'):
+                try:
+                    os.remove(self.path(name, extension))
+                except FileNotFoundError:
+                    # another process rotated it
+                    pass
+
+    def info(self, name):
+        """
+            :returns: what was profiled, `None` if it is gone
+            :rtype: dict
+        """
+        try:
+            with open(self.path(name, '.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def slowest(self, limit=50):
+        """
+            :returns: the infos of the slowest profiled requests
+            :rtype: list
+        """
+        infos = [info for info in map(self.info, self.names()) if info]
+        infos.sort(key=lambda info: info['duration'], reverse=True)
+        return infos[:limit]
+
+    def stats(self, name, sort='cumulative', limit=40):
+        """
+            :returns: the pstats report of a profile, `None` if it is gone
+            :rtype: str
+        """
+        path = self.path(name, '.prof')
+        if not os.path.exists(path):
+            return None
+        out = io.StringIO()
+        stats = pstats.Stats(path, stream=out)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+def profile_store():
+    """
+        The app's :class:`ProfileStore`, `None` unless PROFILE is enabled.
+    """
+    return current_app.extensions.get('profiles')
+
+
+def _wanted():
+    config = current_app.config
+    header = config.get('PROFILE_HEADER', 'X-Profile')
+    if request.headers.get(header) and is_admin():
+        return True
+    sample = config.get('PROFILE_SAMPLE', 0.0)
+    return sample > 0 and random.random() < sample
+
+
+def _start():
+    if not _wanted():
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # another profiler is active in this thread
+        return
+    g._profile = profiler, time.time(), time.perf_counter()
+
+
+def _finish(exception=None):
+    started = g.pop('_profile', None)
+    if started is None:
+        return
+    profiler, start, counter = started
+    profiler.disable()
+    duration = time.perf_counter() - counter
+    current_app.extensions['profiles'].save(profiler, {
+        'time': start,
+        'duration': duration,
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'endpoint': request.endpoint,
+        'status': g.pop('_profile_status', 500),
+    })
+
+
+def _status(response):
+    if '_profile' in g:
+        g._profile_status = response.status_code
+    return response
+
+
+def init_app(app):
+    """Profiles the requests of `app` as configured."""
+    directory = app.config.get('PROFILE_DIR') or os.path.join(
+        app.config['CONTENT_DIR'], '.profiles')
+    app.extensions['profiles'] = ProfileStore(
+        directory, app.config.get('PROFILE_KEEP', 100))
+    app.before_request(_start)
+    app.after_request(_status)
+    app.teardown_request(_finish)
@@ -3,9 +3,17 @@
     ~~~~~~
 """
 import base64
+import hmac
+import json
+import os
 from io import BytesIO
 from flask import Blueprint, make_response, send_file
-from wiki.web.user import UserManager
+from flask import abort
+from flask import current_app
+from flask import Response
+from flask import session
+from flask import stream_with_context
+from flask import stream_template
 from flask import flash
 from flask import redirect
 from flask import render_template
@@ -15,17 +23,30 @@ from flask_login import current_user
 from flask_login import login_required
 from flask_login import login_user
 from flask_login import logout_user
-from wiki.core import Processor
-from wiki.web.converter import Converter, get_file_size
+from wiki.index import position
+from wiki.preview import join_blocks, render_blocks
+from wiki.web.cache import cache_response, cached_response, response_cache
+from wiki.web.cache import is_fresh, page_validators, set_validators
+from wiki.web.cache import PageListing, PageView, TagCounts, TagListing
+from wiki.web.converter import Converter
+from wiki.web.converter import format_file_size, get_file_size, MIMETYPES
 from wiki.web.forms import EditorForm
 from wiki.web.forms import LoginForm
 from wiki.web.forms import SearchForm
 from wiki.web.forms import URLForm
+from wiki.web import metrics
+from wiki.web import conversions
+from wiki.web import export as exporter
+from wiki.web import workers
+from wiki.web.jobs import DONE, FAILED, QUEUED, RUNNING
+from wiki.web.jobs import job_queue, QueueFull
+from wiki.web.jobs import submit as submit_job
+from wiki.web.profiling import profile_store
 from wiki.web import current_wiki
 from wiki.web import current_users
+from wiki.web.user import admin_required
 from wiki.web.user import protect
 from wiki.web.forms import RegisterForm
-from config import USER_DIR
 from wiki.web.user import UserRegistrationController
 from wiki.web.file_storage import FileManager
 
@@ -36,24 +57,108 @@ DIRECTORY = "UserFileStorage"
 @bp.route('/')
 @protect
 def home():
-    page = current_wiki.get('home')
-    if page:
+    # display() decides whether the page has to be loaded at all
+    if current_wiki.exists('home'):
         return display('home')
     return render_template('home.html')
 
 
+def encode_cursor(page):
+    """
+    Encode the position of a page in the title order for the url.
+
+    Args:
+        page (object): A page of the index.
+
+    Returns:
+        str: An opaque cursor.
+
+    """
+    data = json.dumps(position(page)).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor made by encode_cursor.
+
+    Args:
+        cursor (str): The cursor from the url, may be None.
+
+    Returns:
+        tuple: The position, or None if there is no cursor.
+
+    """
+    if not cursor:
+        return None
+    try:
+        sort_key, url = json.loads(base64.urlsafe_b64decode(cursor))
+    except (ValueError, TypeError):
+        abort(400)
+    if not isinstance(sort_key, str) or not isinstance(url, str):
+        abort(400)
+    return sort_key, url
+
+
 @bp.route('/index/')
 @protect
 def index():
-    pages = current_wiki.index()
-    return render_template('index.html', pages=pages)
+    """
+    Route to list the wiki's pages by title, a window at a time.
+
+    The window follows the page of the `after` cursor or ends before
+    the page of the `before` cursor. The listing is streamed unless it
+    is kept in the response cache or has flashed messages to show (they
+    have to be removed from the session before the response starts).
+
+    Returns:
+        flask.Response: The rendered window of the index.
+
+    """
+    response = cached_response()
+    if response is not None:
+        return response
+    limit = current_app.config.get('INDEX_PAGE_SIZE', 200)
+    after = decode_cursor(request.args.get('after'))
+    before = None if after else decode_cursor(request.args.get('before'))
+    pages = current_wiki.index(after=after, before=before, limit=limit + 1)
+    more = len(pages) > limit
+    if before:
+        pages = pages[-limit:]
+        previous, following = more, True
+    else:
+        pages = pages[:limit]
+        previous, following = after is not None, more
+    context = {
+        'pages': pages,
+        'previous': encode_cursor(pages[0]) if previous and pages else None,
+        'next': encode_cursor(pages[-1]) if following and pages else None,
+    }
+    if response_cache() is not None or session.get('_flashes'):
+        return cache_response(render_template('index.html', **context),
+                              lambda: PageListing(pages))
+    return Response(stream_template('index.html', **context))
 
 
 @bp.route('/<path:url>/')
 @protect
 def display(url):
-    page = current_wiki.get_or_404(url)
-    return render_template('page.html', page=page)
+    validators = page_validators(current_wiki, url)
+    if validators is None:
+        page = current_wiki.get_or_404(url)
+        backlinks = current_wiki.backlinks(url)
+        return render_template('page.html', page=page, backlinks=backlinks)
+    etag, last_modified, backlinks = validators
+    if is_fresh(etag, last_modified):
+        # neither load nor render the page
+        return set_validators(make_response('', 304), etag, last_modified)
+    response = cached_response()
+    if response is None:
+        page = current_wiki.get_or_404(url)
+        response = cache_response(
+            render_template('page.html', page=page, backlinks=backlinks),
+            lambda: PageView(page.url, backlinks))
+    return set_validators(response, etag, last_modified)
 
 
 @bp.route('/create/', methods=['GET', 'POST'])
@@ -84,10 +189,26 @@ def edit(url):
 @bp.route('/preview/', methods=['POST'])
 @protect
 def preview():
-    data = {}
-    processor = Processor(request.form['body'])
-    data['html'], data['body'], data['meta'] = processor.process()
-    return data['html']
+    """
+    Route to render the editor's preview.
+
+    The document is rendered block by block and unchanged blocks come
+    from a cache. With format=json the response lists the digests of all
+    blocks in order and holds the html of those blocks only whose digest
+    is not among the comma separated `known` digests of the client.
+
+    Returns:
+        flask.Response: The html of the preview, or the JSON described.
+
+    """
+    blocks = render_blocks(request.form['body'])
+    if request.form.get('format') == 'json':
+        known = set(request.form.get('known', '').split(','))
+        return jsonify({
+            'blocks': [key for key, _ in blocks],
+            'html': {key: html for key, html in blocks if key not in known},
+        })
+    return join_blocks(blocks)
 
 
 @bp.route('/move/<path:url>/', methods=['GET', 'POST'])
@@ -127,18 +248,18 @@ def download(url):
             mimetype='text/markdown'
         )
     else:
-        converter = Converter(page)
-        conversion_method = getattr(converter, f'convert_to_{filetype.upper()}')
-        file_content, _ = conversion_method()
-
-        # Convert base64 to bytes
-        file_bytes = base64.b64decode(file_content)
+        # usually converted by a /convert/ job already, and found in the cache
+        artifact = conversions.convert(page, filetype)
+        if artifact.path and not os.path.exists(artifact.path):
+            # pruned by another process in the meantime, convert it again
+            artifact = conversions.convert(page, filetype)
 
+        # the cached bytes or file are sent as they are, without a copy
         return send_file(
-            BytesIO(file_bytes),
+            artifact.path or artifact.open(),
             as_attachment=True,
             download_name=f'{url}.{filetype}',
-            mimetype='application/octet-stream'
+            mimetype=MIMETYPES.get(filetype.lower(), 'application/octet-stream')
         )
 
 
@@ -148,11 +269,16 @@ def convert(url):
     """
     Route to convert a wiki page to different file formats.
 
+    The conversion runs as a background job. The response reports the
+    job's status, and is 202 Accepted while the job is not finished
+    within CONVERSION_WAIT seconds; poll the job's statusUrl until it is.
+    With "encoding": "base64" a finished file is included as fileContent.
+
     Args:
         url (str): The URL path of the wiki page.
 
     Returns:
-        flask.Response: The response containing the converted file.
+        flask.Response: JSON with the job, the file size and conversion status.
 
     """
     data = request.json
@@ -163,31 +289,18 @@ def convert(url):
 
     page = current_wiki.get_or_404(url)
 
+    if filetype.lower() == 'md':
+        file_size_info = {
+            'fileType': filetype,
+            'fileSize': get_file_size(page.content),
+            'conversionStatus': 'Success',
+        }
+        return jsonify({'result': file_size_info})
+
     try:
-        if filetype.lower() == 'md':
-            file_size_info = {
-                'fileType': filetype,
-                'fileSize': get_file_size(page.content),
-                'conversionStatus': 'Success',
-            }
-            response_data = {'result': file_size_info}
-        else:
-            converter = Converter(page)
-            conversion_method = getattr(converter, f'convert_to_{filetype.upper()}')
-            file_content, file_size = conversion_method()
-
-            response = make_response(file_content)
-            response.headers['Content-Disposition'] = f'attachment; filename={url}.{filetype}'
-            response.headers['Content-Type'] = 'application/octet-stream'
-            response.headers['Content-Length'] = str(len(file_content))
-
-            file_size_info = {
-                'fileType': filetype,
-                'fileSize': file_size,
-                'conversionStatus': 'Success',
-            }
-
-            response_data = {'result': file_size_info}
+        job = submit_job(page, filetype)
+    except QueueFull as e:
+        return jsonify({'error': str(e)}), 503
     except Exception as e:
         # If an exception occurs during conversion, set conversionStatus to 'Failed'
         file_size_info = {
@@ -196,9 +309,111 @@ def convert(url):
             'conversionStatus': 'Failed',
             'error': str(e),
         }
-        response_data = {'result': file_size_info}
+        return jsonify({'result': file_size_info})
+
+    # small pages are converted before the client would poll
+    job.wait(current_app.config.get('CONVERSION_WAIT', 0.5))
+    return job_response(job, data.get('encoding') == 'base64')
+
+
+@bp.route('/convert/jobs/<string:job_id>/')
+@protect
+def convert_job(job_id):
+    """
+    Route to poll a conversion job started by /convert/.
+
+    The job may have been started by another process of the wiki. If this
+    one does not know it, the job is submitted again here, which finds the
+    file in the conversion cache if the other process has finished it.
 
-    return jsonify(response_data)
+    Returns:
+        flask.Response: JSON like /convert/, 404 if the page has changed.
+
+    """
+    job = job_queue().get(job_id)
+    if job is None:
+        page = current_wiki.get(request.args.get('url', ''))
+        filetype = request.args.get('fileType', '')
+        if page is None or not Converter.supports(filetype):
+            abort(404)
+        if conversions.conversion_cache().key(page.content, filetype, page.title) != job_id:
+            # a job of an older version, the client has to start again
+            abort(404)
+        try:
+            job = submit_job(page, filetype)
+        except QueueFull as e:
+            return jsonify({'error': str(e)}), 503
+    return job_response(job, request.args.get('encoding') == 'base64')
+
+
+JOB_STATUS = {QUEUED: 'Queued', RUNNING: 'Running', DONE: 'Success', FAILED: 'Failed'}
+
+
+def job_response(job, with_content=False):
+    """
+    The JSON response reporting a conversion job, 202 while it is not finished.
+    """
+    file_size_info = {
+        'fileType': job.filetype,
+        'fileSize': None,
+        'conversionStatus': JOB_STATUS[job.status],
+    }
+    if job.error is not None:
+        file_size_info['error'] = job.error
+    if job.size is not None:
+        file_size_info['fileSize'] = format_file_size(job.size)
+        page = current_wiki.get(job.url) if with_content else None
+        if page is not None and conversions.conversion_cache().key(
+                page.content, job.filetype, page.title) == job.key:
+            # only for clients that want the file inline; from the cache,
+            # or converted again if the cache dropped it
+            with conversions.convert(page, job.filetype).open() as f:
+                file_size_info['fileContent'] = base64.b64encode(f.read()).decode('ascii')
+    response_data = {
+        'result': file_size_info,
+        'job': {
+            'id': job.id,
+            'status': job.status,
+            'statusUrl': url_for('wiki.convert_job', job_id=job.id, url=job.url, fileType=job.filetype),
+            'downloadUrl': url_for('wiki.download', url=job.url, fileType=job.filetype),
+        },
+    }
+    finished = job.status in (DONE, FAILED)
+    return jsonify(response_data), 200 if finished else 202
+
+
+@bp.route('/export/')
+@protect
+def export():
+    """
+    Route to download many pages in one format as a ZIP archive.
+
+    The query selects the pages: all of them, those with a ``tag`` or those
+    under a url ``prefix``; ``format`` is the file type of the entries.
+
+    Returns:
+        flask.Response: The archive, streamed while the pages are converted.
+
+    """
+    filetype = request.args.get('format', 'md').lower()
+    tag = request.args.get('tag') or None
+    prefix = request.args.get('prefix') or None
+    pages = exporter.select(current_wiki, tag, prefix)
+    if not pages:
+        abort(404)
+    pool = None
+    if filetype != 'md':
+        pool = workers.conversion_pool(threads=2)
+    try:
+        chunks = exporter.export(pages, filetype, pool, conversions.conversion_cache(),
+                                 workers.pool_size(threads=2))
+    except AttributeError as e:
+        return jsonify({'error': str(e)}), 400
+    name = '-'.join(part for part in ('export', tag, prefix and prefix.strip('/').replace('/', '-')) if part)
+    return Response(
+        stream_with_context(chunks),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{name}.zip"'})
 
 
 @bp.route('/delete/<path:url>/')
@@ -210,18 +425,63 @@ def delete(url):
     return redirect(url_for('wiki.home'))
 
 
+@bp.route('/links/')
+@protect
+def links_overview():
+    """
+    Route that reports the state of the link graph as JSON.
+
+    Returns:
+        flask.Response: The orphaned pages and all broken links.
+
+    """
+    graph = current_wiki.link_graph
+    return jsonify({
+        'orphans': graph.orphans(),
+        'broken': [{'source': source, 'target': target}
+                   for source, target in graph.broken()],
+    })
+
+
+@bp.route('/links/<path:url>/')
+@protect
+def links(url):
+    """
+    Route that reports the links of a wiki page as JSON.
+
+    Args:
+        url (str): The URL path of the wiki page.
+
+    Returns:
+        flask.Response: The outgoing, incoming and broken links of the page.
+
+    """
+    current_wiki.get_or_404(url)
+    return jsonify(current_wiki.links(url))
+
+
 @bp.route('/tags/')
 @protect
 def tags():
-    tags = current_wiki.get_tags()
-    return render_template('tags.html', tags=tags)
+    response = cached_response()
+    if response is None:
+        tags = current_wiki.tag_counts()
+        response = cache_response(
+            render_template('tags.html', tags=tags),
+            lambda: TagCounts(current_wiki.tags_by_url()))
+    return response
 
 
 @bp.route('/tag/<string:name>/')
 @protect
 def tag(name):
-    tagged = current_wiki.index_by_tag(name)
-    return render_template('tag.html', pages=tagged, tag=name)
+    response = cached_response()
+    if response is None:
+        tagged = current_wiki.index_by_tag(name)
+        response = cache_response(
+            render_template('tag.html', pages=tagged, tag=name),
+            lambda: TagListing(name, tagged))
+    return response
 
 
 @bp.route('/search/', methods=['GET', 'POST'])
@@ -229,7 +489,8 @@ def tag(name):
 def search():
     form = SearchForm()
     if form.validate_on_submit():
-        results = current_wiki.search(form.term.data, form.ignore_case.data)
+        results = current_wiki.search(form.term.data, form.ignore_case.data,
+                                      regex=form.regex.data)
         return render_template('search.html', form=form,
                                results=results, search=form.term.data)
     return render_template('search.html', form=form, search=None)
@@ -297,8 +558,7 @@ def user_create():
     Displays the registration form and processes the form submission.
     """
     form = RegisterForm()
-    user_manager = UserManager(USER_DIR)
-    registration_controller = UserRegistrationController(user_manager)
+    registration_controller = UserRegistrationController(current_users)
 
     if form.validate_on_submit() and registration_controller.form_field_validation(form):
         return redirect(url_for('wiki.user_login'))
@@ -321,14 +581,70 @@ def user_delete(user_id):
     """
     user = current_users.get_user(user_id)
     if request.method == 'POST':
-        user_manager = UserManager(USER_DIR)
-        user_manager.delete_user(user.name)
+        current_users.delete_user(user.name)
         flash('User {} has been deleted.'.format(user.name), 'success')
         return redirect(url_for('wiki.index'))
 
     return render_template('delete_user.html', user=user)
 
 
+"""
+    Monitoring
+    ~~~~~~~~~~
+"""
+
+
+@bp.route('/metrics')
+def metrics_view():
+    """
+    Route that reports the metrics in the Prometheus text format.
+
+    The scraper has to send METRICS_TOKEN as a bearer token
+    (``Authorization: Bearer <token>``); without METRICS_TOKEN the
+    route does not exist.
+
+    Returns:
+        flask.Response: The metrics.
+
+    """
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token or not current_app.config.get('METRICS', True):
+        abort(404)
+    scheme, _, given = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(given.strip().encode('utf-8'), token.encode('utf-8')):
+        abort(401)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@bp.route('/profiles/')
+@admin_required
+def profiles():
+    store = profile_store()
+    if store is None:
+        abort(404)
+    return render_template('profiles.html', profiles=store.slowest())
+
+
+@bp.route('/profiles/<string:name>/')
+@admin_required
+def profile(name):
+    store = profile_store()
+    if store is None:
+        abort(404)
+    info = store.info(name)
+    if info is None:
+        abort(404)
+    if request.args.get('download'):
+        return send_file(store.path(name), as_attachment=True,
+                         download_name=name + '.prof',
+                         mimetype='application/octet-stream')
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'ncalls'):
+        abort(400)
+    return render_template('profile.html', info=info, sort=sort,
+                           stats=store.stats(name, sort))
+
+
 """
     Error Handlers
     ~~~~~~~~~~~~~~
@@ -376,6 +692,8 @@ def upload_file():
         file_manager = FileManager(DIRECTORY)
         success = file_manager.upload_file(file)
         if success:
+            metrics.UPLOAD_BYTES.inc(amount=os.path.getsize(
+                os.path.join(DIRECTORY, file.filename)))
             flash(f"Successfully uploaded file {file.filename}")
         elif file.filename == "":
             flash("Please select a file to upload first!!!")
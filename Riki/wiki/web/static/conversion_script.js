@@ -1,56 +1,106 @@
-document.getElementById("convertBtn").addEventListener("click", function () {
-    var selectedFileType = document.getElementById("fileType").value;
+var POLL_INTERVAL = 1000;
 
-    if (selectedFileType === 'select') {
-        alert('Please select a file type.');
-        return;
+function showConversion(data) {
+    var conversionResultElement = document.getElementById("conversionResult");
+    conversionResultElement.innerHTML = 'Conversion Information:<br>';
+    conversionResultElement.innerHTML += 'File Type: ' + data.result.fileType + '<br>';
+    if (data.result.fileSize !== null && data.result.fileSize !== undefined) {
+        conversionResultElement.innerHTML += 'File Size: ' + data.result.fileSize + '<br>';
     }
 
-    var currentUrl = window.location.pathname;
-    var convertUrl = '/convert' + currentUrl;
+    if (data.result.conversionStatus !== undefined) {
+        conversionResultElement.innerHTML += 'Conversion Status: ' + data.result.conversionStatus + '<br>';
+    }
+    if (data.result.error !== undefined) {
+        conversionResultElement.innerHTML += 'Error: ' + data.result.error + '<br>';
+    }
+}
+
+function showDownload(downloadUrl) {
+    var modalFooter = document.getElementById("modalFooter");
+    if (modalFooter) {
+        // Clear existing content
+        modalFooter.innerHTML = '';
+
+        // Add the cancel button back to the modal footer
+        modalFooter.innerHTML += '<a href="#" class="btn" data-dismiss="modal" aria-hidden="true">Cancel</a>';
+
+        // Check if the download button already exists
+        var downloadBtn = document.getElementById("downloadBtn");
+        if (!downloadBtn) {
+            modalFooter.innerHTML += '<button id="downloadBtn" class="btn btn-primary">Download</button>';
+        }
+
+        document.getElementById("downloadBtn").addEventListener("click", function () {
+            window.location.href = downloadUrl;
+        });
+    } else {
+        console.error('Modal footer element not found.');
+    }
+}
+
+function handleConversion(data, conversion) {
+    showConversion(data);
+
+    var status = data.result.conversionStatus;
+    if (status === 'Queued' || status === 'Running') {
+        // the conversion runs in the background, ask again in a moment
+        setTimeout(function () {
+            fetch(data.job.statusUrl)
+                .then(response => {
+                    if (response.status === 404) {
+                        // the job expired or the page changed, start again
+                        startConversion(conversion);
+                        return;
+                    }
+                    return response.json().then(next => handleConversion(next, conversion));
+                })
+                .catch(error => {
+                    console.error('Error:', error);
+                });
+        }, POLL_INTERVAL);
+        return;
+    }
+    if (status === 'Success') {
+        showDownload(data.job ? data.job.downloadUrl : conversion.downloadUrl);
+    }
+}
 
-    fetch(convertUrl, {
+function startConversion(conversion) {
+    fetch(conversion.convertUrl, {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
         },
-        body: JSON.stringify({ fileType: selectedFileType }),
+        body: JSON.stringify({ fileType: conversion.fileType }),
     })
         .then(response => response.json())
         .then(data => {
             console.log(data);
-
-            var conversionResultElement = document.getElementById("conversionResult");
-            conversionResultElement.innerHTML = 'Conversion Information:<br>';
-            conversionResultElement.innerHTML += 'File Type: ' + data.result.fileType + '<br>';
-            conversionResultElement.innerHTML += 'File Size: ' + data.result.fileSize + '<br>';
-
-            if (data.result.conversionStatus !== undefined) {
-                conversionResultElement.innerHTML += 'Conversion Status: ' + data.result.conversionStatus + '<br>';
-            }
-
-            var modalFooter = document.getElementById("modalFooter");
-            if (modalFooter) {
-                // Clear existing content
-                modalFooter.innerHTML = '';
-
-                // Add the cancel button back to the modal footer
-                modalFooter.innerHTML += '<a href="#" class="btn" data-dismiss="modal" aria-hidden="true">Cancel</a>';
-
-                // Check if the download button already exists
-                var downloadBtn = document.getElementById("downloadBtn");
-                if (!downloadBtn) {
-                    modalFooter.innerHTML += '<button id="downloadBtn" class="btn btn-primary">Download</button>';
-                }
-
-                document.getElementById("downloadBtn").addEventListener("click", function () {
-                    window.location.href = `/download${currentUrl}?fileType=${selectedFileType}`;
-                });
-            } else {
-                console.error('Modal footer element not found.');
+            if (data.result === undefined) {
+                // e.g. too many conversions are waiting
+                document.getElementById("conversionResult").innerHTML = 'Error: ' + data.error;
+                return;
             }
+            handleConversion(data, conversion);
         })
         .catch(error => {
             console.error('Error:', error);
         });
+}
+
+document.getElementById("convertBtn").addEventListener("click", function () {
+    var selectedFileType = document.getElementById("fileType").value;
+
+    if (selectedFileType === 'select') {
+        alert('Please select a file type.');
+        return;
+    }
+
+    var currentUrl = window.location.pathname;
+    startConversion({
+        convertUrl: '/convert' + currentUrl,
+        fileType: selectedFileType,
+        downloadUrl: `/download${currentUrl}?fileType=${selectedFileType}`,
+    });
 });
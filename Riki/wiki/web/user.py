@@ -14,6 +14,8 @@ Helpers:
 - `make_salted_hash`: Generates a salted hash for a given password.
 - `check_hashed_password`: Checks if a password matches a hashed password.
 - `protect`: Decorator to protect routes based on the authentication status.
+- `is_admin`: Tells whether the current user has the admin role.
+- `admin_required`: Decorator to restrict routes to admins.
 
 Usage:
     To use these classes and helpers, import them into your Flask application and
@@ -29,63 +31,117 @@ Note:
     This is a basic implementation, and you may want to enhance it based on your application's requirements.
 """
 import os
+import copy
 import json
 import binascii
 import hashlib
+import threading
 import uuid
+from contextlib import contextmanager
 from functools import wraps
 
-from flask import current_app, flash
+try:
+    import fcntl
+except ImportError:
+    # no file locks on Windows, the lock only covers the threads
+    fcntl = None
+
+from flask import abort, current_app, flash
 from flask_login import current_user
 
 
 class UserManager(object):
-    """A very simple user Manager, that saves it's data as json."""
+    """A very simple user Manager, that saves it's data as json.
+
+    One manager is shared by all requests of an app. The parsed file is
+    kept in memory until it changes on disk (other processes or tools
+    may write it), readers get copies of it. Changes are made under a
+    lock, and a file lock against other processes, and written
+    atomically so nobody ever reads half a file.
+    """
 
     def __init__(self, path):
         self.file = os.path.join(path, 'users.json')
+        self._lock = threading.RLock()
+        self._data = None
+        self._stat = None
+
+    @staticmethod
+    def _key(stat):
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            try:
+                # users.json itself gets replaced, lock its directory
+                fd = os.open(os.path.dirname(self.file) or '.', os.O_RDONLY)
+            except OSError:
+                # writing fails as well then
+                yield
+                return
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                yield
+            finally:
+                os.close(fd)
 
     def read(self):
         try:
-            with open(self.file) as f:
-                data = json.loads(f.read())
-            return data
+            with self._lock:
+                if self._stat != self._key(os.stat(self.file)):
+                    with open(self.file) as f:
+                        # taken before reading, a concurrent write makes
+                        # the next read load the file again
+                        stat = os.fstat(f.fileno())
+                        self._data = json.loads(f.read())
+                    self._stat = self._key(stat)
+                return copy.deepcopy(self._data)
         except (IOError, json.JSONDecodeError) as e:
             print(f"Error reading file: {e}")
             return {}
 
     def write(self, data):
+        temp = '{0}.{1}.tmp'.format(self.file, os.getpid())
         try:
-            with open(self.file, 'w') as f:
-                f.write(json.dumps(data, indent=2))
+            with self._lock:
+                with open(temp, 'w') as f:
+                    f.write(json.dumps(data, indent=2))
+                os.replace(temp, self.file)
+                self._data = copy.deepcopy(data)
+                self._stat = self._key(os.stat(self.file))
         except IOError as e:
             print(f"Error writing to file: {e}")
 
     def add_user(self, name, password, email, active=True, roles=[], authentication_method=None):
-        users = self.read()
-        if users.get(name):
-            return False
-        if authentication_method is None:
-            authentication_method = get_default_authentication_method()
-        new_user_id = str(uuid.uuid4())
-        new_user = {
-            'id': new_user_id,
-            'active': active,
-            'roles': roles,
-            'authentication_method': authentication_method,
-            'authenticated': False,
-            'email': email,
-            'is_anonymous': False
-        }
-        if authentication_method == 'hash':
-            new_user['hash'] = make_salted_hash(password)
-        elif authentication_method == 'cleartext':
-            new_user['password'] = password
-        else:
-            raise NotImplementedError(authentication_method)
-        users[name] = new_user
-        print(f"Adding user: {new_user}")
-        self.write(users)
+        with self._locked():
+            users = self.read()
+            if users.get(name):
+                return False
+            if authentication_method is None:
+                authentication_method = get_default_authentication_method()
+            new_user_id = str(uuid.uuid4())
+            new_user = {
+                'id': new_user_id,
+                'active': active,
+                'roles': roles,
+                'authentication_method': authentication_method,
+                'authenticated': False,
+                'email': email,
+                'is_anonymous': False
+            }
+            if authentication_method == 'hash':
+                new_user['hash'] = make_salted_hash(password)
+            elif authentication_method == 'cleartext':
+                new_user['password'] = password
+            else:
+                raise NotImplementedError(authentication_method)
+            users[name] = new_user
+            print(f"Adding user: {new_user}")
+            self.write(users)
         userdata = users.get(name)
         return User(self, name, userdata)
 
@@ -97,16 +153,18 @@ class UserManager(object):
         return User(self, name, userdata)
 
     def delete_user(self, name):
-        users = self.read()
-        if not users.pop(name, False):
-            return False
-        self.write(users)
+        with self._locked():
+            users = self.read()
+            if not users.pop(name, False):
+                return False
+            self.write(users)
         return True
 
     def update(self, name, userdata):
-        data = self.read()
-        data[name] = userdata
-        self.write(data)
+        with self._locked():
+            data = self.read()
+            data[name] = userdata
+            self.write(data)
 
 
 
@@ -218,3 +276,18 @@ def protect(f):
         return f(*args, **kwargs)
 
     return wrapper
+
+
+def is_admin():
+    return bool(current_user.is_authenticated) and \
+        'admin' in (current_user.get('roles') or [])
+
+
+def admin_required(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not is_admin():
+            abort(403)
+        return f(*args, **kwargs)
+
+    return wrapper
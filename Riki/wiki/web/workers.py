@@ -0,0 +1,130 @@
+"""
+    Workers
+    ~~~~~~~
+
+    Converting a page to PDF or DOCX is CPU bound and holds the GIL, so
+    one slow conversion slows down every other request of the process.
+    With CONVERSION_PROCESSES set the conversions run in a pool of worker
+    processes instead, and the request only waits for the result. The
+    workers are spawned, so they import the main module again, as
+    ``__mp_main__``: scripts that create the app at import time have to
+    skip it then, like Riki.py does. Without CONVERSION_PROCESSES, the
+    callers that must not wait for a conversion get a pool of threads.
+
+    HTML is the exception: it is the page as the wiki renders it, usually
+    found in the render cache of this process, and its links are built
+    with url_for, so it is converted here.
+"""
+import multiprocessing
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from flask import current_app
+
+from wiki.core import Page
+from wiki.web.converter import Converter
+
+#: file types converted in this process rather than in the pool
+LOCAL = {'html'}
+
+_lock = threading.Lock()
+
+
+def pool_size(app=None, threads=None):
+    """
+        :returns: the number of conversions the pool of the app runs at
+            a time, see :func:`conversion_pool`
+    """
+    app = app or current_app
+    return app.config.get('CONVERSION_PROCESSES') or threads or 0
+
+
+def conversion_pool(app=None, threads=None):
+    """
+        The conversion pool of the app, created on first use.
+
+        :param int threads: the number of threads to convert in if
+            CONVERSION_PROCESSES is not set
+
+        :returns: a :class:`concurrent.futures.ProcessPoolExecutor` of
+            CONVERSION_PROCESSES processes, else a
+            :class:`concurrent.futures.ThreadPoolExecutor` of `threads`
+            threads, else `None`
+    """
+    app = app or current_app
+    processes = app.config.get('CONVERSION_PROCESSES')
+    if not processes and not threads:
+        return None
+    pool = app.extensions.get('conversion_pool')
+    if pool is None:
+        with _lock:
+            pool = app.extensions.get('conversion_pool')
+            if pool is None and processes:
+                # forked workers would inherit the locks of the threads
+                # of this process, start clean ones instead
+                pool = app.extensions['conversion_pool'] = \
+                    ProcessPoolExecutor(
+                        processes,
+                        mp_context=multiprocessing.get_context('spawn'))
+            elif pool is None:
+                pool = app.extensions['conversion_pool'] = \
+                    ThreadPoolExecutor(threads, 'conversion')
+    return pool
+
+
+def shutdown(app):
+    """Stops the conversion pool of the app, if it has one."""
+    pool = app.extensions.pop('conversion_pool', None)
+    if pool is not None:
+        pool.shutdown()
+
+
+def submit(pool, page, filetype):
+    """
+        Submits the conversion of a page to a process pool.
+
+        :returns: the future of the :class:`wiki.web.converter.Conversion`
+    """
+    if filetype.lower() in LOCAL:
+        future = Future()
+        try:
+            future.set_result(local(page, filetype))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    return pool.submit(_convert, page.path, page.url, page.title,
+                       page.content, filetype)
+
+
+def _convert(path, url, title, content, filetype):
+    # runs in a worker process, which only needs what Converter reads
+    page = Page(path, url, new=True)
+    page.content = content
+    page.title = title
+    return Converter(page).convert(filetype)
+
+
+def local(page, filetype):
+    """
+        Converts a page in this process, HTML as a standalone document.
+
+        :returns: the :class:`wiki.web.converter.Conversion`
+    """
+    return Converter(page, standalone=True).convert(filetype)
+
+
+def convert(page, filetype):
+    """
+        Converts a page with the app's pool, or right here if it has none.
+
+        :returns: the :class:`wiki.web.converter.Conversion`
+        :raises AttributeError: for an unknown file type
+    """
+    if not Converter.supports(filetype):
+        raise AttributeError('cannot convert to ' + filetype)
+    pool = conversion_pool()
+    if pool is None:
+        return local(page, filetype)
+    return submit(pool, page, filetype).result()